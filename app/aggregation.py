@@ -0,0 +1,134 @@
+from typing import List, Dict, Any, Optional, Tuple
+
+# Fields a query can group by, and the aggregates it can ask for.
+GROUP_BY_FIELDS = ["year", "decade", "genre", "director"]
+AGGREGATES = ["count", "avg_rating", "min_rating", "max_rating", "min_year", "max_year"]
+# Groups returned when the query has no limit of its own.
+AGGREGATE_DEFAULT_LIMIT = 50
+
+AGGREGATION_SCHEMA = {
+    "group_by": {"type": "STRING", "enum": GROUP_BY_FIELDS,
+                 "description": "Group matching movies by this field and return one row per group "
+                                "(e.g., 'decade' for 'how many horror movies per decade')."},
+    "aggregates": {"type": "ARRAY", "items": {"type": "STRING", "enum": AGGREGATES},
+                   "description": "Statistics to compute over the matching movies (per group when group_by is "
+                                  "set) instead of listing them. 'count' is always included."},
+    "having": {"type": "OBJECT",
+               "properties": {
+                   "count_min": {"type": "INTEGER", "description": "Keep only groups with at least this many movies."},
+                   "avg_rating_min": {"type": "NUMBER",
+                                      "description": "Keep only groups with at least this average rating."},
+               },
+               "description": "Filters applied to the groups after aggregation."},
+}
+
+# sort_by values that name a movie field map onto the matching aggregate.
+SORT_ALIASES = {"rating": "avg_rating"}
+
+"""
+True when the query JSON asks for aggregates instead of movie rows.
+"""
+def is_aggregate_query(query_json: Dict[str, Any]) -> bool:
+    return query_json.get("group_by") in GROUP_BY_FIELDS or bool(query_json.get("aggregates"))
+
+
+"""
+Normalizes the aggregation part of a query JSON, shared by the columnar and
+the fallback implementation so both return identical rows. Returns
+{"group_by", "aggregates", "count_min", "avg_rating_min", "sort_by",
+"descending", "limit"}; sort_by is None to order by the group key.
+"""
+def aggregate_plan(query_json: Dict[str, Any]) -> Dict[str, Any]:
+    group_by = query_json.get("group_by") if query_json.get("group_by") in GROUP_BY_FIELDS else None
+    requested = query_json.get("aggregates") or []
+    aggregates = ["count"] + [a for a in AGGREGATES if a != "count" and a in requested]
+
+    having = query_json.get("having") if isinstance(query_json.get("having"), dict) else {}
+    sort_by = SORT_ALIASES.get(query_json.get("sort_by"), query_json.get("sort_by"))
+    if sort_by == "year" and group_by in ("year", "decade"):
+        sort_by = None
+    elif sort_by not in AGGREGATES:
+        # Timelines read in key order; categories by their size.
+        sort_by = None if group_by in ("year", "decade") else "count"
+    descending = query_json.get("sort_order", "desc" if sort_by else "asc") == "desc"
+
+    limit = query_json.get("limit")
+    if not (isinstance(limit, int) and limit > 0):
+        limit = AGGREGATE_DEFAULT_LIMIT
+
+    return {"group_by": group_by, "aggregates": aggregates, "count_min": having.get("count_min"),
+            "avg_rating_min": having.get("avg_rating_min"), "sort_by": sort_by, "descending": descending,
+            "limit": limit}
+
+
+"""
+Builds the output row of one group: the group key, then the requested aggregates.
+"""
+def group_row(plan: Dict[str, Any], key: Any, stats: Dict[str, Any]) -> Dict[str, Any]:
+    row = {plan["group_by"]: key} if plan["group_by"] else {}
+    for name in plan["aggregates"]:
+        value = stats[name]
+        row[name] = round(value, 2) if name == "avg_rating" and value is not None else value
+    return row
+
+
+def _group_keys(movie: Dict[str, Any], group_by: Optional[str]) -> List[Any]:
+    if group_by is None:
+        return [None]
+    if group_by == "genre":
+        return sorted(set(movie.get("genres", [])))
+    if group_by == "director":
+        return [movie["director"]] if movie.get("director") else []
+    year = movie.get("year")
+    if year is None:
+        return []
+    return [year if group_by == "year" else year // 10 * 10]
+
+
+"""
+Reference implementation over the filtered list of dicts, used when the
+columnar store is unavailable. A movie with several genres counts in each.
+"""
+def aggregate_records(records: List[Dict[str, Any]], query_json: Dict[str, Any]) -> List[Dict[str, Any]]:
+    plan = aggregate_plan(query_json)
+    groups: Dict[Any, Dict[str, Any]] = {}
+    for movie in records:
+        rating = movie.get("rating") or 0.0
+        year = movie.get("year")
+        for key in _group_keys(movie, plan["group_by"]):
+            stats = groups.get(key)
+            if stats is None:
+                stats = groups[key] = {"count": 0, "rating_sum": 0.0, "min_rating": rating, "max_rating": rating,
+                                       "min_year": None, "max_year": None}
+            stats["count"] += 1
+            stats["rating_sum"] += rating
+            stats["min_rating"] = min(stats["min_rating"], rating)
+            stats["max_rating"] = max(stats["max_rating"], rating)
+            if year is not None:
+                stats["min_year"] = year if stats["min_year"] is None else min(stats["min_year"], year)
+                stats["max_year"] = year if stats["max_year"] is None else max(stats["max_year"], year)
+
+    if plan["group_by"] is None and not groups:
+        groups[None] = {"count": 0, "rating_sum": 0.0, "min_rating": None, "max_rating": None,
+                        "min_year": None, "max_year": None}
+
+    ordered: List[Tuple[Any, Dict[str, Any]]] = []
+    for key in sorted(groups) if plan["group_by"] else list(groups):
+        stats = groups[key]
+        stats["avg_rating"] = stats["rating_sum"] / stats["count"] if stats["count"] else None
+        if plan["count_min"] is not None and stats["count"] < plan["count_min"]:
+            continue
+        if plan["avg_rating_min"] is not None and (stats["avg_rating"] or 0.0) < plan["avg_rating_min"]:
+            continue
+        ordered.append((key, stats))
+
+    sort_by = plan["sort_by"]
+    if sort_by is not None:
+        # Groups without a value (no known year) go last either way.
+        missing = float("-inf") if plan["descending"] else float("inf")
+        ordered.sort(key=lambda item: missing if item[1][sort_by] is None else item[1][sort_by],
+                     reverse=plan["descending"])
+    elif plan["descending"]:
+        ordered.reverse()
+
+    return [group_row(plan, key, stats) for key, stats in ordered[:plan["limit"]]]
@@ -0,0 +1,150 @@
+import json
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+
+import server
+
+"""
+ASGI entry point. /query and /query/stream run the async pipeline directly
+on the event loop, so one process can hold hundreds of queries waiting on
+Gemini; every other route is served by the Flask app through a WSGI adapter.
+
+    uvicorn asgi:app --app-dir app --host 0.0.0.0 --port 5001
+"""
+
+# Routes served natively, with their methods; everything else goes to Flask.
+QUERY_ROUTES = {
+    "/query": ("GET", "POST", "OPTIONS"),
+    "/query/stream": ("GET", "POST", "OPTIONS"),
+    "/query/batch": ("POST", "OPTIONS"),
+}
+
+CORS_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+    (b"access-control-allow-headers", b"Content-Type"),
+]
+
+flask_app = WsgiToAsgi(server.app)
+
+
+async def send_json(send, status: int, body, headers=None):
+    payload = json.dumps(body).encode("utf-8")
+    extra = [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"),
+                            (b"content-length", str(len(payload)).encode())] + extra + CORS_HEADERS})
+    await send({"type": "http.response.body", "body": payload})
+
+
+async def read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+"""
+Async twin of server.handle_query, server.handle_query_stream and
+server.handle_query_batch, with the same parameters, status codes and events.
+"""
+async def handle_query(scope, receive, send):
+    engine = server.QUERY_ENGINE
+    streaming = scope["path"] == "/query/stream"
+    if scope["method"] == "OPTIONS":
+        await send({"type": "http.response.start", "status": 204, "headers": CORS_HEADERS})
+        await send({"type": "http.response.body", "body": b""})
+        return
+    if not engine:
+        await send_json(send, 503, {"status": "error", "message": "API service is unavailable. Database failed to load."})
+        return
+
+    try:
+        if scope["path"] == "/query/batch":
+            await handle_batch(send, engine, json.loads(await read_body(receive) or b"null"))
+            return
+
+        if scope["method"] == "POST":
+            data = json.loads(await read_body(receive) or b"null")
+            data = data if isinstance(data, dict) else {}
+            user_query = data.get("query")
+            debug_timings = server.wants_debug_timings(data.get("debug_timings"))
+        else:
+            params = parse_qs(scope.get("query_string", b"").decode())
+            user_query = params.get("query", [None])[0]
+            debug_timings = server.wants_debug_timings(params.get("debug_timings", [None])[0])
+
+        if not user_query:
+            await send_json(send, 400, {"status": "error", "message": "Missing 'query' parameter in request body."})
+            return
+
+        if streaming:
+            print(f"Received streaming query: {user_query}")
+            await stream_events(send, engine.stream_cinequery_async(user_query, debug_timings))
+            return
+
+        print(f"Received query: {user_query}")
+
+        result = await engine.run_cinequery_async(user_query, debug_timings)
+        if result["status"] == "success":
+            await send_json(send, 200, result)
+        else:
+            status, headers = server.error_status(result)
+            await send_json(send, status, result, headers)
+
+    except ValueError as e:
+        await send_json(send, 500, {"status": "error", "message": f"Configuration Error: {e}"})
+    except Exception as e:
+        print(f"Unexpected error during query processing: {e}")
+        await send_json(send, 500, {"status": "error", "message": "An unexpected server error occurred."})
+
+
+async def handle_batch(send, engine, data):
+    queries, max_concurrency, error = server.parse_batch_request(data)
+    if error:
+        await send_json(send, 400, error)
+        return
+
+    print(f"Received batch of {len(queries)} queries.")
+    results = await engine.run_batch_async(queries, max_concurrency)
+    await send_json(send, 200, server.batch_response(results))
+
+
+async def stream_events(send, events):
+    headers = [(b"content-type", b"text/event-stream")] + \
+              [(k.lower().encode(), v.encode()) for k, v in server.SSE_HEADERS.items()] + CORS_HEADERS
+    await send({"type": "http.response.start", "status": 200, "headers": headers})
+    try:
+        async for event, payload in events:
+            await send({"type": "http.response.body", "body": server.format_sse(event, payload).encode("utf-8"),
+                        "more_body": True})
+    except Exception as e:
+        print(f"Unexpected error during query processing: {e}")
+        error = {"status": "error", "message": "An unexpected server error occurred."}
+        await send({"type": "http.response.body", "body": server.format_sse("error", error).encode("utf-8"),
+                    "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if server.QUERY_ENGINE:
+                await server.QUERY_ENGINE.aclose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+    elif scope["type"] == "http" and scope["method"] in QUERY_ROUTES.get(scope["path"], ()):
+        await handle_query(scope, receive, send)
+    else:
+        await flask_app(scope, receive, send)
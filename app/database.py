@@ -0,0 +1,65 @@
+import itertools
+import threading
+import time
+from typing import List, Dict, Any, Optional
+
+try:
+    from movie_store import MovieStore
+    from snapshot import SnapshotRows
+except ImportError:  # NumPy not installed: queries scan the list of dicts.
+    MovieStore = SnapshotRows = None
+
+from fast_parser import QueryParser
+from people import InternedRows
+
+_generations = itertools.count(1)
+
+"""
+One immutable generation of the movie database: the records, the columnar
+store built over them, and the version reported with every response.
+The engine swaps whole generations atomically on reload; a request that
+started on one generation keeps using it until it finishes.
+"""
+class MovieDatabase:
+    def __init__(self, records: List[Dict[str, Any]], version: Optional[str], use_columnar_store: bool = True,
+                 source: Optional[str] = None):
+        self.records = records
+        self.source = source
+        self.generation = next(_generations)
+        # Records assigned in memory have no file to derive a version from.
+        self.version = version if version is not None else f"memory-{self.generation}"
+        self.loaded_at = time.time()
+        self._parser: Optional[QueryParser] = None
+        self._parser_lock = threading.Lock()
+
+        if not (use_columnar_store and MovieStore is not None and records):
+            self.store = None
+        elif isinstance(records, SnapshotRows):
+            self.store = MovieStore.from_snapshot(records.snapshot)
+        elif isinstance(records, InternedRows):
+            self.store = MovieStore.from_records(records.movies, records.people)
+        else:
+            self.store = MovieStore.from_records(records)
+
+    """
+    Returns the fast-path query parser over this generation's vocabulary, building it on first use.
+    """
+    def query_parser(self) -> QueryParser:
+        if self._parser is None:
+            with self._parser_lock:
+                if self._parser is None:
+                    self._parser = QueryParser.from_database(self)
+        return self._parser
+
+    """
+    Builds any lazily-built indexes now, so the first query after a swap is not slow.
+    """
+    def warm(self):
+        if self.store is not None:
+            self.store.build_indexes()
+            self.store.director_column()
+        self.query_parser()
+
+    def describe(self) -> Dict[str, Any]:
+        return {"snapshot_version": self.version, "generation": self.generation, "source": self.source,
+                "records": len(self.records), "loaded_at": self.loaded_at}
@@ -0,0 +1,331 @@
+import os
+import re
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+
+from translation_cache import normalize_query
+
+# Parses at or above this confidence are used instead of the LLM translation.
+FAST_PARSER_MIN_CONFIDENCE = float(os.environ.get("CINEQUERY_FAST_PARSER_CONFIDENCE", "0.95"))
+
+FIELD_ORDER = ["title_keywords", "actor", "director", "genre", "year_min", "year_max", "rating_min", "sort_by",
+               "sort_order", "limit"]
+
+# Words that carry no filter meaning on their own.
+FILLER_WORDS = {
+    "a", "all", "an", "and", "any", "are", "by", "can", "da", "films", "film", "find", "for", "from", "get", "give",
+    "i", "in", "is", "list", "made", "me", "movie", "movies", "of", "please", "released", "s", "see", "show",
+    "some", "that", "the", "time", "to", "want", "was", "watch", "were", "what", "which", "with", "ever",
+}
+
+# Words that invert or exclude; the grammar cannot express them, so the LLM must.
+NEGATIONS = {"not", "no", "without", "except", "excluding", "but", "never", "non"}
+
+# (phrase, sort_by, sort_order, implies a default limit)
+SORT_PHRASES = [
+    (("highest", "rated"), "rating", "desc", True), (("top", "rated"), "rating", "desc", True),
+    (("best", "rated"), "rating", "desc", True), (("lowest", "rated"), "rating", "asc", True),
+    (("worst", "rated"), "rating", "asc", True), (("most", "recent"), "year", "desc", False),
+    (("top",), "rating", "desc", True), (("best",), "rating", "desc", True),
+    (("greatest",), "rating", "desc", True), (("highest",), "rating", "desc", True),
+    (("worst",), "rating", "asc", True), (("lowest",), "rating", "asc", True),
+    (("newest",), "year", "desc", False), (("latest",), "year", "desc", False),
+    (("recent",), "year", "desc", False), (("oldest",), "year", "asc", False),
+    (("earliest",), "year", "asc", False),
+]
+DEFAULT_LIMIT = 5
+
+GENRE_ALIASES = {
+    "comedies": "comedy", "scifi": "sci fi", "science fiction": "sci fi", "animated": "animation",
+    "cartoon": "animation", "cartoons": "animation", "romantic": "romance", "documentaries": "documentary",
+    "biopic": "biography", "biopics": "biography", "noir": "film noir", "scary": "horror",
+}
+
+DIRECTOR_CUES = [("directed", "by"), ("director",), ("filmmaker",), ("by",)]
+ACTOR_CUES = [("starring",), ("featuring",), ("with",), ("actor",), ("actress",), ("stars",)]
+
+DECADE_WORDS = {"thirties": 1930, "forties": 1940, "fifties": 1950, "sixties": 1960, "seventies": 1970,
+                "eighties": 1980, "nineties": 1990}
+YEAR_RANGE = (1874, 2100)
+RATING_WORDS = {"rated", "rating", "ratings", "score", "imdb", "above", "over", "at", "least", "more", "greater",
+                "higher", "than", "of", "minimum", "min", "a", "an", "with"}
+RATING_TRAILERS = {"stars", "star", "or", "and", "higher", "above", "up", "better", "more", "plus"}
+RATING_CUES = {"rated", "rating", "ratings", "score", "imdb", "above", "over", "least", "than", "minimum"}
+LIMIT_CUES = {"top", "first", "best", "greatest", "highest"}
+LIMIT_TRAILERS = {"movies", "movie", "films", "film", "best", "top", "greatest", "highest", "most", "newest",
+                  "latest", "oldest"}
+
+_NUMBER = re.compile(r"^\d+(?:\.\d+)?$")
+_DECADE = re.compile(r"^(\d{2}|\d{4})s$")
+
+"""
+Rule- and dictionary-based translation of simple natural language queries
+("top 10 horror movies from the 80s", "movies directed by Kubrick after
+1970", "Tom Hanks movies rated above 8") into QUERY_SCHEMA JSON.
+
+Genres and people are recognised from the loaded dataset's vocabulary.
+parse() reports a confidence: the share of meaningful words the grammar
+explained, halved when the query asks for something the schema cannot
+hold (two genres, two actors, two year bounds, an empty year range) or
+names a person in a role the dataset does not know them in. Anything it does not understand lowers the
+confidence, so such queries go to the LLM instead.
+"""
+class QueryParser:
+    def __init__(self, genres: Iterable[str], directors: Iterable[str], actors: Iterable[str]):
+        self.genres: Dict[Tuple[str, ...], str] = {}
+        for genre in genres:
+            key = tuple(normalize_query(genre).split())
+            if key:
+                self.genres.setdefault(key, genre)
+
+        # Full names and surnames (as token tuples) -> name and roles.
+        self.people: Dict[Tuple[str, ...], Tuple[str, set]] = {}
+        self.surnames: Dict[Tuple[str, ...], Tuple[str, set]] = {}
+        for role, names in (("director", directors), ("actor", actors)):
+            for name in names:
+                key = tuple(normalize_query(name).split())
+                if not key:
+                    continue
+                self.people.setdefault(key, (name.lower(), set()))[1].add(role)
+                parts = name.split()
+                if len(key) > 1 and parts:
+                    surname_key = tuple(normalize_query(parts[-1]).split())
+                    if surname_key:
+                        self.surnames.setdefault(surname_key, (parts[-1].lower(), set()))[1].add(role)
+
+    """
+    Builds a parser from a loaded MovieDatabase. Uses the columnar store's
+    genre vocabulary and name indexes when available.
+    """
+    @classmethod
+    def from_database(cls, database) -> "QueryParser":
+        store = database.store
+        if store is not None:
+            return cls(store.genre_bits, store.name_index("director").names, store.name_index("actor").names)
+
+        genres, directors, actors = {}, {}, {}
+        for m in database.records:
+            genres.update(dict.fromkeys(m.get("genres", [])))
+            if m.get("director"):
+                directors[m["director"]] = None
+            actors.update(dict.fromkeys(m.get("actors", [])))
+        return cls(genres, directors, actors)
+
+    """
+    Returns {"query_json": ..., "confidence": 0..1, "unparsed": [words]}.
+    """
+    def parse(self, user_query: str) -> Dict[str, Any]:
+        tokens = normalize_query(user_query).split()
+        state = _ParseState(tokens)
+
+        if any(t in NEGATIONS for t in tokens):
+            return {"query_json": {}, "confidence": 0.0, "unparsed": tokens}
+
+        self._match_people(state)
+        self._match_sort(state)
+        self._match_numbers(state)
+        self._match_genres(state)
+        if state.fields.get("year_min", YEAR_RANGE[0]) > state.fields.get("year_max", YEAR_RANGE[1]):
+            # "before 1990 and after 2000" cannot match anything as a single range.
+            state.conflicts = True
+
+        query_json = state.fields
+        if state.implies_limit and "limit" not in query_json:
+            query_json["limit"] = DEFAULT_LIMIT
+
+        content = [i for i, token in enumerate(tokens) if state.explained[i] or token not in FILLER_WORDS]
+        unparsed = [tokens[i] for i in content if not state.explained[i]]
+
+        if not query_json or not content:
+            confidence = 0.0
+        else:
+            confidence = (len(content) - len(unparsed)) / len(content)
+            if state.conflicts:
+                confidence /= 2
+        return {"query_json": {k: query_json[k] for k in FIELD_ORDER if k in query_json},
+                "confidence": round(confidence, 3), "unparsed": unparsed}
+
+    def _match_people(self, state: "_ParseState"):
+        tokens = state.tokens
+        for role, cues in (("director", DIRECTOR_CUES), ("actor", ACTOR_CUES)):
+            for i in range(len(tokens)):
+                for cue in cues:
+                    if tuple(tokens[i:i + len(cue)]) != cue or state.taken(i, len(cue)):
+                        continue
+                    start = i + len(cue)
+                    match = (self._longest(state, start, self.people, 4) or
+                             self._longest(state, start, self.surnames, 2))
+                    if match:
+                        length, (name, roles) = match
+                        if role in roles:
+                            state.set(role, name, range(i, start + length))
+                        else:
+                            # "movies by Will Smith" names an actor after a director cue; leave it to the LLM.
+                            state.conflicts = True
+                    break
+
+        # Full names without a cue; surnames only right before "movies"/"films".
+        for i in range(len(tokens)):
+            match = self._longest(state, i, self.people, 4, min_length=2)
+            if not match:
+                match = self._longest(state, i, self.surnames, 2)
+                if match:
+                    following = [t for t in tokens[i + match[0]:i + match[0] + 2] if t != "s"][:1]
+                    if following not in (["movies"], ["films"]) or len(match[1][1]) > 1 or \
+                            self._genre(" ".join(tokens[i:i + match[0]])):
+                        continue
+            if match:
+                length, (name, roles) = match
+                state.set("actor" if "actor" in roles else "director", name, range(i, i + length))
+
+    @staticmethod
+    def _longest(state: "_ParseState", start: int, table: Dict[Tuple[str, ...], Any], max_length: int,
+                 min_length: int = 1) -> Optional[Tuple[int, Any]]:
+        for length in range(max_length, min_length - 1, -1):
+            key = tuple(state.tokens[start:start + length])
+            if len(key) == length and not state.taken(start, length) and key in table:
+                return length, table[key]
+        return None
+
+    def _match_sort(self, state: "_ParseState"):
+        tokens = state.tokens
+        for i in range(len(tokens)):
+            for phrase, sort_by, sort_order, implies_limit in SORT_PHRASES:
+                if tuple(tokens[i:i + len(phrase)]) == phrase and not state.taken(i, len(phrase)):
+                    state.set("sort_by", sort_by, range(i, i + len(phrase)))
+                    state.set("sort_order", sort_order, ())
+                    state.implies_limit = state.implies_limit or implies_limit
+                    break
+
+    def _match_numbers(self, state: "_ParseState"):
+        tokens = state.tokens
+        for i, token in enumerate(tokens):
+            if state.explained[i]:
+                continue
+            previous = tokens[i - 1] if i else ""
+
+            decade = _DECADE.match(token)
+            if decade or token in DECADE_WORDS:
+                start = DECADE_WORDS.get(token) or self._decade_start(decade.group(1))
+                if start is not None:
+                    self._set_years(state, i, start, start + 9)
+                continue
+
+            if not _NUMBER.match(token):
+                continue
+            value = float(token)
+            next_token = tokens[i + 1] if i + 1 < len(tokens) else ""
+
+            if "." not in token and YEAR_RANGE[0] <= value <= YEAR_RANGE[1]:
+                end = i
+                if next_token in ("to", "and", "through", "until") and i + 2 < len(tokens) and \
+                        self._is_year(tokens[i + 2]):
+                    end = i + 2
+                elif self._is_year(next_token):
+                    end = i + 1
+                if end > i:
+                    state.explained[i + 1] = True
+                    state.explained[end] = True
+                    state.set_year("year_min", int(value), [i])
+                    state.set_year("year_max", int(tokens[end]), ())
+                    if previous in ("between", "from"):
+                        state.explained[i - 1] = True
+                else:
+                    self._set_years(state, i, int(value), int(value))
+            elif "." not in token and (previous in LIMIT_CUES or next_token in LIMIT_TRAILERS) and value > 0:
+                state.set("limit", int(value), [i])
+            elif value <= 10 and (RATING_CUES & set(tokens[max(i - 3, 0):i]) or next_token in ("stars", "star")):
+                span = [i]
+                j = i - 1
+                while j >= 0 and tokens[j] in RATING_WORDS and not state.taken(j, 1):
+                    span.append(j)
+                    j -= 1
+                j = i + 1
+                while j < len(tokens) and tokens[j] in RATING_TRAILERS:
+                    span.append(j)
+                    j += 1
+                state.set("rating_min", value if "." in token else int(value), span)
+
+    @staticmethod
+    def _decade_start(digits: str) -> Optional[int]:
+        if len(digits) == 4:
+            return int(digits) if digits.endswith("0") else None
+        if digits in ("00", "10"):
+            return 2000 + int(digits)
+        # "20s" could be the 1920s or the 2020s; leave it to the LLM.
+        return 1900 + int(digits) if digits.endswith("0") and digits >= "30" else None
+
+    @staticmethod
+    def _is_year(token: str) -> bool:
+        return token.isdigit() and YEAR_RANGE[0] <= int(token) <= YEAR_RANGE[1]
+
+    @staticmethod
+    def _set_years(state: "_ParseState", i: int, first: int, last: int):
+        tokens = state.tokens
+        previous = tokens[i - 1] if i else ""
+        before_previous = tokens[i - 2] if i > 1 else ""
+        if previous in ("after", "post"):
+            state.set_year("year_min", last + 1, [i - 1, i])
+        elif previous == "since":
+            state.set_year("year_min", first, [i - 1, i])
+        elif previous in ("before", "pre") or (previous == "to" and before_previous == "prior"):
+            state.set_year("year_max", first - 1, [i - 1, i] + ([i - 2] if previous == "to" else []))
+        elif previous in ("until", "through"):
+            state.set_year("year_max", last, [i - 1, i])
+        else:
+            state.set_year("year_min", first, [i])
+            state.set_year("year_max", last, ())
+
+    def _match_genres(self, state: "_ParseState"):
+        tokens = state.tokens
+        for i in range(len(tokens)):
+            for length in (2, 1):
+                phrase = " ".join(tokens[i:i + length])
+                if len(phrase.split()) != length or state.taken(i, length):
+                    continue
+                genre = self._genre(phrase)
+                if genre:
+                    state.set("genre", genre, range(i, i + length))
+                    break
+
+    def _genre(self, phrase: str) -> Optional[str]:
+        candidates = [phrase, GENRE_ALIASES.get(phrase, "")]
+        if phrase.endswith("ies"):
+            candidates.append(phrase[:-3] + "y")
+        if phrase.endswith("s"):
+            candidates.append(phrase[:-1])
+        for candidate in candidates:
+            genre = self.genres.get(tuple(candidate.split()))
+            if genre:
+                return genre
+        return None
+
+
+"""
+Per-parse bookkeeping: which tokens are explained and the fields found so far.
+"""
+class _ParseState:
+    def __init__(self, tokens: List[str]):
+        self.tokens = tokens
+        self.explained = [False] * len(tokens)
+        self.fields: Dict[str, Any] = {}
+        self.implies_limit = False
+        self.conflicts = False
+
+    def taken(self, start: int, length: int) -> bool:
+        return any(self.explained[start:start + length])
+
+    def set(self, field: str, value: Any, span: Iterable[int]):
+        if field in self.fields and self.fields[field] != value:
+            self.conflicts = True
+        self.fields.setdefault(field, value)
+        for i in span:
+            self.explained[i] = True
+
+    """
+    Sets year_min or year_max. A bound given twice ("after 1990 ... after
+    2000", a decade and a year) is a conflict even if the values agree.
+    """
+    def set_year(self, field: str, value: int, span: Iterable[int]):
+        if field in self.fields:
+            self.conflicts = True
+        self.set(field, value, span)
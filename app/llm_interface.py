@@ -1,13 +1,53 @@
+import asyncio
+import gc
+import hashlib
+import heapq
 import json
 import os
 import requests
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Optional
 
+import metrics
+from aggregation import AGGREGATION_SCHEMA, AGGREGATES, AGGREGATE_DEFAULT_LIMIT, aggregate_records, is_aggregate_query
+from database import MovieDatabase
+from fast_parser import FAST_PARSER_MIN_CONFIDENCE
+from people import InternedRows, is_people_db
+from prompt_payload import build_prompt_payload, SEPARATOR
+from rate_limit import GeminiGuard, estimate_tokens
+from result_cache import (ResultCache, ResultCursor, RESULT_PAGE_DEFAULT_ROWS, RESULT_PAGE_MAX_ROWS, decode_cursor,
+                          encode_cursor)
+from single_flight import SingleFlight, AsyncSingleFlight
+from translation_cache import TranslationCache, normalize_query
+
+try:
+    from movie_store import MovieStore
+    from snapshot import MovieSnapshot, SnapshotRows, SNAPSHOT_EXTENSION
+except ImportError:  # NumPy not installed: fall back to scanning the list of dicts.
+    MovieStore = None
+    MovieSnapshot = SnapshotRows = SNAPSHOT_EXTENSION = None
+
+try:
+    import httpx
+except ImportError:  # Only needed by the async pipeline.
+    httpx = None
+
 # Configuration
 API_KEY = os.environ.get("GEMINI_API_KEY", "")
 MODEL_NAME = "gemini-2.5-flash-preview-09-2025" # "gemini-2.0-flash-lite"
-API_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/models"
+# Overridable to point the engine at a stand-in server (see benchmarks/fake_gemini.py).
+API_BASE_URL = os.environ.get("GEMINI_API_BASE_URL", "https://generativelanguage.googleapis.com/v1beta/models")
+GEMINI_TIMEOUT = 15
+# Connection pool for the async client: concurrent in-flight requests and idle keep-alive connections.
+GEMINI_MAX_CONNECTIONS = int(os.environ.get("GEMINI_MAX_CONNECTIONS", "200"))
+GEMINI_MAX_KEEPALIVE = int(os.environ.get("GEMINI_MAX_KEEPALIVE", "50"))
+# Output tokens reserved against the tokens-per-minute limit before a call.
+TRANSLATION_OUTPUT_TOKENS = 256
+SYNTHESIS_OUTPUT_TOKENS = 1024
+# Most queries of one batch that run at the same time.
+BATCH_CONCURRENCY = int(os.environ.get("CINEQUERY_BATCH_CONCURRENCY", "8"))
 
 # JSON Schema Definition
 QUERY_SCHEMA = {
@@ -20,15 +60,17 @@ QUERY_SCHEMA = {
         "year_min": {"type": "INTEGER", "description": "Minimum release year (inclusive)."},
         "year_max": {"type": "INTEGER", "description": "Maximum release year (inclusive)."},
         "rating_min": {"type": "NUMBER", "description": "Minimum average rating (e.g., 7.5)."},
-        "sort_by": {"type": "STRING", "enum": ["rating", "year"],
-                    "description": "Field to sort results by (e.g., 'rating', 'year')."},
+        "sort_by": {"type": "STRING", "enum": ["rating", "year"] + AGGREGATES,
+                    "description": "Field to sort results by (e.g., 'rating', 'year'; an aggregate such as "
+                                   "'count' or 'avg_rating' for grouped results)."},
         "sort_order": {"type": "STRING", "enum": ["asc", "desc"],
                        "description": "Sorting direction ('asc' or 'desc')."},
-        "limit": {"type": "INTEGER", "description": "Maximum number of results to return (default 5)."}
+        "limit": {"type": "INTEGER", "description": "Maximum number of results (or groups) to return (default 5)."},
+        **AGGREGATION_SCHEMA,
     },
     "propertyOrdering": ["title_keywords", "actor", "director", "genre", "year_min", "year_max", "rating_min",
                          "sort_by",
-                         "sort_order", "limit"]
+                         "sort_order", "limit", "group_by", "aggregates", "having"]
 }
 
 """
@@ -39,8 +81,15 @@ class CineQueryEngine:
     """
     Load the in-memory database.
     """
-    def __init__(self, db_filepath: str = "data/processed/movies_db.json"):
-        self.movie_dataset: List[Dict[str, Any]] = self._initialize_database(db_filepath)
+    def __init__(self, db_filepath: str = "data/processed/movies_db.json", use_columnar_store: bool = True):
+        self.use_columnar_store = use_columnar_store and MovieStore is not None
+        self.db_filepath = db_filepath
+        self._reload_lock = threading.Lock()
+        self._stop_watching = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self.last_reload: Dict[str, Any] = {}
+
+        self._database: MovieDatabase = self._load_database(db_filepath)
         if not self.movie_dataset:
             print("Warning: Database is empty or not found. Please check the database filepath.")
 
@@ -50,35 +99,216 @@ class CineQueryEngine:
 
         self.model_name = MODEL_NAME
         self.api_base_url = API_BASE_URL
+        # Keep-alive connection pools for the blocking and async Gemini clients.
+        self._http = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=GEMINI_MAX_KEEPALIVE)
+        self._http.mount("https://", adapter)
+        self._http.mount("http://", adapter)
+        self._async_http = None
+        self._async_http_loop = None
+        # Rate limits, circuit breaker and retry budget shared by every Gemini call of this engine.
+        self.gemini_guard = GeminiGuard()
+        self.translation_cache = TranslationCache(namespace=self.model_name)
+        # Ordered results of recent queries, paged through with /query/page instead of a new query.
+        self.result_cache = ResultCache()
+        # Fast-path parses at or above this confidence skip the LLM translation; above 1 disables it.
+        self.fast_parser_confidence = FAST_PARSER_MIN_CONFIDENCE
+        # Identical queries in flight at the same time share one pipeline run.
+        self._in_flight = SingleFlight()
+        self._in_flight_async = AsyncSingleFlight()
+        self.batch_concurrency = BATCH_CONCURRENCY
+
+    """
+    The database generation currently serving queries. A request reads this
+    reference once and keeps using it, so a reload never changes the data
+    underneath an in-flight query.
+    """
+    @property
+    def database(self) -> MovieDatabase:
+        return self._database
+
+    @property
+    def snapshot_version(self) -> Optional[str]:
+        return self._database.version
+
+    """
+    The list of movie records. Assigning it swaps in a new database generation,
+    rebuilding the columnar store used by execute_query_json (when enabled).
+    """
+    @property
+    def movie_dataset(self) -> List[Dict[str, Any]]:
+        return self._database.records
+
+    @movie_dataset.setter
+    def movie_dataset(self, records: List[Dict[str, Any]]):
+        self._database = MovieDatabase(records, None, self.use_columnar_store)
+
+    @property
+    def reloading(self) -> bool:
+        return self._reload_lock.locked()
+
+    def _load_database(self, filepath: str) -> MovieDatabase:
+        records, version = self._initialize_database(filepath)
+        return MovieDatabase(records, version, self.use_columnar_store, source=filepath)
 
     """
-    Loads the pre-processed JSON file into memory.
+    Loads the processed database and returns (records, version). A binary
+    snapshot (movies_db.cqdb next to the JSON file, or an explicit .cqdb path)
+    is memory-mapped when available and versioned by its snapshot id;
+    otherwise the pre-processed JSON file is loaded into memory and versioned
+    by a hash of its contents. The JSON file may be a plain list of records or
+    the people format (see people.py); rows look the same either way.
     """
-    def _initialize_database(self, filepath: str) -> List[Dict[str, Any]]:
+    def _initialize_database(self, filepath: str):
+        if MovieSnapshot is not None:
+            base_path, extension = os.path.splitext(filepath)
+            snapshot_path = filepath if extension == SNAPSHOT_EXTENSION else base_path + SNAPSHOT_EXTENSION
+            if os.path.exists(snapshot_path):
+                try:
+                    snapshot = MovieSnapshot(snapshot_path)
+                    print(f"Database snapshot mapped from {snapshot_path}: {snapshot.row_count} records.")
+                    return SnapshotRows(snapshot), snapshot.snapshot_id
+                except (OSError, ValueError) as e:
+                    print(f"Warning: Could not open snapshot {snapshot_path} ({e}). Falling back to JSON.")
+            if extension == SNAPSHOT_EXTENSION:
+                filepath = base_path + ".json"
+
         print(f"Loading in-memory database from {filepath}...")
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            with open(filepath, 'rb') as f:
+                raw = f.read()
+            data = json.loads(raw)
+            if is_people_db(data):
+                data = InternedRows.from_json(data)
             print(f"Database loaded successfully: {len(data)} records.")
-            return data
+            return data, hashlib.sha1(raw).hexdigest()[:16]
         except FileNotFoundError:
             print(f"Error: Database file not found at {filepath}.")
-            return []
-        except json.JSONDecodeError:
+            return [], None
+        except (json.JSONDecodeError, UnicodeDecodeError):
             print(f"Error: Failed to decode JSON from {filepath}.")
-            return []
+            return [], None
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            print(f"Error: Malformed people database in {filepath} ({e}).")
+            return [], None
 
     """
-    Generic function to call the Gemini API with exponential backoff.
-    Includes Google Search grounding only for the synthesis step (is_translation=False)
-    to improve stability of the structured output translation step.
+    Loads the database at filepath (default: the current one) and its indexes,
+    then atomically swaps it in. Queries keep being served from the old
+    generation while the new one loads, and requests already running finish
+    against it. A failed or empty load leaves the current generation in place.
+    With background=True the load runs on a separate thread and the call
+    returns immediately.
     """
-    def _call_gemini_api(self, prompt: str, system_instruction: str, is_translation: bool = False) -> Optional[
-        Dict[str, Any]]:
-        if not self.api_key:
-            return {"status": "error", "message": "Gemini API key not found. Please check the API_KEY environment variable."}
+    def reload(self, filepath: Optional[str] = None, background: bool = False) -> Dict[str, Any]:
+        if not self._reload_lock.acquire(blocking=False):
+            return {"status": "error", "message": "A reload is already in progress.",
+                    "snapshot_version": self.snapshot_version}
 
-        url = f"{self.api_base_url}/{self.model_name}:generateContent?key={self.api_key}"
+        filepath = filepath or self.db_filepath
+        if background:
+            threading.Thread(target=self._reload_locked, args=(filepath,), daemon=True).start()
+            return {"status": "accepted", "message": f"Reloading the database from {filepath}.",
+                    "snapshot_version": self.snapshot_version}
+        return self._reload_locked(filepath)
+
+    def _reload_locked(self, filepath: str) -> Dict[str, Any]:
+        try:
+            started = time.perf_counter()
+            current = self._database
+            database = self._load_database(filepath)
+
+            if not database.records:
+                result = {"status": "error", "snapshot_version": current.version,
+                          "message": f"Reload from {filepath} found no records; keeping the current database."}
+            elif database.version is not None and database.version == current.version:
+                result = {"status": "success", "message": "Database is already up to date.",
+                          "snapshot_version": current.version}
+            else:
+                database.warm()
+                self._database = database
+                self.db_filepath = filepath
+                # Cursors of the previous version can no longer be read.
+                self.result_cache.clear()
+                result = {"status": "success", "message": "Database reloaded.",
+                          "previous_version": current.version, **database.describe()}
+            result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        except Exception as e:
+            result = {"status": "error", "message": "An unexpected error occurred during reload.",
+                      "details": str(e), "snapshot_version": self.snapshot_version}
+        finally:
+            self._reload_lock.release()
+
+        print(f"Reload: {result['message']} (version {result.get('snapshot_version')})")
+        self.last_reload = result
+        return result
+
+    def _source_signature(self):
+        base_path, _ = os.path.splitext(self.db_filepath)
+        signature = []
+        for path in (self.db_filepath, base_path + ".json", base_path + ".cqdb"):
+            try:
+                stat = os.stat(path)
+                signature.append((path, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append((path, None, None))
+        return tuple(signature)
+
+    """
+    Polls the database files every `interval` seconds and reloads when they
+    change. A change is only acted on once it has been stable for a full
+    interval, so a processor run that rewrites the JSON and then the snapshot
+    triggers a single reload.
+    """
+    def start_watching(self, interval: float = 5.0):
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._stop_watching.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), daemon=True)
+        self._watcher.start()
+        print(f"Watching {self.db_filepath} for changes every {interval}s.")
+
+    def stop_watching(self):
+        self._stop_watching.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+    def _watch(self, interval: float):
+        loaded = previous = self._source_signature()
+        while not self._stop_watching.wait(interval):
+            current = self._source_signature()
+            if current != loaded and current == previous and not self.reloading:
+                self.reload()
+                loaded = current
+            previous = current
+
+    """
+    Prepares the engine to be shared with forked worker processes (gunicorn
+    preload mode): builds every lazily-built index and parser now, so workers
+    never build private copies, then moves all objects into the garbage
+    collector's permanent generation. Collections in the workers then skip
+    the shared objects and do not write to (and un-share) their pages.
+    Call it last in the parent, right before forking; do not start the
+    watcher until after the fork.
+    """
+    def freeze(self):
+        self.database.warm()
+        gc.collect()
+        gc.freeze()
+        print(f"Engine frozen for forking: {gc.get_freeze_count()} objects in the permanent generation.")
+
+    """
+    Builds the generateContent (or streamGenerateContent) URL and payload.
+    Includes Google Search grounding only for the synthesis step
+    (is_translation=False) to improve stability of the structured output
+    translation step.
+    """
+    def _gemini_request(self, prompt: str, system_instruction: str, is_translation: bool, stream: bool = False):
+        if stream:
+            url = f"{self.api_base_url}/{self.model_name}:streamGenerateContent?alt=sse&key={self.api_key}"
+        else:
+            url = f"{self.api_base_url}/{self.model_name}:generateContent?key={self.api_key}"
 
         generation_config = {"temperature": 0.1}
         payload = {
@@ -94,54 +324,425 @@ class CineQueryEngine:
             generation_config["responseMimeType"] = "application/json"
             generation_config["responseSchema"] = QUERY_SCHEMA
 
-        max_retries = 5
-        base_delay = 1.0
+        return url, payload
 
-        for attempt in range(max_retries):
-            try:
-                if attempt > 0:
-                    delay = base_delay * (2 ** attempt)
-                    print(f"Retrying API request in {delay}s...")
-                    time.sleep(delay)
-
-                headers = {'Content-Type': 'application/json'}
-                response = requests.post(url, headers=headers, data=json.dumps(payload), timeout=15)
-                response.raise_for_status()
-
-                result = response.json()
-                if result.get("candidates") and result["candidates"][0].get("content"):
-                    return result["candidates"][0]["content"]["parts"][0]
-                return None
-
-            except requests.exceptions.HTTPError as e:
-                if response.status_code == 429:
-                    print(f"API rate limit exceeded. Waiting for {response.headers.get('Retry-After')} seconds...")
-                    # time.sleep(int(response.headers.get('Retry-After')))
-                    continue
-
-
-            except requests.exceptions.RequestException as e:
-                if attempt < max_retries - 1:
-                    wait_time = 2 ** attempt
-                    # print(f"API request failed ({e}). Retrying in {wait_time}s...")
-                    time.sleep(wait_time)
-                else:
-                    print(f"Final API request failed after {max_retries} attempts: {e}")
+    """
+    Generic function to call the Gemini API. Calls share the engine's rate
+    limiter and circuit breaker; failures are retried with jittered backoff
+    until the call's deadline or retry budget runs out. Requests go through
+    a pooled keep-alive session.
+    """
+    def _call_gemini_api(self, prompt: str, system_instruction: str, is_translation: bool = False) -> Optional[
+        Dict[str, Any]]:
+        if not self.api_key:
+            return {"status": "error", "message": "Gemini API key not found. Please check the API_KEY environment variable."}
+
+        url, payload = self._gemini_request(prompt, system_instruction, is_translation)
+        budget = self.gemini_guard.begin(self._estimated_tokens(prompt, system_instruction, is_translation))
+
+        try:
+            while True:
+                wait, shed = budget.admit()
+                if shed:
+                    print(f"API request not sent: {shed['message']}")
+                    return shed
+                if wait:
+                    time.sleep(wait)
+
+                try:
+                    headers = {'Content-Type': 'application/json'}
+                    response = self._http.post(url, headers=headers, data=json.dumps(payload),
+                                               timeout=budget.timeout(GEMINI_TIMEOUT))
+                    if response.status_code == 429 or response.status_code >= 500:
+                        print(f"API request failed with status {response.status_code} "
+                              f"(Retry-After: {response.headers.get('Retry-After')}).")
+                        delay = budget.failed(response.status_code, response.headers.get("Retry-After"))
+                    else:
+                        # Any other client error will not succeed on retry.
+                        response.raise_for_status()
+                        result = response.json()
+                        budget.succeeded(result.get("usageMetadata", {}).get("totalTokenCount"))
+                        if result.get("candidates") and result["candidates"][0].get("content"):
+                            return result["candidates"][0]["content"]["parts"][0]
+                        return None
+
+                except requests.exceptions.HTTPError as e:
+                    budget.succeeded()
+                    print(f"API request failed ({e}).")
+                    return None
+                except json.JSONDecodeError as e:
+                    print(f"Error decoding JSON from API response: {e}")
+                    return None
+                except requests.exceptions.RequestException as e:
+                    print(f"API request failed ({e}).")
+                    delay = budget.failed()
+
+                except Exception as e:
+                    print(f"An unexpected error occurred: {e}")
+                    return {"status": "error", "message": "An unexpected error occurred during API call.", "details": str(e)}
+
+                if delay is None:
+                    print(f"Final API request failed after {budget.attempt} attempts.")
                     return None
-            except json.JSONDecodeError as e:
-                print(f"Error decoding JSON from API response: {e}")
-                return None
+                print(f"Retrying API request in {delay:.1f}s...")
+                time.sleep(delay)
+        finally:
+            budget.release()
 
-            except Exception as e:
-                print(f"An unexpected error occurred: {e}")
-                return {"status": "error", "message": "An unexpected error occurred during API call.", "details": str(e)}
-        return None
+    def _estimated_tokens(self, prompt: str, system_instruction: str, is_translation: bool) -> int:
+        return estimate_tokens(prompt, system_instruction,
+                               TRANSLATION_OUTPUT_TOKENS if is_translation else SYNTHESIS_OUTPUT_TOKENS)
+
+    """
+    Returns the pooled async HTTP client for the running event loop. httpx
+    clients are bound to the loop they were first used on, so a new loop
+    (e.g. a fresh asyncio.run) gets its own client.
+    """
+    def _async_client(self) -> "httpx.AsyncClient":
+        loop = asyncio.get_running_loop()
+        if self._async_http is None or self._async_http_loop is not loop:
+            self._async_http = httpx.AsyncClient(
+                timeout=GEMINI_TIMEOUT,
+                limits=httpx.Limits(max_connections=GEMINI_MAX_CONNECTIONS,
+                                    max_keepalive_connections=GEMINI_MAX_KEEPALIVE))
+            self._async_http_loop = loop
+        return self._async_http
+
+    """
+    Closes the async HTTP client; call on server shutdown.
+    """
+    async def aclose(self):
+        if self._async_http is not None:
+            await self._async_http.aclose()
+            self._async_http = self._async_http_loop = None
+
+    """
+    Async variant of _call_gemini_api: same payload, limits and retry policy,
+    but waiting (for the limiter, on the network or between retries) yields
+    to the event loop instead of blocking a thread.
+    """
+    async def _call_gemini_api_async(self, prompt: str, system_instruction: str, is_translation: bool = False) -> \
+            Optional[Dict[str, Any]]:
+        if not self.api_key:
+            return {"status": "error", "message": "Gemini API key not found. Please check the API_KEY environment variable."}
+        if httpx is None:
+            return {"status": "error", "message": "The async Gemini client requires the httpx package."}
+
+        url, payload = self._gemini_request(prompt, system_instruction, is_translation)
+        client = self._async_client()
+        budget = self.gemini_guard.begin(self._estimated_tokens(prompt, system_instruction, is_translation))
+
+        try:
+            while True:
+                wait, shed = budget.admit()
+                if shed:
+                    print(f"API request not sent: {shed['message']}")
+                    return shed
+                if wait:
+                    await asyncio.sleep(wait)
+
+                try:
+                    response = await client.post(url, json=payload, timeout=budget.timeout(GEMINI_TIMEOUT))
+                    if response.status_code == 429 or response.status_code >= 500:
+                        print(f"API request failed with status {response.status_code} "
+                              f"(Retry-After: {response.headers.get('Retry-After')}).")
+                        delay = budget.failed(response.status_code, response.headers.get("Retry-After"))
+                    else:
+                        response.raise_for_status()
+                        result = response.json()
+                        budget.succeeded(result.get("usageMetadata", {}).get("totalTokenCount"))
+                        if result.get("candidates") and result["candidates"][0].get("content"):
+                            return result["candidates"][0]["content"]["parts"][0]
+                        return None
+
+                except httpx.HTTPStatusError as e:
+                    budget.succeeded()
+                    print(f"API request failed ({e}).")
+                    return None
+                except httpx.RequestError as e:
+                    print(f"API request failed ({e}).")
+                    delay = budget.failed()
+                except json.JSONDecodeError as e:
+                    print(f"Error decoding JSON from API response: {e}")
+                    return None
+
+                except Exception as e:
+                    print(f"An unexpected error occurred: {e}")
+                    return {"status": "error", "message": "An unexpected error occurred during API call.", "details": str(e)}
+
+                if delay is None:
+                    print(f"Final API request failed after {budget.attempt} attempts.")
+                    return None
+                print(f"Retrying API request in {delay:.1f}s...")
+                await asyncio.sleep(delay)
+        finally:
+            budget.release()
+
+    """
+    Extracts the text of one `data:` line from a streamGenerateContent SSE stream.
+    """
+    @staticmethod
+    def _stream_chunk_text(line: str) -> Optional[str]:
+        if not line.startswith("data:"):
+            return None
+        try:
+            event = json.loads(line[len("data:"):])
+        except json.JSONDecodeError:
+            return None
+        candidates = event.get("candidates") or [{}]
+        parts = candidates[0].get("content", {}).get("parts", [])
+        return "".join(part.get("text", "") for part in parts) or None
+
+    """
+    Streams a synthesis answer from the model's streaming endpoint, yielding
+    text chunks as they arrive. Requests go through the same limiter and
+    circuit breaker as _call_gemini_api; failures are retried only until the
+    first chunk. Any failure is yielded as an error dict and ends the stream.
+    """
+    def _stream_gemini_api(self, prompt: str, system_instruction: str):
+        if not self.api_key:
+            yield {"status": "error", "message": "Gemini API key not found. Please check the API_KEY environment variable."}
+            return
+
+        url, payload = self._gemini_request(prompt, system_instruction, False, stream=True)
+        budget = self.gemini_guard.begin(self._estimated_tokens(prompt, system_instruction, False))
+        emitted = False
+
+        try:
+            while True:
+                wait, shed = budget.admit()
+                if shed:
+                    yield shed
+                    return
+                if wait:
+                    time.sleep(wait)
+
+                try:
+                    with self._http.post(url, json=payload, stream=True, timeout=budget.timeout(GEMINI_TIMEOUT)) as response:
+                        if response.status_code == 429 or response.status_code >= 500:
+                            print(f"Streaming API request failed with status {response.status_code} "
+                                  f"(Retry-After: {response.headers.get('Retry-After')}).")
+                            delay = budget.failed(response.status_code, response.headers.get("Retry-After"))
+                        else:
+                            budget.succeeded()
+                            response.raise_for_status()
+                            response.encoding = "utf-8"
+                            for line in response.iter_lines(decode_unicode=True):
+                                text = self._stream_chunk_text(line)
+                                if text:
+                                    emitted = True
+                                    yield text
+                            break
+                except requests.exceptions.HTTPError as e:
+                    print(f"Streaming API request failed ({e}).")
+                    break
+                except requests.exceptions.RequestException as e:
+                    print(f"Streaming API request failed ({e}).")
+                    if emitted:
+                        yield {"status": "error", "message": "The answer stream was interrupted."}
+                        return
+                    delay = budget.failed()
+
+                if delay is None:
+                    break
+                print(f"Retrying API request in {delay:.1f}s...")
+                time.sleep(delay)
+        finally:
+            budget.release()
+
+        if not emitted:
+            yield {"status": "error", "message": "Failed to synthesize a final answer."}
+
+    """
+    Async variant of _stream_gemini_api, on the pooled async client.
+    """
+    async def _stream_gemini_api_async(self, prompt: str, system_instruction: str):
+        if not self.api_key:
+            yield {"status": "error", "message": "Gemini API key not found. Please check the API_KEY environment variable."}
+            return
+        if httpx is None:
+            yield {"status": "error", "message": "The async Gemini client requires the httpx package."}
+            return
+
+        url, payload = self._gemini_request(prompt, system_instruction, False, stream=True)
+        client = self._async_client()
+        budget = self.gemini_guard.begin(self._estimated_tokens(prompt, system_instruction, False))
+        emitted = False
+
+        try:
+            while True:
+                wait, shed = budget.admit()
+                if shed:
+                    yield shed
+                    return
+                if wait:
+                    await asyncio.sleep(wait)
+
+                try:
+                    async with client.stream("POST", url, json=payload, timeout=budget.timeout(GEMINI_TIMEOUT)) as response:
+                        if response.status_code == 429 or response.status_code >= 500:
+                            print(f"Streaming API request failed with status {response.status_code} "
+                                  f"(Retry-After: {response.headers.get('Retry-After')}).")
+                            delay = budget.failed(response.status_code, response.headers.get("Retry-After"))
+                        else:
+                            budget.succeeded()
+                            response.raise_for_status()
+                            async for line in response.aiter_lines():
+                                text = self._stream_chunk_text(line)
+                                if text:
+                                    emitted = True
+                                    yield text
+                            break
+                except httpx.HTTPStatusError as e:
+                    print(f"Streaming API request failed ({e}).")
+                    break
+                except httpx.HTTPError as e:
+                    print(f"Streaming API request failed ({e}).")
+                    if emitted:
+                        yield {"status": "error", "message": "The answer stream was interrupted."}
+                        return
+                    delay = budget.failed()
+
+                if delay is None:
+                    break
+                print(f"Retrying API request in {delay:.1f}s...")
+                await asyncio.sleep(delay)
+        finally:
+            budget.release()
+
+        if not emitted:
+            yield {"status": "error", "message": "Failed to synthesize a final answer."}
 
     """
     Executes the JSON filter/sort query against the in-memory movie dataset.
+    Uses the columnar store when available; only the final rows are materialized.
+    Aggregation queries (group_by / aggregates) return one row per group instead
+    of movies. Pass `database` to pin a generation across several calls during a reload.
+    Timed as the "execute" stage, with the row counts of every filter.
+    """
+    def execute_query_json(self, query_json: Dict[str, Any], database: Optional[MovieDatabase] = None) -> List[
+        Dict[str, Any]]:
+        database = database or self._database
+        with metrics.span("execute", engine="scan" if database.store is None else "columnar",
+                          aggregate=is_aggregate_query(query_json)) as execute_span:
+            rows = self._execute_query_json(query_json, database)
+            execute_span["rows"] = len(rows)
+        metrics.RESULT_ROWS.observe(len(rows))
+        return rows
+
+    """
+    Executes the query for a paged response. Its ordered results (up to
+    result_cache.max_rows) are kept in the result cache, so later pages are
+    slices of them; a query already cached for this snapshot version is not
+    executed again. Returns the first page (as many rows as the query's
+    limit) with its cursor, see _page.
     """
-    def execute_query_json(self, query_json: Dict[str, Any]) -> List[Dict[str, Any]]:
-        results = self.movie_dataset
+    def execute_query_page(self, query_json: Dict[str, Any], database: Optional[MovieDatabase] = None) -> Dict[
+        str, Any]:
+        database = database or self._database
+        with metrics.span("execute", engine="scan" if database.store is None else "columnar",
+                          aggregate=is_aggregate_query(query_json)) as execute_span:
+            cursor_id = encode_cursor(query_json, database.version)
+            cursor = self.result_cache.get(cursor_id)
+            execute_span["result_cache_hit"] = cursor is not None
+            if cursor is None:
+                cursor = self.result_cache.put(self._open_cursor(cursor_id, query_json, database))
+
+            limit = query_json.get("limit", AGGREGATE_DEFAULT_LIMIT if is_aggregate_query(query_json) else 5)
+            page = self._page(cursor, database, 0, limit if isinstance(limit, int) and limit > 0 else None)
+            execute_span["rows"] = len(page["data"])
+        metrics.RESULT_ROWS.observe(len(page["data"]))
+        return page
+
+    """
+    Returns a page of a cursor returned with an earlier response:
+    {"status": "success", "data", "cursor", "offset", "total_rows",
+    "truncated", "next_offset", "snapshot_version"}. A cursor this process
+    does not hold is rebuilt from the query it names (one execution, no LLM
+    call); one from before a reload is refused with "expired": True.
+    """
+    def query_page(self, cursor_id: str, offset: int = 0, limit: int = RESULT_PAGE_DEFAULT_ROWS) -> Dict[str, Any]:
+        decoded = decode_cursor(cursor_id)
+        if decoded is None:
+            return {"status": "error", "message": "Invalid cursor."}
+        query_json, version = decoded
+
+        database = self._database
+        if version != database.version:
+            return {"status": "error", "expired": True, "snapshot_version": database.version,
+                    "message": "The database was reloaded since this cursor was created. Please run the query again."}
+
+        offset = max(offset, 0)
+        limit = min(max(limit, 1), RESULT_PAGE_MAX_ROWS)
+        with metrics.span("page", offset=offset, limit=limit) as page_span:
+            cursor = self.result_cache.get(cursor_id)
+            page_span["result_cache_hit"] = cursor is not None
+            if cursor is None:
+                cursor = self.result_cache.put(self._open_cursor(cursor_id, query_json, database))
+            page = self._page(cursor, database, offset, limit)
+            page_span["rows"] = len(page["data"])
+        return {"status": "success", **page, "snapshot_version": version}
+
+    """
+    Runs the query without its limit (capped at one row past the cursor's
+    capacity, to tell whether the results were truncated). Movie results of
+    the columnar store are kept as row ids.
+    """
+    def _open_cursor(self, cursor_id: str, query_json: Dict[str, Any], database: MovieDatabase) -> ResultCursor:
+        capacity = self.result_cache.max_rows
+        unbounded = {**query_json, "limit": capacity + 1}
+        if database.store is not None and not is_aggregate_query(query_json):
+            row_ids = database.store.select(unbounded)
+            return ResultCursor(cursor_id, database.version, row_ids=row_ids[:capacity],
+                                truncated=len(row_ids) > capacity)
+        rows = self._execute_query_json(unbounded, database)
+        return ResultCursor(cursor_id, database.version, rows=rows[:capacity], truncated=len(rows) > capacity)
+
+    """
+    One page of a cursor: {"data", "cursor", "offset", "total_rows",
+    "truncated", "next_offset"}; next_offset is None on the last page.
+    """
+    @staticmethod
+    def _page(cursor: ResultCursor, database: MovieDatabase, offset: int, limit: Optional[int]) -> Dict[str, Any]:
+        rows = cursor.page(database.records, offset, limit)
+        end = offset + len(rows)
+        return {"data": rows, "cursor": cursor.cursor_id, "offset": offset, "total_rows": len(cursor),
+                "truncated": cursor.truncated, "next_offset": end if end < len(cursor) else None}
+
+    def _execute_query_json(self, query_json: Dict[str, Any], database: MovieDatabase) -> List[Dict[str, Any]]:
+        if is_aggregate_query(query_json):
+            if database.store is None:
+                matching = self._scan_query_json({**query_json, "sort_by": None, "limit": None}, database.records)
+                return aggregate_records(matching, query_json)
+            return database.store.aggregate(query_json)
+
+        if database.store is None:
+            return self._scan_query_json(query_json, database.records)
+
+        dataset = database.records
+        return [dataset[row_id] for row_id in database.store.select(query_json)]
+
+    """
+    Returns the query plan chosen for the JSON query, with estimated and actual
+    row counts per predicate, to help diagnose slow queries.
+    """
+    def explain(self, query_json: Dict[str, Any]) -> Dict[str, Any]:
+        database = self._database
+        if database.store is None:
+            return {"status": "error", "message": "Query plans require the columnar store."}
+
+        explanation = database.store.explain(query_json)
+        explanation["sort_by"] = query_json.get("sort_by")
+        explanation["limit"] = query_json.get("limit", 5)
+        return {"status": "success", **explanation, "snapshot_version": database.version}
+
+    """
+    Reference implementation of execute_query_json over the list of dicts.
+    Used when the columnar store is disabled or NumPy is unavailable.
+    """
+    def _scan_query_json(self, query_json: Dict[str, Any], records: Optional[List[Dict[str, Any]]] = None) -> List[
+        Dict[str, Any]]:
+        results = self.movie_dataset if records is None else records
 
         def get_lower_string_value(key):
             value = query_json.get(key)
@@ -156,88 +757,124 @@ class CineQueryEngine:
 
             return None
 
+        # Row counts before and after each filter, for the request trace. counted() runs before
+        # `results` is reassigned, so len(results) is the count going into the filter.
+        filters = []
+
+        def counted(name, rows):
+            filters.append({"predicate": name, "rows_before": len(results), "rows_after": len(rows)})
+            return rows
+
+        director_lower = get_lower_string_value("director")
+        actor_lower = get_lower_string_value("actor")
+        if isinstance(results, InternedRows) and (director_lower or actor_lower):
+            # Resolve the name filters to person ids once; only matching rows are materialized.
+            # Without a name filter the rows are left to be built one at a time as they are scanned.
+            results = counted("people", results.filter_people(director_lower, actor_lower))
+
         # Filter by director
         director = query_json.get("director")
-        director_lower = get_lower_string_value("director")
         if director:
-            results = [m for m in results if m.get("director") and director_lower in m["director"].lower()]
+            results = counted("director", [m for m in results
+                                           if m.get("director") and director_lower in m["director"].lower()])
 
         # Filter by actor
         actor = query_json.get("actor")
-        actor_lower = get_lower_string_value("actor")
         if actor_lower:
-            results = [
+            results = counted("actor", [
                 m for m in results
                 if any(actor_lower in a.lower() for a in m.get("actors", []))
-            ]
+            ])
 
         # Filter by genre
         genre = query_json.get("genre")
         genre_lower = get_lower_string_value("genre")
         if genre:
-            results = [
+            results = counted("genre", [
                 m for m in results
                 if any(genre_lower in g.lower() for g in m.get("genres", []))
-            ]
+            ])
 
         # Filter by title keywords
         title_keywords = query_json.get("title_keywords")
         title_keywords_lower = get_lower_string_value("title_keywords")
         if title_keywords:
-            results = [m for m in results if title_keywords_lower in str(m.get("title", "")).lower()]
+            results = counted("title_keywords",
+                              [m for m in results if title_keywords_lower in str(m.get("title", "")).lower()])
 
         # Filter by year_min
         year_min = query_json.get("year_min")
         if year_min is not None:
-            results = [m for m in results if m.get("year", 0) >= year_min]
+            results = counted("year_min", [m for m in results if m.get("year", 0) >= year_min])
 
         # Filter by year_max
         year_max = query_json.get("year_max")
         if year_max is not None:
-            results = [m for m in results if m.get("year", 9999) <= year_max]
+            results = counted("year_max", [m for m in results if m.get("year", 9999) <= year_max])
 
         # Filter by rating_min
         rating_min = query_json.get("rating_min")
         if rating_min is not None:
-            results = [m for m in results if m.get("rating", 0.0) >= rating_min]
+            results = counted("rating", [m for m in results if m.get("rating", 0.0) >= rating_min])
+
+        metrics.annotate(filters=filters)
 
         # Sorting
         sort_by = query_json.get("sort_by")
         sort_order = query_json.get("sort_order", "desc")
 
+        limit = query_json.get("limit", 5)
+        limited = isinstance(limit, int) and limit > 0
+
         if sort_by in ["rating", "year"]:
             reverse = sort_order == "desc"
             default_key = 0.0 if sort_by == 'rating' else 0
-            results.sort(key=lambda x: x.get(sort_by, default_key), reverse=reverse)
+            key = lambda x: x.get(sort_by, default_key)
+            if limited:
+                # Same rows and tie order as sorted(...)[:limit], holding only `limit` rows at a time.
+                results = (heapq.nlargest if reverse else heapq.nsmallest)(limit, results, key=key)
+            else:
+                results = sorted(results, key=key, reverse=reverse)
 
         # Limit Results
-        limit = query_json.get("limit", 5)
-        if isinstance(limit, int) and limit > 0:
+        if limited:
             results = results[:limit]
 
         return results
 
     """
-    Main orchestrator for the NL-to-DB-to-NL pipeline.
+    Translates the natural language query into query JSON: from the
+    translation cache, else from the local fast-path parser when it is
+    confident, else with the LLM (successful LLM translations are cached).
+    Like _cinequery_steps, yields each LLM call it needs and receives its result.
     """
-    def run_cinequery(self, user_query: str) -> Dict[str, Any]:
+    def _translate_steps(self, user_query: str, database: MovieDatabase):
+        cached = self.translation_cache.get(user_query)
+        if cached is not None:
+            return {"status": "success", "query_json": cached, "source": "cache"}
 
-        if not self.movie_dataset:
-            return {"status": "error", "message": "Database not initialized or empty."}
+        if self.fast_parser_confidence <= 1 and database.records:
+            parsed = database.query_parser().parse(user_query)
+            if parsed["confidence"] >= self.fast_parser_confidence:
+                return {"status": "success", "query_json": parsed["query_json"], "source": "parser"}
 
-        # Translation
         translation_system_prompt = (
             "You are a strict data retrieval engine. Your ONLY function is to convert the user's "
             "natural language query into a valid JSON object matching the provided schema. "
             "Do not include any text or conversation outside of the JSON object. "
             "If a field is not mentioned by the user, omit it from the JSON. "
-            "Be aggressive in mapping concepts (e.g., 'best' or 'top' implies sort_by: 'rating', sort_order: 'desc', limit: 5)."
+            "Be aggressive in mapping concepts (e.g., 'best' or 'top' implies sort_by: 'rating', sort_order: 'desc', limit: 5). "
+            "For questions about counts, averages or comparisons across years, decades, genres or directors "
+            "(e.g., 'how many', 'per decade', 'which director has the highest average rating'), use group_by "
+            "and aggregates instead of listing movies."
         )
 
-        translation_result = self._call_gemini_api(user_query, translation_system_prompt, is_translation=True)
+        translation_result = yield (user_query, translation_system_prompt, True)
 
         if not translation_result:
             return {"status": "error", "message": "Failed to translate query into structured JSON format."}
+        if translation_result.get("status") == "error":
+            return translation_result
 
         try:
             query_json_text = translation_result.get("text", "")
@@ -252,34 +889,343 @@ class CineQueryEngine:
             return {"status": "error", "message": "LLM returned improperly formatted JSON.",
                     "llm_output": query_json_text}
 
+        if isinstance(query_json, dict):
+            self.translation_cache.put(user_query, query_json)
+        return {"status": "success", "query_json": query_json, "source": "llm"}
+
+    """
+    Translation and execution: the part of the pipeline before synthesis.
+    Returns {"status": "ready", "query_json", "translation_source", "data",
+    "snapshot_version", "paging"} when there are rows to summarize, or the
+    final response otherwise (an error, or the no-results message). "data"
+    is the first page of the results; "paging" holds its cursor fields.
+    """
+    def _retrieve_steps(self, user_query: str):
+        # Pin the current generation so a concurrent reload cannot change the data mid-request.
+        database = self._database
+        version = database.version
+
+        if not database.records:
+            return {"status": "error", "message": "Database not initialized or empty."}
+
+        # Translation
+        with metrics.span("translate") as translate_span:
+            translation = yield from self._translate_steps(user_query, database)
+            translate_span["source"] = translation.get("source")
+            translate_span["cache_hit"] = translation.get("source") == "cache"
+        if translation.get("source"):
+            metrics.TRANSLATIONS.inc(source=translation["source"])
+        if translation["status"] != "success":
+            return {**translation, "snapshot_version": version}
+        query_json = translation["query_json"]
+
         # Execution
-        movie_results = self.execute_query_json(query_json)
+        page = self.execute_query_page(query_json, database)
 
-        if not movie_results:
-            return {"status": "success", "message": "I found no movies matching your criteria in the database."}
+        if not page["data"]:
+            return {"status": "success", "message": "I found no movies matching your criteria in the database.",
+                    "snapshot_version": version}
 
-        # Synthesis
-        results_data_json = json.dumps(movie_results, indent=2)
+        return {"status": "ready", "query_json": query_json, "translation_source": translation["source"],
+                "data": page["data"], "snapshot_version": version, "paging": self._paging(page)}
+
+    """
+    Returns (prompt, system_instruction, estimated prompt tokens) for the
+    synthesis call. The rows are sent as a compact table of the relevant
+    fields, within the prompt token budget (see prompt_payload).
+    """
+    def _synthesis_request(self, user_query: str, retrieved: Dict[str, Any]):
+        payload = build_prompt_payload(retrieved["data"], retrieved["query_json"])
 
         synthesis_prompt = (
             f"The user asked: '{user_query}'. "
-            f"The following data was retrieved from the database:\n\n{results_data_json}\n\n"
+            "The following data was retrieved from the database, one row per line with "
+            f"'{SEPARATOR}'-separated columns:\n\n{payload['text']}\n\n"
             "Please use ONLY this data to generate a concise, conversational, and helpful summary. "
-            "Do not hallucinate any information not present in the provided JSON data."
+            "Do not hallucinate any information not present in the provided data."
         )
         synthesis_system_prompt = (
             "You are a helpful film analyst. Your task is to summarize the provided structured movie data "
             "into natural, conversational language based on the original user query."
         )
+        prompt_tokens = estimate_tokens(synthesis_prompt, synthesis_system_prompt, 0)
+        metrics.PROMPT_TOKENS.observe(prompt_tokens)
+        metrics.annotate(prompt_tokens=prompt_tokens, rows_sent=payload["rows_included"],
+                         rows_omitted=payload["rows_omitted"])
+        return synthesis_prompt, synthesis_system_prompt, prompt_tokens
+
+    def _final_response(self, user_query: str, retrieved: Dict[str, Any], final_answer: str,
+                        prompt_tokens: int) -> Dict[str, Any]:
+        return {"status": "success", "query": user_query, "data": retrieved["data"], "answer": final_answer,
+                "snapshot_version": retrieved["snapshot_version"],
+                "translation_source": retrieved["translation_source"],
+                "synthesis_prompt_tokens": prompt_tokens, **retrieved["paging"]}
 
-        synthesis_result = self._call_gemini_api(synthesis_prompt, synthesis_system_prompt, is_translation=False)
+    """
+    The cursor fields a response carries next to its first page of rows.
+    """
+    @staticmethod
+    def _paging(page: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: page[key] for key in ("cursor", "total_rows", "truncated", "next_offset")}
+
+    """
+    The NL-to-DB-to-NL pipeline, independent of how the LLM is called. It is a
+    generator: each LLM call is yielded as (prompt, system_instruction,
+    is_translation) and the caller sends back the result; the response dict
+    is the generator's return value. run_cinequery drives it with blocking
+    calls and run_cinequery_async with awaited ones.
+    """
+    def _cinequery_steps(self, user_query: str):
+        retrieved = yield from self._retrieve_steps(user_query)
+        if retrieved["status"] != "ready":
+            return retrieved
+
+        # Synthesis
+        with metrics.span("synthesize"):
+            synthesis_prompt, synthesis_system_prompt, prompt_tokens = self._synthesis_request(user_query, retrieved)
+            synthesis_result = yield (synthesis_prompt, synthesis_system_prompt, False)
 
         if not synthesis_result:
-            return {"status": "error", "message": "Failed to synthesize a final answer."}
+            return {"status": "error", "message": "Failed to synthesize a final answer.",
+                    "snapshot_version": retrieved["snapshot_version"]}
+        if synthesis_result.get("status") == "error":
+            return {**synthesis_result, "snapshot_version": retrieved["snapshot_version"]}
 
         final_answer = synthesis_result.get("text", "Could not generate final answer text.")
+        return self._final_response(user_query, retrieved, final_answer, prompt_tokens)
+
+    """
+    Drives a pipeline generator with blocking Gemini calls, each timed as a
+    gemini_translation / gemini_synthesis stage.
+    """
+    def _run_steps(self, steps):
+        try:
+            call = next(steps)
+            while True:
+                kind = "translation" if call[2] else "synthesis"
+                with metrics.gemini_call(kind, len(call[0]) + len(call[1])) as call_span:
+                    result = self._call_gemini_api(*call)
+                    metrics.finish_gemini_call(call_span, kind, result)
+                call = steps.send(result)
+        except StopIteration as done:
+            return done.value
+
+    async def _run_steps_async(self, steps):
+        try:
+            call = next(steps)
+            while True:
+                kind = "translation" if call[2] else "synthesis"
+                with metrics.gemini_call(kind, len(call[0]) + len(call[1])) as call_span:
+                    result = await self._call_gemini_api_async(*call)
+                    metrics.finish_gemini_call(call_span, kind, result)
+                call = steps.send(result)
+        except StopIteration as done:
+            return done.value
+
+    """
+    Runs the whole pipeline as one traced request. The response carries its
+    spans under "debug_timings"; _own_response drops them unless asked for.
+    """
+    def _run_traced(self, user_query: str) -> Dict[str, Any]:
+        with metrics.trace_request() as trace:
+            response = self._run_steps(self._cinequery_steps(user_query))
+        metrics.finish_request(trace, response["status"])
+        return {**response, "debug_timings": trace.to_list()}
+
+    async def _run_traced_async(self, user_query: str) -> Dict[str, Any]:
+        with metrics.trace_request() as trace:
+            response = await self._run_steps_async(self._cinequery_steps(user_query))
+        metrics.finish_request(trace, response["status"])
+        return {**response, "debug_timings": trace.to_list()}
+
+    """
+    Main orchestrator for the NL-to-DB-to-NL pipeline (blocking). Concurrent
+    calls with the same normalized query are coalesced into one run. With
+    debug_timings=True the response includes the timing spans of each stage
+    (see metrics.py).
+    """
+    def run_cinequery(self, user_query: str, debug_timings: bool = False) -> Dict[str, Any]:
+        response = self._in_flight.do(normalize_query(user_query), lambda: self._run_traced(user_query))
+        return self._own_response(response, user_query, debug_timings)
+
+    """
+    Async variant of run_cinequery. LLM calls are awaited on a pooled
+    keep-alive client, so one event loop can hold many queries that are
+    waiting on Gemini at once.
+    """
+    async def run_cinequery_async(self, user_query: str, debug_timings: bool = False) -> Dict[str, Any]:
+        response = await self._in_flight_async.do(normalize_query(user_query),
+                                                  lambda: self._run_traced_async(user_query))
+        return self._own_response(response, user_query, debug_timings)
+
+    """
+    Number of queries answered by joining an identical query already in flight.
+    """
+    @property
+    def coalesced_queries(self) -> int:
+        return self._in_flight.coalesced + self._in_flight_async.coalesced
+
+    """
+    A coalesced response is shared between callers; each gets its own copy
+    that echoes its own query text, with the timings of the run that
+    answered it only if asked for.
+    """
+    @staticmethod
+    def _own_response(response: Dict[str, Any], user_query: str, debug_timings: bool = False) -> Dict[str, Any]:
+        response = dict(response)
+        if "query" in response:
+            response["query"] = user_query
+        if not debug_timings:
+            response.pop("debug_timings", None)
+        return response
+
+    """
+    Runs many queries concurrently, at most `max_concurrency` at a time
+    (capped at batch_concurrency), and returns their responses in input
+    order. Duplicate queries in the batch, and identical queries already in
+    flight elsewhere, are answered by one pipeline run. Each response carries
+    its own status; one failing query does not fail the batch.
+    """
+    def run_batch(self, queries: List[str], max_concurrency: Optional[int] = None) -> List[Dict[str, Any]]:
+        keys, unique = self._batch_keys(queries)
+        workers = max(1, min(max_concurrency or self.batch_concurrency, self.batch_concurrency, len(unique) or 1))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {key: pool.submit(self._batch_item, query) for key, query in unique.items()}
+            responses = {key: future.result() for key, future in futures.items()}
+        return self._batch_results(queries, keys, responses)
+
+    """
+    Async variant of run_batch.
+    """
+    async def run_batch_async(self, queries: List[str], max_concurrency: Optional[int] = None) -> List[
+        Dict[str, Any]]:
+        keys, unique = self._batch_keys(queries)
+        semaphore = asyncio.Semaphore(max(1, min(max_concurrency or self.batch_concurrency, self.batch_concurrency)))
+
+        async def run(query):
+            async with semaphore:
+                try:
+                    return await self.run_cinequery_async(query)
+                except Exception as e:
+                    return self._batch_error(e)
+
+        results = await asyncio.gather(*(run(query) for query in unique.values()))
+        return self._batch_results(queries, keys, dict(zip(unique, results)))
+
+    @staticmethod
+    def _batch_keys(queries: List[str]):
+        keys, unique = [], {}
+        for query in queries:
+            key = normalize_query(query) if isinstance(query, str) and query.strip() else None
+            keys.append(key)
+            if key is not None:
+                unique.setdefault(key, query)
+        return keys, unique
+
+    def _batch_item(self, query: str) -> Dict[str, Any]:
+        try:
+            return self.run_cinequery(query)
+        except Exception as e:
+            return self._batch_error(e)
+
+    @staticmethod
+    def _batch_error(e: Exception) -> Dict[str, Any]:
+        print(f"Unexpected error during batch query: {e}")
+        return {"status": "error", "message": "An unexpected error occurred while processing this query.",
+                "details": str(e)}
+
+    def _batch_results(self, queries: List[str], keys: List[Optional[str]],
+                       responses: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [self._own_response(responses[key], query) if key is not None else
+                {"status": "error", "message": "Each query must be a non-empty string."}
+                for query, key in zip(queries, keys)]
+
+    """
+    Streaming variant of run_cinequery. Yields (event, payload) pairs as soon
+    as each part is ready:
+        "query"  the query JSON, translation source and snapshot version
+        "data"   the retrieved rows (before synthesis starts)
+        "token"  a chunk of synthesis text, as the model produces it
+        "done"   the complete response, as run_cinequery would return it
+        "error"  an error response; the stream ends
+    The request is traced like run_cinequery; with debug_timings=True the
+    final event carries the timing spans.
+    """
+    def stream_cinequery(self, user_query: str, debug_timings: bool = False):
+        with metrics.trace_request() as trace:
+            for event, payload in self._stream_steps(user_query):
+                if event in ("done", "error"):
+                    payload = self._finish_stream(trace, payload, debug_timings)
+                yield event, payload
+
+    def _stream_steps(self, user_query: str):
+        retrieved = self._run_steps(self._retrieve_steps(user_query))
+        if retrieved["status"] != "ready":
+            yield ("done" if retrieved["status"] == "success" else "error"), retrieved
+            return
+        yield from self._retrieved_events(user_query, retrieved)
+
+        with metrics.span("synthesize"):
+            synthesis_prompt, synthesis_system_prompt, prompt_tokens = self._synthesis_request(user_query, retrieved)
+            chunks = []
+            with metrics.gemini_call("synthesis", len(synthesis_prompt) + len(synthesis_system_prompt)) as call_span:
+                for chunk in self._stream_gemini_api(synthesis_prompt, synthesis_system_prompt):
+                    if isinstance(chunk, dict):
+                        metrics.finish_gemini_call(call_span, "synthesis", chunk)
+                        yield "error", {**chunk, "snapshot_version": retrieved["snapshot_version"]}
+                        return
+                    chunks.append(chunk)
+                    yield "token", {"text": chunk}
+                metrics.finish_gemini_call(call_span, "synthesis", {"text": "".join(chunks)})
+        yield "done", self._final_response(user_query, retrieved, "".join(chunks), prompt_tokens)
+
+    """
+    Async variant of stream_cinequery.
+    """
+    async def stream_cinequery_async(self, user_query: str, debug_timings: bool = False):
+        with metrics.trace_request() as trace:
+            async for event, payload in self._stream_steps_async(user_query):
+                if event in ("done", "error"):
+                    payload = self._finish_stream(trace, payload, debug_timings)
+                yield event, payload
+
+    async def _stream_steps_async(self, user_query: str):
+        retrieved = await self._run_steps_async(self._retrieve_steps(user_query))
+        if retrieved["status"] != "ready":
+            yield ("done" if retrieved["status"] == "success" else "error"), retrieved
+            return
+        for event in self._retrieved_events(user_query, retrieved):
+            yield event
+
+        with metrics.span("synthesize"):
+            synthesis_prompt, synthesis_system_prompt, prompt_tokens = self._synthesis_request(user_query, retrieved)
+            chunks = []
+            with metrics.gemini_call("synthesis", len(synthesis_prompt) + len(synthesis_system_prompt)) as call_span:
+                async for chunk in self._stream_gemini_api_async(synthesis_prompt, synthesis_system_prompt):
+                    if isinstance(chunk, dict):
+                        metrics.finish_gemini_call(call_span, "synthesis", chunk)
+                        yield "error", {**chunk, "snapshot_version": retrieved["snapshot_version"]}
+                        return
+                    chunks.append(chunk)
+                    yield "token", {"text": chunk}
+                metrics.finish_gemini_call(call_span, "synthesis", {"text": "".join(chunks)})
+        yield "done", self._final_response(user_query, retrieved, "".join(chunks), prompt_tokens)
+
+    """
+    Records the status of a finished stream and, if asked for, adds the
+    request's timing spans to its final event.
+    """
+    @staticmethod
+    def _finish_stream(trace: "metrics.Trace", payload: Dict[str, Any], debug_timings: bool) -> Dict[str, Any]:
+        metrics.finish_request(trace, payload["status"])
+        return {**payload, "debug_timings": trace.to_list()} if debug_timings else payload
 
-        return {"status": "success", "query": user_query, "data": movie_results, "answer": final_answer}
+    @staticmethod
+    def _retrieved_events(user_query: str, retrieved: Dict[str, Any]):
+        yield "query", {"query": user_query, "query_json": retrieved["query_json"],
+                        "translation_source": retrieved["translation_source"],
+                        "snapshot_version": retrieved["snapshot_version"]}
+        yield "data", {"data": retrieved["data"], **retrieved["paging"]}
 
 # cqe = CineQueryEngine()
 # print(cqe.run_cinequery("What are the top 5 highest-rated family movies?"))
\ No newline at end of file
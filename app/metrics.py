@@ -0,0 +1,254 @@
+import contextlib
+import contextvars
+import threading
+import time
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+
+# Histogram buckets (upper bounds) for stage durations in seconds, row counts, prompt tokens and text sizes.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ROW_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 500, 1000, 10000, 100000)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 1500, 2000, 4000, 8000)
+CHAR_BUCKETS = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+"""
+Monotonic counter with labels, in the Prometheus data model.
+"""
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels.get(name, "")) for name in self.labelnames), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+"""
+Histogram with fixed buckets and labels, in the Prometheus data model
+(cumulative bucket counts, sum and count per label set).
+"""
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Per label set: [count per bucket (last is +Inf), sum, count].
+        self._series: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            else:
+                series[0][-1] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels) -> int:
+        series = self._series.get(tuple(str(labels.get(name, "")) for name in self.labelnames))
+        return series[2] if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = 'le="+Inf"' if bound == float("inf") else f'le="{_number(bound)}"'
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+REGISTRY: List[Any] = []
+
+STAGE_SECONDS = Histogram("cinequery_stage_duration_seconds",
+                          "Time spent per pipeline stage (request, translate, execute, synthesize, gemini_*, page).",
+                          ["stage"])
+REQUESTS = Counter("cinequery_requests_total", "Queries answered, by response status.", ["status"])
+TRANSLATIONS = Counter("cinequery_translations_total",
+                       "Query translations by source: cache (hit), parser (fast path) or llm.", ["source"])
+GEMINI_CALLS = Counter("cinequery_gemini_calls_total",
+                       "Gemini calls by kind and outcome (success, error, shed).", ["kind", "outcome"])
+GEMINI_RETRIES = Counter("cinequery_gemini_retries_total", "Gemini attempts retried after a failure.")
+RESULT_ROWS = Histogram("cinequery_result_rows", "Rows (or groups) returned by a query.", buckets=ROW_BUCKETS)
+PROMPT_TOKENS = Histogram("cinequery_synthesis_prompt_tokens", "Estimated tokens of the synthesis prompt.",
+                          buckets=TOKEN_BUCKETS)
+GEMINI_PROMPT_CHARS = Histogram("cinequery_gemini_prompt_chars", "Characters sent per Gemini call.", ["kind"],
+                                buckets=CHAR_BUCKETS)
+GEMINI_RESPONSE_CHARS = Histogram("cinequery_gemini_response_chars", "Characters of text returned per Gemini call.",
+                                  ["kind"], buckets=CHAR_BUCKETS)
+
+"""
+Renders every metric in the Prometheus text exposition format.
+"""
+def render_prometheus() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+"""
+The timing spans of one request. Spans are listed in the order they
+started; each names its enclosing span as "parent". Spans still open
+(e.g. the request span while its response is being built) report the
+time elapsed so far.
+"""
+class Trace:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self._open: List[Dict[str, Any]] = []
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        now_ms = (time.perf_counter() - self.started) * 1000
+        return [dict(span) if span["duration_ms"] is not None else
+                {**span, "duration_ms": round(now_ms - span["start_ms"], 3)} for span in self.spans]
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("cinequery_trace", default=None)
+
+"""
+True while a request trace is being recorded in this context, so callers
+can skip gathering details nobody will read.
+"""
+def tracing() -> bool:
+    return _current_trace.get() is not None
+
+"""
+Times a block as one pipeline stage: the duration always goes into the
+stage histogram and, while a request trace is active, the span is added to
+it. Yields the span's attribute dict, which the block may fill in.
+"""
+@contextlib.contextmanager
+def span(stage: str, **attributes):
+    trace = _current_trace.get()
+    started = time.perf_counter()
+    record = {"stage": stage, "start_ms": None, "duration_ms": None, "parent": None, **attributes}
+    if trace is not None:
+        record["start_ms"] = round((started - trace.started) * 1000, 3)
+        record["parent"] = trace._open[-1]["stage"] if trace._open else None
+        trace.spans.append(record)
+        trace._open.append(record)
+    try:
+        yield record
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        record["duration_ms"] = round(elapsed * 1000, 3)
+        if trace is not None:
+            # Usually the last one; a generator abandoned mid-span can leave spans open out of order.
+            trace._open[:] = [r for r in trace._open if r is not record]
+
+"""
+Sets attributes on the innermost open span of the current trace; a no-op
+when nothing is being traced.
+"""
+def annotate(**attributes):
+    trace = _current_trace.get()
+    if trace is not None and trace._open:
+        trace._open[-1].update(attributes)
+
+"""
+Adds to numeric attributes of the innermost open span (e.g. retries).
+"""
+def add(**amounts):
+    trace = _current_trace.get()
+    if trace is not None and trace._open:
+        record = trace._open[-1]
+        for name, amount in amounts.items():
+            record[name] = record.get(name, 0) + amount
+
+"""
+Records one request: starts a trace in the current context with a
+"request" span around the block, and yields the Trace.
+"""
+@contextlib.contextmanager
+def trace_request(**attributes):
+    trace = Trace()
+    token = _current_trace.set(trace)
+    try:
+        with span("request", **attributes):
+            yield trace
+    finally:
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            # A streaming generator may be closed from another context.
+            _current_trace.set(None)
+
+"""
+Records the outcome of a traced request: its status on the request span
+and in the requests counter.
+"""
+def finish_request(trace: Trace, status: str):
+    if trace.spans:
+        trace.spans[0]["status"] = status
+    REQUESTS.inc(status=status)
+
+"""
+Times one Gemini call of the given kind ("translation" or "synthesis").
+Yields the span; the caller passes the result to finish_gemini_call.
+"""
+def gemini_call(kind: str, prompt_chars: int):
+    GEMINI_PROMPT_CHARS.observe(prompt_chars, kind=kind)
+    return span(f"gemini_{kind}", prompt_chars=prompt_chars, retries=0, queued_ms=0)
+
+"""
+Records the outcome of a Gemini call from its result: "success" (with the
+length of the returned text), "error", or "shed" when the rate limiter or
+circuit breaker refused it.
+"""
+def finish_gemini_call(record: Dict[str, Any], kind: str, result: Optional[Dict[str, Any]]):
+    if not result:
+        outcome = "error"
+    elif result.get("status") == "error":
+        outcome = "shed" if "retry_after" in result else "error"
+    else:
+        outcome = "success"
+        record["response_chars"] = len(result.get("text") or "")
+        GEMINI_RESPONSE_CHARS.observe(record["response_chars"], kind=kind)
+    record["outcome"] = outcome
+    GEMINI_CALLS.inc(kind=kind, outcome=outcome)
@@ -0,0 +1,431 @@
+import threading
+from typing import List, Dict, Any, Callable, Optional, Sequence, Tuple
+
+import numpy as np
+
+import metrics
+from aggregation import aggregate_plan, aggregate_records, group_row
+from name_index import NameIndex, normalize_text_filter
+from query_planner import QueryPlanner, Predicate
+
+"""
+Columnar, NumPy-backed view of the movie dataset.
+Filters narrow a set of candidate row ids and only the row ids of the final
+(sorted, limited) result are returned, so callers materialize just those rows.
+"""
+class MovieStore:
+    def __init__(self, size: int, years: np.ndarray, year_present: np.ndarray, ratings: np.ndarray,
+                 genre_bits: Dict[str, int], genre_masks: np.ndarray,
+                 name_sources: Dict[str, Callable[[], Sequence[Sequence[str]]]],
+                 director_source: Callable[[], Tuple[np.ndarray, List[str]]]):
+        self.size = size
+        self.years = years
+        self.year_present = year_present
+        self.ratings = ratings
+        self.genre_bits = genre_bits
+        self.genre_masks = genre_masks
+
+        self.year_index = RangeIndex(self.years, self.year_present)
+        self.rating_index = RangeIndex(self.ratings)
+
+        # Trigram name indexes for the substring filters, keyed by query field.
+        # Each source returns the per-row values; indexes are built on first use.
+        self._name_sources = name_sources
+        self._name_indexes: Dict[str, NameIndex] = {}
+        self._name_index_lock = threading.Lock()
+        # Per-row director ids (-1 for none) and their names, for group_by director; built on first use.
+        self._director_source = director_source
+        self._director_column: Optional[Tuple[np.ndarray, List[str]]] = None
+
+        self.planner = QueryPlanner(self)
+
+    """
+    Builds a store from movie records (the dicts in movies_db.json). With a
+    people table the records hold person ids instead of names (the people
+    format, see people.py). Name indexes are built eagerly, since the
+    records are already in memory.
+    """
+    @classmethod
+    def from_records(cls, records: Sequence[Dict[str, Any]], people=None) -> "MovieStore":
+        size = len(records)
+        years = [m.get("year") for m in records]
+
+        # Genre vocabulary in first-seen order; each row stores a bitmask of its genres.
+        genre_bits: Dict[str, int] = {}
+        row_genres = [m.get("genres", []) for m in records]
+        for genres in row_genres:
+            for g in genres:
+                if g not in genre_bits:
+                    genre_bits[g] = 1 << len(genre_bits)
+        # More than 64 distinct genres falls back to Python ints (object dtype).
+        genre_dtype = np.uint64 if len(genre_bits) <= 64 else object
+
+        if people is None:
+            def directors():
+                ids: Dict[str, int] = {}
+                codes = np.fromiter((ids.setdefault(m["director"], len(ids)) if m.get("director") else -1
+                                     for m in records), dtype=np.int64, count=size)
+                return codes, list(ids)
+
+            name_sources = {
+                "director": lambda: [(m["director"],) if m.get("director") else () for m in records],
+                "actor": lambda: [m.get("actors", []) for m in records],
+            }
+        else:
+            names = people.names
+
+            def directors():
+                codes = np.fromiter((-1 if m.get("director") is None else m["director"] for m in records),
+                                    dtype=np.int64, count=size)
+                return codes, names
+
+            name_sources = {
+                "director": lambda: [(names[m["director"]],) if m.get("director") is not None else ()
+                                     for m in records],
+                "actor": lambda: [[names[i] for i in m.get("actors", [])] for m in records],
+            }
+
+        store = cls(
+            size=size,
+            years=np.fromiter((y if y is not None else 0 for y in years), dtype=np.int64, count=size),
+            year_present=np.fromiter((y is not None for y in years), dtype=bool, count=size),
+            ratings=np.fromiter((m.get("rating", 0.0) or 0.0 for m in records), dtype=np.float64, count=size),
+            genre_bits=genre_bits,
+            genre_masks=np.array([sum(genre_bits[g] for g in set(genres)) for genres in row_genres],
+                                 dtype=genre_dtype),
+            name_sources={
+                **name_sources,
+                "title_keywords": lambda: [(str(m.get("title", "")),) for m in records],
+            },
+            director_source=directors,
+        )
+        store.build_indexes()
+        return store
+
+    """
+    Builds a store over a binary snapshot. Numeric columns are the snapshot's
+    mmap-backed arrays (no copy); name indexes are built lazily on first use,
+    so opening stays near-instant.
+    """
+    @classmethod
+    def from_snapshot(cls, snapshot) -> "MovieStore":
+        columns = snapshot.columns
+
+        def directors():
+            people = snapshot.strings("people")
+            return [(people[d],) if d >= 0 else () for d in columns["director"].tolist()]
+
+        def actors():
+            people = snapshot.strings("people")
+            offsets, actor_ids = columns["actor_offsets"].tolist(), columns["actor_ids"].tolist()
+            return [[people[i] for i in actor_ids[offsets[row_id]:offsets[row_id + 1]]]
+                    for row_id in range(snapshot.row_count)]
+
+        def titles():
+            return [(title,) for title in snapshot.strings("title")]
+
+        return cls(
+            size=snapshot.row_count,
+            years=columns["year"],
+            year_present=columns["year_present"],
+            ratings=columns["rating"],
+            genre_bits={name: 1 << bit for bit, name in enumerate(snapshot.genres)},
+            genre_masks=columns["genre_mask"],
+            name_sources={"director": directors, "actor": actors, "title_keywords": titles},
+            director_source=lambda: (columns["director"], snapshot.strings("people")),
+        )
+
+    """
+    Returns the name index for a text field ("director", "actor" or
+    "title_keywords"), building it on first use.
+    """
+    def name_index(self, name: str) -> NameIndex:
+        index = self._name_indexes.get(name)
+        if index is None:
+            with self._name_index_lock:
+                index = self._name_indexes.get(name)
+                if index is None:
+                    index = self._name_indexes[name] = NameIndex(self._name_sources[name]())
+        return index
+
+    """
+    Builds every name index now instead of on first use.
+    """
+    def build_indexes(self):
+        for name in self._name_sources:
+            self.name_index(name)
+
+    """
+    Returns (director per row, -1 for none; names), with the directors
+    renumbered in name order so sorting ids sorts names. Built on first use.
+    """
+    def director_column(self) -> Tuple[np.ndarray, List[str]]:
+        if self._director_column is None:
+            with self._name_index_lock:
+                if self._director_column is None:
+                    ids, names = self._director_source()
+                    by_name = sorted(range(len(names)), key=names.__getitem__)
+                    rank = np.empty(len(names) + 1, dtype=np.int64)
+                    rank[by_name] = np.arange(len(names))
+                    rank[-1] = -1  # ids of -1 (no director) stay -1
+                    self._director_column = (rank[np.asarray(ids, dtype=np.int64)], [names[i] for i in by_name])
+        return self._director_column
+
+    """
+    Returns the combined bitmask of every genre whose name contains `genre_lower`.
+    """
+    def genre_mask_for(self, genre_lower: str) -> int:
+        bits = 0
+        for name, bit in self.genre_bits.items():
+            if genre_lower in name.lower():
+                bits |= bit
+        return bits
+
+    """
+    Returns the sorted row ids (out of `candidates`, or all rows when None)
+    whose genres contain `genre_lower`.
+    """
+    def _genre_rows(self, genre_lower: str, candidates: Optional[np.ndarray]) -> np.ndarray:
+        bits = self.genre_mask_for(genre_lower)
+        if not bits:
+            return np.empty(0, dtype=np.int64)
+        masks = self.genre_masks if candidates is None else self.genre_masks[candidates]
+        hits = (masks & masks.dtype.type(bits)) != 0
+        return np.flatnonzero(hits) if candidates is None else candidates[hits]
+
+    """
+    Returns the sorted row ids (out of `candidates`, or all rows when None)
+    whose value lies in [low, high]. Without candidates the presorted range
+    index answers with bisect; otherwise the survivors are compared directly.
+    """
+    def _range_rows(self, index: "RangeIndex", values: np.ndarray, low, high,
+                    candidates: Optional[np.ndarray]) -> np.ndarray:
+        if candidates is None:
+            return index.between(low, high)
+        kept = candidates[index.present[candidates]] if index.present is not None else candidates
+        column = values[kept]
+        hits = np.ones(len(kept), dtype=bool)
+        if low is not None:
+            hits &= column >= low
+        if high is not None:
+            hits &= column <= high
+        return kept[hits]
+
+    """
+    Evaluates every filter in the query JSON and returns the surviving row ids
+    in ascending row order. The planner picks the most selective predicate to
+    produce the first candidate set; later predicates only look at the survivors.
+    """
+    def filter_rows(self, query_json: Dict[str, Any]) -> np.ndarray:
+        candidates = self._filter_candidates(query_json)
+        return np.arange(self.size) if candidates is None else candidates
+
+    """
+    Same as filter_rows, but returns None when the query has no filters at all.
+    While a request is traced, the row count before and after each predicate
+    is recorded on the current span.
+    """
+    def _filter_candidates(self, query_json: Dict[str, Any]) -> Optional[np.ndarray]:
+        candidates, predicates = self.planner.execute(query_json)
+        if metrics.tracing():
+            rows, filters = self.size, []
+            for predicate in predicates:
+                filters.append({"predicate": predicate.name, "rows_before": rows, "rows_after": predicate.actual_rows,
+                                "elapsed_ms": predicate.elapsed_ms})
+                rows = predicate.actual_rows
+            metrics.annotate(filters=filters)
+        return candidates
+
+    """
+    Applies one planned predicate. With no candidates yet it drives the query
+    through the predicate's index; otherwise it filters the survivors.
+    """
+    def evaluate(self, predicate: Predicate, candidates: Optional[np.ndarray]) -> np.ndarray:
+        if predicate.kind == "text":
+            rows = self.name_index(predicate.name).lookup_rows(predicate.value)
+            return rows if candidates is None else np.intersect1d(candidates, rows, assume_unique=True)
+        if predicate.kind == "genre":
+            return self._genre_rows(predicate.value, candidates)
+
+        low, high = predicate.value
+        if predicate.name == "year":
+            return self._range_rows(self.year_index, self.years, low, high, candidates)
+        return self._range_rows(self.rating_index, self.ratings, low, high, candidates)
+
+    """
+    Returns the planner's chosen predicate order with estimated versus actual row counts.
+    """
+    def explain(self, query_json: Dict[str, Any]) -> Dict[str, Any]:
+        return self.planner.explain(query_json)
+
+    """
+    Runs the filter/sort/limit query and returns the matching row ids in result order.
+    Never reorders the underlying dataset.
+    """
+    def select(self, query_json: Dict[str, Any]) -> List[int]:
+        candidates = self._filter_candidates(query_json)
+
+        limit = query_json.get("limit", 5)
+        if not (isinstance(limit, int) and limit > 0):
+            limit = None
+
+        sort_by = query_json.get("sort_by")
+        sort_order = query_json.get("sort_order", "desc")
+        index = {"rating": self.rating_index, "year": self.year_index}.get(sort_by)
+        if candidates is None and index is not None and index.covers_all_rows():
+            # Unfiltered "top N by rating/year": read straight off the presorted permutation.
+            row_ids = index.order_desc if sort_order == "desc" else index.order
+            return row_ids[:limit].tolist()
+
+        row_ids = np.arange(self.size) if candidates is None else candidates
+        if sort_by in ["rating", "year"] and len(row_ids) > 1:
+            values = (self.ratings if sort_by == "rating" else self.years)[row_ids]
+            row_ids = top_k(row_ids, values, limit, sort_order == "desc")
+
+        if limit is not None:
+            row_ids = row_ids[:limit]
+
+        return row_ids.tolist()
+
+    """
+    Runs an aggregation query (see aggregation.py): filters like select, then
+    groups the surviving rows and computes the aggregates with bincount and
+    reduceat. Only the returned groups are turned into dicts. Returns the
+    same rows as aggregation.aggregate_records.
+    """
+    def aggregate(self, query_json: Dict[str, Any]) -> List[Dict[str, Any]]:
+        plan = aggregate_plan(query_json)
+        row_ids, codes, labels = self._group_rows(self.filter_rows(query_json), plan["group_by"])
+        if not len(row_ids):
+            return aggregate_records([], query_json)
+
+        size = len(labels)
+        ratings = self.ratings[row_ids]
+        years = np.where(self.year_present[row_ids], self.years[row_ids], np.nan)
+        count = np.bincount(codes, minlength=size)
+        present = count > 0
+        # reduceat needs each group's rows contiguous; stable so sums keep row order.
+        order = np.argsort(codes, kind='stable')
+        starts = np.flatnonzero(np.r_[True, codes[order][1:] != codes[order][:-1]])
+
+        stats = {"count": count.astype(np.float64),
+                 "avg_rating": np.bincount(codes, weights=ratings, minlength=size) / np.maximum(count, 1)}
+        for name, ufunc, column in (("min_rating", np.minimum, ratings), ("max_rating", np.maximum, ratings),
+                                    ("min_year", np.fmin, years), ("max_year", np.fmax, years)):
+            values = np.full(size, np.nan)
+            values[present] = ufunc.reduceat(column[order], starts)
+            stats[name] = values
+
+        keep = present
+        if plan["count_min"] is not None:
+            keep = keep & (count >= plan["count_min"])
+        if plan["avg_rating_min"] is not None:
+            keep = keep & (stats["avg_rating"] >= plan["avg_rating_min"])
+        groups = np.flatnonzero(keep)
+
+        if plan["sort_by"] is not None:
+            values = stats[plan["sort_by"]][groups]
+            # Groups without a value (no known year) go last either way, as in aggregate_records.
+            values = np.where(np.isnan(values), -np.inf if plan["descending"] else np.inf, values)
+            groups = groups[np.argsort(-values if plan["descending"] else values, kind='stable')]
+        elif plan["descending"]:
+            groups = groups[::-1]
+
+        rows = []
+        for group in groups[:plan["limit"]].tolist():
+            group_stats = {"count": int(count[group]), "avg_rating": float(stats["avg_rating"][group])}
+            for name in ("min_rating", "max_rating"):
+                group_stats[name] = float(stats[name][group])
+            for name in ("min_year", "max_year"):
+                value = stats[name][group]
+                group_stats[name] = None if np.isnan(value) else int(value)
+            rows.append(group_row(plan, labels[group], group_stats))
+        return rows
+
+    """
+    Maps rows to their groups: returns (row ids, group code per row, group
+    labels), with labels in ascending order. A row with several genres
+    appears once per genre; rows without a year or director are dropped
+    when grouping by it.
+    """
+    def _group_rows(self, row_ids: np.ndarray, group_by: Optional[str]):
+        if group_by is None:
+            return row_ids, np.zeros(len(row_ids), dtype=np.int64), [None]
+
+        if group_by in ("year", "decade"):
+            row_ids = row_ids[self.year_present[row_ids]]
+            keys = self.years[row_ids].astype(np.int64)
+            if group_by == "decade":
+                keys = keys // 10 * 10
+            labels, codes = np.unique(keys, return_inverse=True)
+            return row_ids, codes, labels.tolist()
+
+        if group_by == "genre":
+            labels = sorted(self.genre_bits)
+            if not labels:
+                return row_ids[:0], np.zeros(0, dtype=np.int64), []
+            masks = self.genre_masks[row_ids]
+            grouped_rows, grouped_codes = [], []
+            for code, name in enumerate(labels):
+                hits = np.flatnonzero((masks & masks.dtype.type(self.genre_bits[name])) != 0)
+                grouped_rows.append(row_ids[hits])
+                grouped_codes.append(np.full(len(hits), code, dtype=np.int64))
+            return np.concatenate(grouped_rows), np.concatenate(grouped_codes), labels
+
+        director_ids, names = self.director_column()
+        directors = director_ids[row_ids]
+        row_ids, directors = row_ids[directors >= 0], directors[directors >= 0]
+        unique_ids, codes = np.unique(directors, return_inverse=True)
+        return row_ids, codes, [names[i] for i in unique_ids.tolist()]
+
+
+"""
+Presorted permutation index over a numeric column, answering range
+predicates with bisect instead of a full comparison pass.
+"""
+class RangeIndex:
+    def __init__(self, values: np.ndarray, present: Optional[np.ndarray] = None):
+        self.size = len(values)
+        self.present = present
+        row_ids = np.arange(self.size) if present is None else np.flatnonzero(present)
+        # Both permutations are stable, so ties stay in row order like list.sort.
+        self.order = row_ids[np.argsort(values[row_ids], kind='stable')]
+        self.order_desc = row_ids[np.argsort(-values[row_ids], kind='stable')]
+        self.sorted_values = values[self.order]
+
+    """
+    True when every row has a value, i.e. the permutations cover the whole dataset.
+    """
+    def covers_all_rows(self) -> bool:
+        return len(self.order) == self.size
+
+    """
+    Returns the sorted row ids with low <= value <= high (either bound may be None).
+    """
+    def between(self, low=None, high=None) -> np.ndarray:
+        start = 0 if low is None else int(np.searchsorted(self.sorted_values, low, side='left'))
+        end = len(self.order) if high is None else int(np.searchsorted(self.sorted_values, high, side='right'))
+        row_ids = self.order[start:end]
+        if len(row_ids) * 16 < self.size:
+            return np.sort(row_ids)
+        # Wide ranges: a mask pass is cheaper than sorting most of the dataset.
+        mask = np.zeros(self.size, dtype=bool)
+        mask[row_ids] = True
+        return np.flatnonzero(mask)
+
+
+"""
+Returns the first `k` of `row_ids` ordered by `values`, with the same tie order
+as a stable full sort (list.sort keeps ties in row order in both directions).
+Uses a partial partition so only the k winners are actually sorted.
+"""
+def top_k(row_ids: np.ndarray, values: np.ndarray, k: Optional[int], descending: bool) -> np.ndarray:
+    keys = -values if descending else values
+    if k is not None and k < len(keys):
+        kth = np.partition(keys, k - 1)[k - 1]
+        better = np.flatnonzero(keys < kth)
+        ties = np.flatnonzero(keys == kth)[:k - len(better)]
+        chosen = np.sort(np.concatenate([better, ties]))
+    else:
+        chosen = np.arange(len(keys))
+    return row_ids[chosen[np.argsort(keys[chosen], kind='stable')]]
@@ -0,0 +1,145 @@
+from typing import List, Dict, Any, Optional, Sequence
+
+import numpy as np
+
+NGRAM_SIZE = 3
+
+# Separators used when packing string columns into a single scannable blob.
+# They cannot appear in a normalized filter value, so a match never spans two values.
+ROW_SEPARATOR = "\x00"
+VALUE_SEPARATOR = "\x01"
+
+"""
+Normalizes a string filter value from the query JSON (strip + lowercase).
+Returns None for empty or IMDb-null ('\\N') values so the filter is skipped.
+"""
+def normalize_text_filter(value: Any) -> Optional[str]:
+    if isinstance(value, (int, float)):
+        value = str(value)
+
+    if isinstance(value, str):
+        cleaned_value = value.strip()
+        if cleaned_value not in ("", r'\N'):
+            return cleaned_value.lower()
+
+    return None
+
+
+"""
+A lowercased string column packed into one blob so that a substring filter
+is a single C-level scan instead of one `.lower()` + `in` per record.
+"""
+class TextColumn:
+    def __init__(self, values_per_row: Sequence[Sequence[str]]):
+        parts = []
+        starts = np.empty(len(values_per_row), dtype=np.int64)
+        offset = 0
+        for row_id, values in enumerate(values_per_row):
+            starts[row_id] = offset
+            text = VALUE_SEPARATOR.join(v.lower() for v in values)
+            parts.append(text)
+            offset += len(text) + 1
+        self.blob = ROW_SEPARATOR.join(parts)
+        self.starts = starts
+
+    """
+    Returns a boolean mask of the rows where any value contains `needle`.
+    """
+    def contains(self, needle: str) -> np.ndarray:
+        mask = np.zeros(len(self.starts), dtype=bool)
+        if not needle or ROW_SEPARATOR in needle or VALUE_SEPARATOR in needle:
+            return mask
+
+        blob, starts = self.blob, self.starts
+        pos = blob.find(needle)
+        while pos != -1:
+            row_id = int(np.searchsorted(starts, pos, side='right')) - 1
+            mask[row_id] = True
+            # Skip the rest of this row; one hit is enough.
+            next_row = row_id + 1
+            if next_row >= len(starts):
+                break
+            pos = blob.find(needle, int(starts[next_row]))
+        return mask
+
+
+"""
+Returns the set of character trigrams of an already-normalized string.
+"""
+def trigrams(text: str) -> set:
+    return {text[i:i + NGRAM_SIZE] for i in range(len(text) - NGRAM_SIZE + 1)}
+
+
+"""
+Trigram inverted index over the distinct normalized (lowercased) values of a
+string column, e.g. every actor name. Lookups keep "substring contains"
+semantics: trigram postings give candidate names, which are verified with a
+real substring test and then expanded to the rows that carry them.
+"""
+class NameIndex:
+    def __init__(self, values_per_row: Sequence[Sequence[str]]):
+        name_ids: Dict[str, int] = {}
+        name_rows: List[List[int]] = []
+        for row_id, values in enumerate(values_per_row):
+            for value in values:
+                key = value.lower()
+                name_id = name_ids.get(key)
+                if name_id is None:
+                    name_id = name_ids[key] = len(name_rows)
+                    name_rows.append([])
+                rows = name_rows[name_id]
+                if not rows or rows[-1] != row_id:
+                    rows.append(row_id)
+
+        self.names: List[str] = list(name_ids)
+
+        # name id -> row ids, stored CSR-style to avoid one array object per name.
+        self.row_offsets = np.zeros(len(name_rows) + 1, dtype=np.int64)
+        np.cumsum([len(rows) for rows in name_rows], out=self.row_offsets[1:])
+        self.row_ids = np.fromiter((r for rows in name_rows for r in rows), dtype=np.int32,
+                                   count=int(self.row_offsets[-1]))
+
+        postings: Dict[str, List[int]] = {}
+        for name_id, name in enumerate(self.names):
+            for gram in trigrams(name):
+                postings.setdefault(gram, []).append(name_id)
+        self.postings: Dict[str, np.ndarray] = {
+            gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()
+        }
+
+        # Needles shorter than a trigram are answered by scanning the distinct names once.
+        self._name_column = TextColumn([(name,) for name in self.names])
+
+    """
+    Returns the ids of the distinct names containing `needle` (already normalized).
+    """
+    def lookup_names(self, needle: str) -> np.ndarray:
+        if len(needle) < NGRAM_SIZE:
+            return np.flatnonzero(self._name_column.contains(needle)).astype(np.int32)
+
+        lists = []
+        for gram in trigrams(needle):
+            posting = self.postings.get(gram)
+            if posting is None:
+                return np.empty(0, dtype=np.int32)
+            lists.append(posting)
+
+        lists.sort(key=len)
+        candidates = lists[0]
+        for posting in lists[1:]:
+            candidates = np.intersect1d(candidates, posting, assume_unique=True)
+            if not len(candidates):
+                return candidates
+
+        names = self.names
+        return np.array([i for i in candidates.tolist() if needle in names[i]], dtype=np.int32)
+
+    """
+    Returns the sorted, unique row ids whose values contain `needle`.
+    """
+    def lookup_rows(self, needle: str) -> np.ndarray:
+        name_ids = self.lookup_names(needle)
+        if not len(name_ids):
+            return np.empty(0, dtype=np.int32)
+        offsets = self.row_offsets
+        return np.unique(np.concatenate([self.row_ids[offsets[i]:offsets[i + 1]] for i in name_ids.tolist()]))
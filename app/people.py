@@ -0,0 +1,160 @@
+import collections.abc
+import json
+import os
+from typing import List, Dict, Any, Optional, Sequence, Set, Tuple
+
+# Marks a movies_db.json in the people format; the original format is a plain list of movie records.
+PEOPLE_DB_FORMAT = "cinequery-people"
+PEOPLE_DB_VERSION = 1
+# Record fields that hold people, as a single id or a list of ids.
+PERSON_FIELD = "director"
+PEOPLE_LIST_FIELD = "actors"
+
+"""
+Every distinct actor and director name of a database, stored once. A
+person's id is their position in the table; `normalized` is the lowercased
+name that name filters match against.
+"""
+class PeopleTable:
+    def __init__(self, names: List[str], normalized: Optional[List[str]] = None):
+        self.names = names
+        self.normalized = normalized if normalized is not None else [name.lower() for name in names]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    """
+    Returns the ids of the people whose normalized name contains `needle`
+    (already normalized).
+    """
+    def matching_ids(self, needle: str) -> Set[int]:
+        return {person_id for person_id, name in enumerate(self.normalized) if needle in name}
+
+
+"""
+True when parsed JSON is a people-format database rather than a list of records.
+"""
+def is_people_db(data: Any) -> bool:
+    return isinstance(data, dict) and data.get("format") == PEOPLE_DB_FORMAT
+
+
+"""
+Converts movie records (director and actors as names) into a people table
+and movie records that hold ids instead. Field order is kept, so decoding
+returns records equal to the input, key order included.
+"""
+def encode_records(records: Sequence[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    person_ids: Dict[str, int] = {}
+
+    def person_id(name: Optional[str]) -> Optional[int]:
+        if not name:
+            return None
+        return person_ids.setdefault(name, len(person_ids))
+
+    movies = []
+    for record in records:
+        movie = dict(record)
+        if PERSON_FIELD in movie:
+            movie[PERSON_FIELD] = person_id(movie[PERSON_FIELD])
+        if PEOPLE_LIST_FIELD in movie:
+            movie[PEOPLE_LIST_FIELD] = [person_id(name) for name in movie[PEOPLE_LIST_FIELD]]
+        movies.append(movie)
+
+    people = [{"name": name, "normalized": name.lower()} for name in person_ids]
+    return people, movies
+
+
+"""
+Serializes movies one per line, compactly (worker-friendly: a slice at a time).
+"""
+def movie_lines(movies: Sequence[Dict[str, Any]]) -> List[str]:
+    return [json.dumps(movie, separators=(",", ":")) for movie in movies]
+
+
+"""
+Writes a people-format database: a small header, the people table, then one
+movie per line. Written aside and renamed into place, so a reloading engine
+never reads a partial file.
+"""
+def write_people_db(filepath: str, people: List[Dict[str, Any]], lines: Sequence[str]):
+    tmp_path = f"{filepath}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(f'{{"format":"{PEOPLE_DB_FORMAT}","version":{PEOPLE_DB_VERSION},\n"people":[\n')
+        f.write(",\n".join(json.dumps(person, separators=(",", ":")) for person in people))
+        f.write('\n],\n"movies":[\n')
+        f.write(",\n".join(lines))
+        f.write("\n]}\n")
+    os.replace(tmp_path, filepath)
+
+
+"""
+Sequence of movie records over a people-format database. The records keep
+person ids, sharing one int object per person, and are returned with names
+on access, in the same shape as the plain list format; so every name is held
+in memory once instead of once per credit.
+"""
+class InternedRows(collections.abc.Sequence):
+    def __init__(self, movies: List[Dict[str, Any]], people: PeopleTable):
+        self.people = people
+        self.movies = movies
+
+    """
+    Builds the rows from parsed people-format JSON. Ids and genre names are
+    replaced by shared objects as they are read.
+    """
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "InternedRows":
+        if data.get("version") != PEOPLE_DB_VERSION:
+            raise ValueError(f"Unsupported people database version {data.get('version')}.")
+        people = data["people"]
+        table = PeopleTable([p["name"] for p in people], [p.get("normalized") or p["name"].lower() for p in people])
+
+        ids = list(range(len(table)))
+        genres: Dict[str, str] = {}
+        movies = data["movies"]
+        for movie in movies:
+            if movie.get(PERSON_FIELD) is not None:
+                movie[PERSON_FIELD] = ids[movie[PERSON_FIELD]]
+            if PEOPLE_LIST_FIELD in movie:
+                movie[PEOPLE_LIST_FIELD] = [ids[i] for i in movie[PEOPLE_LIST_FIELD]]
+            if "genres" in movie:
+                movie["genres"] = [genres.setdefault(g, g) for g in movie["genres"]]
+        return cls(movies, table)
+
+    def __len__(self) -> int:
+        return len(self.movies)
+
+    def __getitem__(self, row_id):
+        if isinstance(row_id, slice):
+            return [self.record(i) for i in range(*row_id.indices(len(self)))]
+        return self.record(row_id if row_id >= 0 else row_id + len(self))
+
+    """
+    Materializes one row in the same shape as a plain-format record.
+    """
+    def record(self, row_id: int) -> Dict[str, Any]:
+        names = self.people.names
+        record = dict(self.movies[row_id])
+        if PERSON_FIELD in record:
+            person_id = record[PERSON_FIELD]
+            record[PERSON_FIELD] = names[person_id] if person_id is not None else None
+        if PEOPLE_LIST_FIELD in record:
+            record[PEOPLE_LIST_FIELD] = [names[i] for i in record[PEOPLE_LIST_FIELD]]
+        return record
+
+    """
+    Returns the records whose director and actors match the given
+    (normalized) substrings; None skips a filter. Each name is resolved to
+    person ids once, then rows are kept by integer membership, and only the
+    surviving rows are materialized.
+    """
+    def filter_people(self, director: Optional[str], actor: Optional[str]) -> List[Dict[str, Any]]:
+        movies = self.movies
+        row_ids = range(len(movies))
+        if director:
+            director_ids = self.people.matching_ids(director)
+            row_ids = [i for i in row_ids if movies[i].get(PERSON_FIELD) in director_ids]
+        if actor:
+            actor_ids = self.people.matching_ids(actor)
+            row_ids = [i for i in row_ids if not actor_ids.isdisjoint(movies[i].get(PEOPLE_LIST_FIELD, ()))]
+        return [self.record(i) for i in row_ids]
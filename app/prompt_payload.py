@@ -0,0 +1,107 @@
+import os
+from typing import List, Dict, Any, Optional
+
+from aggregation import is_aggregate_query
+from name_index import normalize_text_filter
+from rate_limit import CHARS_PER_TOKEN
+
+# Most estimated tokens of row data sent to the synthesis call; rows past it are summarized as a count.
+PROMPT_TOKEN_BUDGET = int(os.environ.get("CINEQUERY_PROMPT_TOKEN_BUDGET", "1500"))
+# Actors kept per movie (the ones matching an actor filter come first).
+PROMPT_MAX_ACTORS = int(os.environ.get("CINEQUERY_PROMPT_MAX_ACTORS", "3"))
+
+# Column order for movie rows; fields not listed here are never sent.
+MOVIE_FIELDS = ["title", "year", "rating", "genres", "director", "actors"]
+# Sent for every movie row; the other fields only when the query filters on them.
+DISPLAY_FIELDS = ["title", "year", "rating"]
+# Movie field each query JSON filter is about.
+FILTER_FIELDS = {"title_keywords": "title", "actor": "actors", "director": "director", "genre": "genres",
+                 "year_min": "year", "year_max": "year", "rating_min": "rating"}
+SEPARATOR = "|"
+
+
+def _estimate(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        value = ", ".join(str(v) for v in value)
+    return str(value).replace(SEPARATOR, "/").replace("\n", " ")
+
+
+"""
+Moves the actors matching the query's actor filter to the front, then keeps
+at most max_actors.
+"""
+def _trim_actors(actors: List[str], needle: Any, max_actors: int) -> List[str]:
+    needle = normalize_text_filter(needle)
+    if needle:
+        actors = [a for a in actors if needle in a.lower()] + [a for a in actors if needle not in a.lower()]
+    return actors[:max_actors]
+
+
+"""
+Projects movie rows onto the fields worth sending: the display fields plus
+the fields the query filters on, minus those empty in every row, with actor
+lists trimmed. Aggregate rows are already minimal and keep all their columns.
+"""
+def project_rows(rows: List[Dict[str, Any]], query_json: Dict[str, Any],
+                 max_actors: int = PROMPT_MAX_ACTORS) -> List[Dict[str, Any]]:
+    if rows and is_aggregate_query(query_json):
+        fields = list(rows[0])
+    else:
+        wanted = set(DISPLAY_FIELDS) | {FILTER_FIELDS[k] for k in FILTER_FIELDS if query_json.get(k) not in (None, "")}
+        fields = [f for f in MOVIE_FIELDS if f in wanted]
+    columns = [f for f in fields if any(row.get(f) not in (None, "", []) for row in rows)]
+    projected = []
+    for row in rows:
+        item = {f: row.get(f) for f in columns}
+        if isinstance(item.get("actors"), list):
+            item["actors"] = _trim_actors(item["actors"], query_json.get("actor"), max_actors)
+        projected.append(item)
+    return projected
+
+
+"""
+Builds the row data for the synthesis prompt as a compact pipe-separated
+table, within token_budget estimated tokens. Columns with the same value in
+every row (typically the ones the query filtered on) are stated once above
+the table instead of repeated. Rows that do not fit are left out and their
+count is stated, so the model does not present the table as complete.
+Returns {"text", "rows_included", "rows_omitted", "estimated_tokens"}.
+"""
+def build_prompt_payload(rows: List[Dict[str, Any]], query_json: Optional[Dict[str, Any]] = None,
+                         token_budget: int = PROMPT_TOKEN_BUDGET) -> Dict[str, Any]:
+    projected = project_rows(rows, query_json or {})
+    columns = list(projected[0]) if projected else []
+
+    shared = []
+    if len(projected) > 1:
+        shared = [c for c in columns if c != "title" and all(r[c] == projected[0][c] for r in projected)]
+    columns = [c for c in columns if c not in shared]
+
+    lines = [f"Columns: {SEPARATOR.join(columns)}"]
+    if shared:
+        lines.append("Same for every row: " + "; ".join(f"{c} = {_cell(projected[0][c])}" for c in shared))
+    used = sum(_estimate(line) for line in lines)
+
+    included = 0
+    for row in projected:
+        line = SEPARATOR.join(_cell(row[c]) for c in columns)
+        cost = _estimate(line)
+        if included and used + cost > token_budget:
+            break
+        lines.append(line)
+        used += cost
+        included += 1
+
+    omitted = len(projected) - included
+    if omitted:
+        lines.append(f"({omitted} more matching rows not shown)")
+        used += _estimate(lines[-1])
+
+    return {"text": "\n".join(lines), "rows_included": included, "rows_omitted": omitted,
+            "estimated_tokens": used}
@@ -0,0 +1,166 @@
+import time
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from name_index import NameIndex, normalize_text_filter, trigrams, NGRAM_SIZE
+
+# Tie-breaker between predicates with the same estimate: cheapest access method first.
+ACCESS_COST = {"range": 0, "genre": 1, "text": 2}
+
+RATING_BUCKETS_PER_POINT = 10
+
+"""
+One filter from the query JSON, with the planner's row estimate.
+"""
+class Predicate:
+    def __init__(self, name: str, kind: str, value: Any, estimated_rows: int):
+        self.name = name
+        self.kind = kind
+        self.value = value
+        self.estimated_rows = estimated_rows
+        self.actual_rows: Optional[int] = None
+        self.elapsed_ms: Optional[float] = None
+
+    def to_dict(self, access: str) -> Dict[str, Any]:
+        return {"predicate": self.name, "value": self.value, "access": access,
+                "estimated_rows": self.estimated_rows, "actual_rows": self.actual_rows,
+                "elapsed_ms": self.elapsed_ms}
+
+
+"""
+Statistics gathered once at load time: genre frequencies, year and rating
+histograms, and (via the name indexes) trigram postings sizes.
+"""
+class TableStats:
+    def __init__(self, store):
+        self.size = store.size
+
+        self.genre_counts: Dict[str, int] = {
+            name: int(np.count_nonzero(store.genre_masks & store.genre_masks.dtype.type(bit)))
+            for name, bit in store.genre_bits.items()
+        }
+
+        years = store.years[store.year_present]
+        self.year_base = int(years.min()) if len(years) else 0
+        # Cumulative per-year counts: rows with year < base + i is year_cumulative[i].
+        self.year_cumulative = np.concatenate(
+            [[0], np.cumsum(np.bincount(years - self.year_base))]) if len(years) else np.zeros(1, dtype=np.int64)
+
+        buckets = np.round(store.ratings * RATING_BUCKETS_PER_POINT).astype(np.int64).clip(min=0)
+        self.rating_cumulative = np.concatenate([[0], np.cumsum(np.bincount(buckets))])
+
+    def estimate_genre(self, genre_lower: str) -> int:
+        total = sum(count for name, count in self.genre_counts.items() if genre_lower in name.lower())
+        return min(total, self.size)
+
+    def estimate_year(self, year_min: Optional[int], year_max: Optional[int]) -> int:
+        cumulative = self.year_cumulative
+        last = len(cumulative) - 1
+
+        def rows_below(year) -> int:
+            return int(cumulative[int(np.clip(np.ceil(year) - self.year_base, 0, last))])
+
+        low = 0 if year_min is None else rows_below(year_min)
+        high = int(cumulative[-1]) if year_max is None else rows_below(np.floor(year_max) + 1)
+        return max(high - low, 0)
+
+    def estimate_rating(self, rating_min: float) -> int:
+        cumulative = self.rating_cumulative
+        bucket = int(np.clip(np.ceil(rating_min * RATING_BUCKETS_PER_POINT - 1e-9), 0, len(cumulative) - 1))
+        return int(cumulative[-1] - cumulative[bucket])
+
+    """
+    Upper bound on the rows a substring lookup can return: the rows carried by
+    the names in the needle's smallest trigram posting.
+    """
+    def estimate_text(self, index: NameIndex, needle: str) -> int:
+        if len(needle) < NGRAM_SIZE:
+            return self.size
+        smallest = None
+        for gram in trigrams(needle):
+            posting = index.postings.get(gram)
+            if posting is None:
+                return 0
+            if smallest is None or len(posting) < len(smallest):
+                smallest = posting
+        offsets = index.row_offsets
+        return min(int((offsets[smallest + 1] - offsets[smallest]).sum()), self.size)
+
+
+"""
+Cost-based planner for the QUERY_SCHEMA filters. The predicate with the
+smallest estimated result drives the query through its index; the rest are
+evaluated only on the survivors, in increasing order of their estimates.
+"""
+class QueryPlanner:
+    def __init__(self, store):
+        self.store = store
+        self.stats = TableStats(store)
+
+    """
+    Returns the query's predicates in execution order.
+    """
+    def plan(self, query_json: Dict[str, Any]) -> List[Predicate]:
+        store, stats = self.store, self.stats
+        predicates = []
+
+        for name in ("director", "actor", "title_keywords"):
+            needle = normalize_text_filter(query_json.get(name))
+            if needle:
+                predicates.append(Predicate(name, "text", needle,
+                                            stats.estimate_text(store.name_index(name), needle)))
+
+        genre_lower = normalize_text_filter(query_json.get("genre"))
+        if genre_lower:
+            predicates.append(Predicate("genre", "genre", genre_lower, stats.estimate_genre(genre_lower)))
+
+        year_min, year_max = query_json.get("year_min"), query_json.get("year_max")
+        if year_min is not None or year_max is not None:
+            predicates.append(Predicate("year", "range", (year_min, year_max),
+                                        stats.estimate_year(year_min, year_max)))
+
+        rating_min = query_json.get("rating_min")
+        if rating_min is not None:
+            predicates.append(Predicate("rating", "range", (rating_min, None), stats.estimate_rating(rating_min)))
+
+        predicates.sort(key=lambda p: (p.estimated_rows, ACCESS_COST[p.kind]))
+        return predicates
+
+    """
+    Runs the plan and returns the surviving row ids (ascending), or None when
+    the query has no filters, together with the executed predicates.
+    """
+    def execute(self, query_json: Dict[str, Any]) -> Tuple[Optional[np.ndarray], List[Predicate]]:
+        predicates = self.plan(query_json)
+        candidates: Optional[np.ndarray] = None
+        for predicate in predicates:
+            if candidates is not None and not len(candidates):
+                # Nothing left to filter; the remaining predicates are skipped.
+                predicate.actual_rows = 0
+                continue
+            started = time.perf_counter()
+            candidates = self.store.evaluate(predicate, candidates)
+            predicate.elapsed_ms = round((time.perf_counter() - started) * 1000, 3)
+            predicate.actual_rows = len(candidates)
+        return candidates, predicates
+
+    """
+    Describes the chosen plan with estimated versus actual row counts per step.
+    """
+    def explain(self, query_json: Dict[str, Any]) -> Dict[str, Any]:
+        candidates, predicates = self.execute(query_json)
+        steps = [p.to_dict("index" if i == 0 else "filter") for i, p in enumerate(predicates)]
+
+        # Combined estimate assumes the predicates are independent.
+        size = self.stats.size
+        estimated = float(size)
+        for p in predicates:
+            estimated *= p.estimated_rows / size if size else 0.0
+
+        return {
+            "total_rows": size,
+            "plan": steps,
+            "estimated_rows": int(round(estimated)),
+            "actual_rows": size if candidates is None else len(candidates),
+        }
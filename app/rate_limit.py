@@ -0,0 +1,361 @@
+import email.utils
+import os
+import random
+import threading
+import time
+from typing import Dict, Any, Optional, Tuple
+
+import metrics
+
+# Upstream quota shared by every thread of the process; 0 disables a limit.
+GEMINI_RPM = float(os.environ.get("GEMINI_RPM", "60"))
+GEMINI_TPM = float(os.environ.get("GEMINI_TPM", "1000000"))
+# Total time one LLM call may take, including queueing and retries.
+GEMINI_DEADLINE = float(os.environ.get("GEMINI_DEADLINE", "20"))
+GEMINI_MAX_ATTEMPTS = int(os.environ.get("GEMINI_MAX_ATTEMPTS", "4"))
+# Consecutive failures that open the circuit, and how long it stays open.
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("GEMINI_CIRCUIT_FAILURES", "5"))
+CIRCUIT_RESET_SECONDS = float(os.environ.get("GEMINI_CIRCUIT_RESET", "30"))
+# Retries allowed per first attempt, process-wide, so retries cannot multiply load during an outage.
+RETRY_BUDGET_RATIO = 0.2
+RETRY_BUDGET_MINIMUM = 10.0
+
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8.0
+CHARS_PER_TOKEN = 4
+
+"""
+Parses a Retry-After header (delta-seconds or HTTP date) into seconds.
+"""
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+"""
+Rough token count for the tokens-per-minute bucket, reconciled with the
+reported usage once the response arrives.
+"""
+def estimate_tokens(prompt: str, system_instruction: str, output_allowance: int) -> int:
+    return (len(prompt) + len(system_instruction)) // CHARS_PER_TOKEN + output_allowance
+
+
+"""
+Token bucket refilled continuously at rate_per_minute, holding at most one
+minute of capacity. Reservations may drive the level negative: later callers
+then wait for the deficit, so waiting requests are served in arrival order.
+Not thread-safe on its own; RateLimiter holds the lock.
+"""
+class TokenBucket:
+    def __init__(self, rate_per_minute: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = rate_per_minute
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    """
+    Seconds until `amount` could be taken.
+    """
+    def wait_for(self, amount: float, now: float) -> float:
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+    def take(self, amount: float):
+        if self.rate > 0:
+            self.level -= min(amount, self.capacity)
+
+    def give_back(self, amount: float):
+        if self.rate > 0:
+            self.level = min(self.capacity, self.level + amount)
+
+
+"""
+Process-wide request and token limits for the Gemini API, shared by every
+thread (and the event loop). A 429 with Retry-After pauses all callers.
+"""
+class RateLimiter:
+    def __init__(self, requests_per_minute: float = GEMINI_RPM, tokens_per_minute: float = GEMINI_TPM):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+        self.admitted = 0
+        self.shed = 0
+        self.queued = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    """
+    Reserves one request and `tokens` tokens. Returns the seconds the caller
+    must wait before sending, or None (shed, nothing reserved) when that wait
+    would exceed max_wait.
+    """
+    def reserve(self, tokens: float, max_wait: float) -> Optional[float]:
+        with self._lock:
+            now = time.monotonic()
+            wait = max(self._paused_until - now, self.requests.wait_for(1, now), self.tokens.wait_for(tokens, now))
+            if wait > max_wait:
+                self.shed += 1
+                return None
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self.admitted += 1
+            if wait > 0:
+                self.queued += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+            return wait
+
+    """
+    Returns a reservation whose request was not sent after all.
+    """
+    def release(self, tokens: float):
+        with self._lock:
+            self.requests.give_back(1)
+            self.tokens.give_back(tokens)
+            self.admitted -= 1
+
+    """
+    Corrects a reservation once the actual token usage is known.
+    """
+    def reconcile(self, estimated_tokens: float, actual_tokens: float):
+        with self._lock:
+            if actual_tokens > estimated_tokens:
+                self.tokens.take(actual_tokens - estimated_tokens)
+            else:
+                self.tokens.give_back(estimated_tokens - actual_tokens)
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"admitted": self.admitted, "shed": self.shed, "queued": self.queued,
+                    "avg_queue_wait_ms": round(self.total_wait / self.admitted * 1000, 1) if self.admitted else 0.0,
+                    "max_queue_wait_ms": round(self.max_wait * 1000, 1),
+                    "paused_for_s": round(max(self._paused_until - time.monotonic(), 0.0), 1)}
+
+
+"""
+Fails fast while the upstream is degraded. After failure_threshold
+consecutive failures the circuit opens for reset_timeout seconds (or the
+upstream's Retry-After, if longer); then a single probe call is let
+through, and its outcome closes or re-opens the circuit. A probe that ends
+without an outcome must be released, or the circuit would stay half-open.
+"""
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = CIRCUIT_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self._open_until = 0.0
+        self.opened = 0
+        self.fast_failed = 0
+
+    """
+    Returns (allowed, retry_after seconds when not allowed, whether the call
+    is the half-open probe). With take_probe=False a circuit that is due for
+    a probe only reports it as allowed, without taking the probe.
+    """
+    def allow(self, take_probe: bool = True) -> Tuple[bool, float, bool]:
+        with self._lock:
+            now = time.monotonic()
+            if self.state == "closed":
+                return True, 0.0, False
+            if self.state == "open" and now >= self._open_until:
+                if take_probe:
+                    self.state = "half_open"
+                return True, 0.0, take_probe
+            self.fast_failed += 1
+            # While half-open, wait for the probe's outcome.
+            return False, max(self._open_until - now, 1.0), False
+
+    """
+    Re-opens a half-open circuit whose probe was never answered. The open
+    period is already over, so the next call becomes the new probe.
+    """
+    def release_probe(self):
+        with self._lock:
+            if self.state == "half_open":
+                self.state = "open"
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self, retry_after: Optional[float] = None):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self._open_until = time.monotonic() + max(self.reset_timeout, retry_after or 0.0)
+                self.opened += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures, "opened": self.opened,
+                    "fast_failed": self.fast_failed}
+
+
+"""
+Process-wide retry allowance: every first attempt deposits `ratio` of a
+retry, every retry spends one. During an outage retries stop at roughly
+ratio x normal traffic instead of multiplying it.
+"""
+class RetryBudget:
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, minimum: float = RETRY_BUDGET_MINIMUM):
+        self.ratio = ratio
+        self.maximum = minimum
+        self.balance = minimum
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.denied = 0
+
+    def deposit(self):
+        with self._lock:
+            self.balance = min(self.maximum, self.balance + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self.balance < 1:
+                self.denied += 1
+                return False
+            self.balance -= 1
+            self.retries += 1
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"retries": self.retries, "denied": self.denied, "balance": round(self.balance, 2)}
+
+
+"""
+Limiter, circuit breaker and retry budget for all Gemini calls of an engine.
+"""
+class GeminiGuard:
+    def __init__(self, limiter: Optional[RateLimiter] = None, breaker: Optional[CircuitBreaker] = None,
+                 retry_budget: Optional[RetryBudget] = None, deadline: float = GEMINI_DEADLINE,
+                 max_attempts: int = GEMINI_MAX_ATTEMPTS):
+        self.limiter = limiter or RateLimiter()
+        self.breaker = breaker or CircuitBreaker()
+        self.retry_budget = retry_budget or RetryBudget()
+        self.deadline = deadline
+        self.max_attempts = max_attempts
+
+    def begin(self, estimated_tokens: int) -> "CallBudget":
+        self.retry_budget.deposit()
+        return CallBudget(self, estimated_tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"limiter": self.limiter.stats(), "circuit": self.breaker.stats(),
+                "retry_budget": self.retry_budget.stats()}
+
+
+"""
+Attempt bookkeeping for one logical LLM call: its deadline, attempt count
+and token reservation. The HTTP loops in the engine ask it whether to send,
+how long to wait, and whether a failure may be retried.
+"""
+class CallBudget:
+    def __init__(self, guard: GeminiGuard, estimated_tokens: int):
+        self.guard = guard
+        self.estimated_tokens = estimated_tokens
+        self.deadline = time.monotonic() + guard.deadline
+        self.attempt = 0
+        self.probe = False
+
+    def remaining(self) -> float:
+        return max(self.deadline - time.monotonic(), 0.0)
+
+    """
+    Returns (seconds to wait before sending, None), or (0, error response)
+    when the circuit is open or the rate limit would hold the call past its
+    deadline. The limiter is reserved before a half-open probe is taken, so
+    a shed call never holds the probe.
+    """
+    def admit(self) -> Tuple[float, Optional[Dict[str, Any]]]:
+        breaker, limiter = self.guard.breaker, self.guard.limiter
+        allowed, retry_after, _ = breaker.allow(take_probe=False)
+        if not allowed:
+            return 0.0, self._unavailable(retry_after)
+        wait = limiter.reserve(self.estimated_tokens, self.remaining())
+        if wait is None:
+            return 0.0, {"status": "error", "retry_after": 1.0,
+                         "message": "The language model is over its rate limit. Please retry shortly."}
+        allowed, retry_after, self.probe = breaker.allow()
+        if not allowed:
+            # Another call took the probe in the meantime.
+            limiter.release(self.estimated_tokens)
+            return 0.0, self._unavailable(retry_after)
+        if wait:
+            metrics.add(queued_ms=round(wait * 1000, 3))
+        return wait, None
+
+    @staticmethod
+    def _unavailable(retry_after: float) -> Dict[str, Any]:
+        return {"status": "error", "retry_after": round(retry_after, 1),
+                "message": "The language model is temporarily unavailable. Please retry shortly."}
+
+    """
+    Per-attempt HTTP timeout, never past the deadline.
+    """
+    def timeout(self, default: float) -> float:
+        return max(min(default, self.remaining()), 0.1)
+
+    def succeeded(self, total_tokens: Optional[int] = None):
+        self.guard.breaker.record_success()
+        self.probe = False
+        if total_tokens:
+            self.guard.limiter.reconcile(self.estimated_tokens, total_tokens)
+
+    """
+    Records a failed attempt (429, 5xx or a transport error) and returns the
+    jittered delay before the next attempt, or None when the call should give
+    up: out of attempts, retry budget, or time before the deadline.
+    """
+    def failed(self, status_code: Optional[int] = None, retry_after_header: Optional[str] = None) -> Optional[float]:
+        guard = self.guard
+        retry_after = parse_retry_after(retry_after_header)
+        if status_code == 429 and retry_after:
+            guard.limiter.pause(retry_after)
+        guard.breaker.record_failure(retry_after)
+        self.probe = False
+
+        self.attempt += 1
+        if self.attempt >= guard.max_attempts:
+            return None
+        delay = max(random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** self.attempt)), retry_after or 0.0)
+        if delay >= self.remaining() or not guard.retry_budget.withdraw():
+            return None
+        metrics.GEMINI_RETRIES.inc()
+        metrics.add(retries=1)
+        return delay
+
+    """
+    Called when the call ends, however it ends (an unexpected error or a
+    cancellation included): releases the half-open probe if no outcome was
+    recorded for it.
+    """
+    def release(self):
+        if self.probe:
+            self.guard.breaker.release_probe()
+            self.probe = False
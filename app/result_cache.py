@@ -0,0 +1,156 @@
+import array
+import base64
+import binascii
+import collections
+import json
+import os
+import threading
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+
+from aggregation import AGGREGATES, GROUP_BY_FIELDS
+
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("CINEQUERY_RESULT_CACHE_SIZE", "512"))
+# Rows a cursor keeps; paging stops there even when more movies matched.
+RESULT_CURSOR_MAX_ROWS = int(os.environ.get("CINEQUERY_RESULT_CURSOR_ROWS", "1000"))
+RESULT_PAGE_DEFAULT_ROWS = 25
+RESULT_PAGE_MAX_ROWS = 100
+
+# The query JSON fields a cursor may carry, with the type or values each accepts.
+TEXT_FIELDS = ("title_keywords", "actor", "director", "genre")
+NUMBER_FIELDS = ("year_min", "year_max", "rating_min")
+CHOICE_FIELDS = {"sort_by": ["rating", "year"] + AGGREGATES, "sort_order": ["asc", "desc"],
+                 "group_by": GROUP_BY_FIELDS}
+HAVING_FIELDS = ("count_min", "avg_rating_min")
+
+
+"""
+Query JSON in a canonical text form: keys sorted, empty values and the limit
+dropped. "Top 5 horror movies" and "top 20 horror movies" are prefixes of the
+same ordered result, so they share a cursor.
+"""
+def canonical_query(query_json: Dict[str, Any]) -> str:
+    fields = {k: v for k, v in query_json.items() if k != "limit" and v not in (None, "", [], {})
+              and k in TEXT_FIELDS + NUMBER_FIELDS + tuple(CHOICE_FIELDS) + ("aggregates", "having")}
+    return json.dumps(fields, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+"""
+A cursor id names the canonical query and the snapshot version it ran
+against, so any worker process can rebuild a cursor it does not hold
+(evicted, or created by another worker) without going back to the LLM.
+"""
+def encode_cursor(query_json: Dict[str, Any], version: str) -> str:
+    encoded = base64.urlsafe_b64encode(canonical_query(query_json).encode("utf-8")).decode("ascii").rstrip("=")
+    return f"{version}.{encoded}"
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+"""
+True when every field of a decoded cursor query has the type the engine
+expects. Cursors come from clients, so a crafted one must not reach the
+planner with, say, a string rating_min.
+"""
+def valid_cursor_query(query_json: Dict[str, Any]) -> bool:
+    for key, value in query_json.items():
+        if key in TEXT_FIELDS:
+            ok = isinstance(value, str)
+        elif key in NUMBER_FIELDS:
+            ok = _is_number(value)
+        elif key in CHOICE_FIELDS:
+            ok = value in CHOICE_FIELDS[key]
+        elif key == "aggregates":
+            ok = isinstance(value, list) and all(item in AGGREGATES for item in value)
+        elif key == "having":
+            ok = isinstance(value, dict) and all(name in HAVING_FIELDS and _is_number(number)
+                                                 for name, number in value.items())
+        else:
+            ok = False
+        if not ok:
+            return False
+    return True
+
+"""
+Returns (query_json, version) for a cursor id, or None if it is malformed
+or names fields of the wrong type.
+"""
+def decode_cursor(cursor_id: str) -> Optional[Tuple[Dict[str, Any], str]]:
+    version, _, encoded = (cursor_id or "").rpartition(".")
+    if not version or not encoded:
+        return None
+    try:
+        query_json = json.loads(base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4)))
+    except (binascii.Error, ValueError):
+        return None
+    if not isinstance(query_json, dict) or not valid_cursor_query(query_json):
+        return None
+    return query_json, version
+
+
+"""
+The ordered results of one query against one snapshot version. Movie results
+from the columnar store are kept as row ids (8 bytes each) and turned into
+rows only for the page being read; aggregate groups and results of the list
+scan are kept as the rows themselves. `truncated` is set when more rows
+matched than the cursor keeps.
+"""
+class ResultCursor:
+    def __init__(self, cursor_id: str, version: str, row_ids: Optional[Sequence[int]] = None,
+                 rows: Optional[List[Dict[str, Any]]] = None, truncated: bool = False):
+        self.cursor_id = cursor_id
+        self.version = version
+        self.row_ids = array.array("q", row_ids) if row_ids is not None else None
+        self.rows = rows
+        self.truncated = truncated
+
+    def __len__(self) -> int:
+        return len(self.row_ids) if self.row_ids is not None else len(self.rows)
+
+    def page(self, records: Sequence[Dict[str, Any]], offset: int, limit: Optional[int]) -> List[Dict[str, Any]]:
+        end = None if limit is None else offset + limit
+        if self.row_ids is not None:
+            return [records[row_id] for row_id in self.row_ids[offset:end]]
+        return self.rows[offset:end]
+
+
+"""
+Bounded LRU of ResultCursors by cursor id. Since the id includes the
+snapshot version, a reload never serves rows of the previous database.
+"""
+class ResultCache:
+    def __init__(self, max_entries: int = RESULT_CACHE_MAX_ENTRIES, max_rows: int = RESULT_CURSOR_MAX_ROWS):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self._entries: "collections.OrderedDict[str, ResultCursor]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, cursor_id: str) -> Optional[ResultCursor]:
+        with self._lock:
+            cursor = self._entries.get(cursor_id)
+            if cursor is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(cursor_id)
+            self.hits += 1
+            return cursor
+
+    def put(self, cursor: ResultCursor) -> ResultCursor:
+        with self._lock:
+            self._entries[cursor.cursor_id] = cursor
+            self._entries.move_to_end(cursor.cursor_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return cursor
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                    "entries": len(self._entries), "max_rows": self.max_rows}
@@ -1,16 +1,47 @@
-from flask import Flask, request, jsonify
+import hmac
+import json
+import math
+import os
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import cross_origin
+import metrics
 from llm_interface import CineQueryEngine
+from result_cache import RESULT_PAGE_DEFAULT_ROWS
 
 app = Flask(__name__)
 
+# Token required by the /admin endpoints; when unset they only accept loopback requests.
+ADMIN_TOKEN = os.environ.get("CINEQUERY_ADMIN_TOKEN", "")
+# Largest number of queries accepted by /query/batch.
+BATCH_MAX_QUERIES = int(os.environ.get("CINEQUERY_BATCH_MAX_QUERIES", "100"))
+# Seconds between database file checks; 0 disables the watcher.
+WATCH_INTERVAL = float(os.environ.get("CINEQUERY_WATCH_INTERVAL", "0") or 0)
+DB_PATH = os.environ.get("CINEQUERY_DB_PATH", "data/processed/movies_db.json")
+# Set by gunicorn.conf.py when this module is imported once in the gunicorn master and forked into the workers.
+PRELOAD = os.environ.get("CINEQUERY_PRELOAD", "0") == "1"
+
 try:
-    QUERY_ENGINE = CineQueryEngine()
+    QUERY_ENGINE = CineQueryEngine(DB_PATH)
     print("CineQuery Engine successfully loaded.")
 except Exception as e:
     print(f"FATAL ERROR: Could not initialize CineQueryEngine. Database might be missing. Error: {e}")
     QUERY_ENGINE = None
 
+"""
+Starts the per-process background work (the database watcher). Threads do
+not survive a fork, so in preload mode this runs in each worker after it is
+forked (gunicorn's post_fork hook) rather than at import.
+"""
+def start_worker():
+    if QUERY_ENGINE and WATCH_INTERVAL > 0:
+        QUERY_ENGINE.start_watching(WATCH_INTERVAL)
+
+if PRELOAD:
+    if QUERY_ENGINE:
+        QUERY_ENGINE.freeze()
+else:
+    start_worker()
+
 @app.route('/')
 def home():
     return jsonify({
@@ -31,20 +62,23 @@ def handle_query():
         if request.method == 'POST':
             data = request.get_json()
             user_query = data.get('query')
+            debug_timings = wants_debug_timings(data.get('debug_timings'))
         elif request.method == 'GET':
             user_query = request.args.get('query')
+            debug_timings = wants_debug_timings(request.args.get('debug_timings'))
 
         if not user_query:
             return jsonify({"status": "error", "message": "Missing 'query' parameter in request body."}), 400
 
         print(f"Received query: {user_query}")
 
-        result = QUERY_ENGINE.run_cinequery(user_query)
+        result = QUERY_ENGINE.run_cinequery(user_query, debug_timings)
 
         if result['status'] == 'success':
             return jsonify(result), 200
         else:
-            return jsonify(result), 500
+            status, headers = error_status(result)
+            return jsonify(result), status, headers
 
     except ValueError as e:
         return jsonify({"status": "error", "message": f"Configuration Error: {e}"}), 500
@@ -53,6 +87,204 @@ def handle_query():
         return jsonify({"status": "error", "message": "An unexpected server error occurred."}), 500
 
 
+"""
+True when a request asked for the per-stage timings in its response
+("debug_timings": true in the body, or ?debug_timings=1).
+"""
+def wants_debug_timings(value) -> bool:
+    return value is True or (isinstance(value, str) and value.lower() in ("1", "true", "yes"))
+
+
+"""
+HTTP status and headers for a failed query: 503 with Retry-After when the
+LLM call was shed by the rate limiter or circuit breaker, else 500.
+"""
+def error_status(result):
+    if 'retry_after' in result:
+        return 503, {"Retry-After": str(math.ceil(result['retry_after']))}
+    return 500, {}
+
+
+"""
+Validates a /query/batch body; returns (queries, max_concurrency, error response).
+"""
+def parse_batch_request(data):
+    queries = data.get('queries') if isinstance(data, dict) else None
+    if not isinstance(queries, list) or not queries:
+        return None, None, {"status": "error", "message": "Missing 'queries' list in request body."}
+    if len(queries) > BATCH_MAX_QUERIES:
+        return None, None, {"status": "error", "message": f"A batch may contain at most {BATCH_MAX_QUERIES} queries."}
+    max_concurrency = data.get('max_concurrency')
+    if max_concurrency is not None and (not isinstance(max_concurrency, int) or max_concurrency < 1):
+        return None, None, {"status": "error", "message": "'max_concurrency' must be a positive integer."}
+    return queries, max_concurrency, None
+
+def batch_response(results):
+    succeeded = sum(1 for r in results if r.get('status') == 'success')
+    return {"status": "success", "results": results, "succeeded": succeeded, "failed": len(results) - succeeded}
+
+"""
+Runs many natural language queries concurrently and returns their responses
+in input order, each with its own status. Body:
+{"queries": [...], "max_concurrency": N (optional, capped by the server)}.
+"""
+@app.route('/query/batch', methods=['POST'])
+@cross_origin(origins='*')
+def handle_query_batch():
+    if not QUERY_ENGINE:
+        return jsonify({"status": "error", "message": "API service is unavailable. Database failed to load."}), 503
+
+    queries, max_concurrency, error = parse_batch_request(request.get_json(silent=True))
+    if error:
+        return jsonify(error), 400
+
+    print(f"Received batch of {len(queries)} queries.")
+    return jsonify(batch_response(QUERY_ENGINE.run_batch(queries, max_concurrency))), 200
+
+
+"""
+Returns a further page of an earlier query's results, by the cursor that
+came with its response: /query/page?cursor=...&offset=25&limit=25. Pages are
+read from the server's result cache; no LLM call is made.
+"""
+@app.route('/query/page', methods=['GET'])
+@cross_origin(origins='*')
+def handle_query_page():
+    if not QUERY_ENGINE:
+        return jsonify({"status": "error", "message": "API service is unavailable. Database failed to load."}), 503
+
+    cursor = request.args.get('cursor')
+    if not cursor:
+        return jsonify({"status": "error", "message": "Missing 'cursor' parameter."}), 400
+    try:
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args.get('limit', RESULT_PAGE_DEFAULT_ROWS))
+    except ValueError:
+        return jsonify({"status": "error", "message": "'offset' and 'limit' must be integers."}), 400
+
+    try:
+        result = QUERY_ENGINE.query_page(cursor, offset, limit)
+        if result['status'] == 'success':
+            return jsonify(result), 200
+        # A cursor from before a reload is gone for good; the client has to rerun its query.
+        return jsonify(result), 410 if result.get('expired') else 400
+    except Exception as e:
+        print(f"Unexpected error while reading a result page: {e}")
+        return jsonify({"status": "error", "message": "An unexpected server error occurred."}), 500
+
+
+"""
+Formats one server-sent event.
+"""
+def format_sse(event: str, payload) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+"""
+Streaming variant of /query, as server-sent events: "query" (the query JSON),
+"data" (the matching rows, as soon as the database query finishes), "token"
+(synthesis text as it is generated), then "done" (the full response) or "error".
+"""
+@app.route('/query/stream', methods=['GET', 'POST'])
+@cross_origin(origins='*')
+def handle_query_stream():
+    if not QUERY_ENGINE:
+        return jsonify({"status": "error", "message": "API service is unavailable. Database failed to load."}), 503
+
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        user_query = data.get('query')
+        debug_timings = wants_debug_timings(data.get('debug_timings'))
+    else:
+        user_query = request.args.get('query')
+        debug_timings = wants_debug_timings(request.args.get('debug_timings'))
+
+    if not user_query:
+        return jsonify({"status": "error", "message": "Missing 'query' parameter in request body."}), 400
+
+    print(f"Received streaming query: {user_query}")
+
+    def generate():
+        try:
+            for event, payload in QUERY_ENGINE.stream_cinequery(user_query, debug_timings):
+                yield format_sse(event, payload)
+        except Exception as e:
+            print(f"Unexpected error during query processing: {e}")
+            yield format_sse("error", {"status": "error", "message": "An unexpected server error occurred."})
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=SSE_HEADERS)
+
+
+def _is_admin_request() -> bool:
+    if ADMIN_TOKEN:
+        return hmac.compare_digest(request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN)
+    return request.remote_addr in ("127.0.0.1", "::1")
+
+"""
+Reloads the movie database without a restart. The new snapshot and its indexes
+are built in the background and swapped in atomically; in-flight queries finish
+against the previous version. Pass {"wait": true} to block until the swap.
+"""
+@app.route('/admin/reload', methods=['POST'])
+def handle_reload():
+    if not QUERY_ENGINE:
+        return jsonify({"status": "error", "message": "API service is unavailable. Database failed to load."}), 503
+    if not _is_admin_request():
+        return jsonify({"status": "error", "message": "Forbidden."}), 403
+
+    if QUERY_ENGINE.reloading:
+        return jsonify({"status": "error", "message": "A reload is already in progress."}), 409
+
+    data = request.get_json(silent=True) or {}
+    result = QUERY_ENGINE.reload(background=not data.get("wait", False))
+    if result["status"] == "accepted":
+        return jsonify(result), 202
+    if result["status"] == "success":
+        return jsonify(result), 200
+    return jsonify(result), 500
+
+"""
+Reports the database version being served and the outcome of the last reload.
+"""
+@app.route('/admin/reload', methods=['GET'])
+def reload_status():
+    if not QUERY_ENGINE:
+        return jsonify({"status": "error", "message": "API service is unavailable. Database failed to load."}), 503
+    if not _is_admin_request():
+        return jsonify({"status": "error", "message": "Forbidden."}), 403
+
+    return jsonify({"status": "ok", **QUERY_ENGINE.database.describe(), "last_reload": QUERY_ENGINE.last_reload})
+
+
+"""
+Reports engine counters: translation and result cache hits and misses,
+coalesced queries, and the Gemini rate limiter (queue wait, shed calls),
+circuit breaker and retry budget.
+"""
+@app.route('/admin/stats', methods=['GET'])
+def engine_stats():
+    if not QUERY_ENGINE:
+        return jsonify({"status": "error", "message": "API service is unavailable. Database failed to load."}), 503
+    if not _is_admin_request():
+        return jsonify({"status": "error", "message": "Forbidden."}), 403
+
+    return jsonify({"status": "ok", "translation_cache": QUERY_ENGINE.translation_cache.stats(),
+                    "result_cache": QUERY_ENGINE.result_cache.stats(),
+                    "coalesced_queries": QUERY_ENGINE.coalesced_queries,
+                    "gemini": QUERY_ENGINE.gemini_guard.stats()})
+
+
+"""
+Per-stage latency histograms and pipeline counters in the Prometheus text
+format (see metrics.py). Each process reports its own; under gunicorn every
+worker is a separate scrape target.
+"""
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+
 if __name__ == '__main__':
     # Running locally
     app.run(host='0.0.0.0', port=5001, debug=True)
@@ -0,0 +1,222 @@
+import collections.abc
+import hashlib
+import json
+import mmap
+import os
+import struct
+from typing import List, Dict, Any, Optional, Sequence
+
+import numpy as np
+
+"""
+Binary, memory-mappable snapshot of the processed movie database.
+
+Layout (little-endian):
+    magic (4 bytes, b"CQDB") | format version (uint32) | header length (uint64)
+    header (UTF-8 JSON: row count, genre vocabulary, section table)
+    sections, each 64-byte aligned
+
+Numeric columns are fixed-width arrays; strings are stored as an offsets
+array (n + 1 entries) plus one UTF-8 blob. Director and actor names live in
+a single deduplicated people string table referenced by id.
+"""
+
+SNAPSHOT_EXTENSION = ".cqdb"
+MAGIC = b"CQDB"
+FORMAT_VERSION = 1
+PREAMBLE = struct.Struct("<4sIQ")
+ALIGNMENT = 64
+
+"""
+Raised when a file is not a snapshot this code can read.
+"""
+class SnapshotFormatError(ValueError):
+    pass
+
+
+"""
+Packs a list of strings into (offsets, utf-8 blob).
+"""
+def _string_table(values: Sequence[str]):
+    encoded = [v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+"""
+Packs per-row lists of ids into (offsets, flat ids).
+"""
+def _list_column(rows: Sequence[Sequence[int]], dtype):
+    offsets = np.zeros(len(rows) + 1, dtype=np.uint64)
+    np.cumsum([len(r) for r in rows], out=offsets[1:])
+    return offsets, np.fromiter((i for r in rows for i in r), dtype=dtype, count=int(offsets[-1]))
+
+
+"""
+Writes the processed movie records (the same dicts stored in movies_db.json)
+to a binary snapshot. The file is written to a temporary path and renamed
+into place, so readers never observe a partial snapshot.
+"""
+def write_snapshot(records: Sequence[Dict[str, Any]], filepath: str) -> str:
+    genre_ids: Dict[str, int] = {}
+    person_ids: Dict[str, int] = {}
+
+    def person_id(name: Optional[str]) -> int:
+        if not name:
+            return -1
+        return person_ids.setdefault(name, len(person_ids))
+
+    def genre_id(name: str) -> int:
+        return genre_ids.setdefault(name, len(genre_ids))
+
+    rows_genres = [[genre_id(g) for g in m.get("genres", [])] for m in records]
+    directors = np.array([person_id(m.get("director")) for m in records], dtype=np.int32)
+    rows_actors = [[person_id(a) for a in m.get("actors", [])] for m in records]
+    if len(genre_ids) > 64:
+        raise SnapshotFormatError("Snapshots support at most 64 distinct genres.")
+
+    years = [m.get("year") for m in records]
+    genre_masks = np.array([sum(1 << g for g in set(row)) for row in rows_genres], dtype=np.uint64)
+
+    title_offsets, title_data = _string_table([str(m.get("title", "")) for m in records])
+    people_offsets, people_data = _string_table(list(person_ids))
+    genre_offsets, genre_list = _list_column(rows_genres, np.uint8)
+    actor_offsets, actor_list = _list_column(rows_actors, np.int32)
+
+    sections = {
+        "year": np.array([y if y is not None else 0 for y in years], dtype=np.int32),
+        "year_present": np.array([y is not None for y in years], dtype=np.bool_),
+        "rating": np.array([m.get("rating", 0.0) or 0.0 for m in records], dtype=np.float64),
+        "genre_mask": genre_masks,
+        "genre_offsets": genre_offsets,
+        "genre_ids": genre_list,
+        "title_offsets": title_offsets,
+        "title_data": title_data,
+        "director": directors,
+        "actor_offsets": actor_offsets,
+        "actor_ids": actor_list,
+        "people_offsets": people_offsets,
+        "people_data": people_data,
+    }
+
+    header = {"row_count": len(records), "genres": list(genre_ids), "people_count": len(person_ids),
+              "sections": {}}
+    # Section offsets depend on the header length, so lay out relative offsets first.
+    relative = 0
+    digest = hashlib.sha1()
+    for name, array in sections.items():
+        relative = -(-relative // ALIGNMENT) * ALIGNMENT
+        header["sections"][name] = {"offset": relative, "dtype": array.dtype.str, "count": len(array)}
+        digest.update(array.tobytes())
+        relative += array.nbytes
+    header["snapshot_id"] = digest.hexdigest()[:16]
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = -(-(PREAMBLE.size + len(header_bytes)) // ALIGNMENT) * ALIGNMENT
+
+    tmp_path = f"{filepath}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for name, array in sections.items():
+            f.seek(data_start + header["sections"][name]["offset"])
+            f.write(array.tobytes())
+        # Trailing empty sections may point at an aligned offset past the last byte.
+        f.truncate(data_start + -(-relative // ALIGNMENT) * ALIGNMENT)
+    os.replace(tmp_path, filepath)
+    return header["snapshot_id"]
+
+
+"""
+Read-only view of a snapshot file. Columns are NumPy arrays backed directly
+by the shared mmap, so opening is near-instant and the pages are shared by
+every process that maps the same file.
+"""
+class MovieSnapshot:
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        with open(filepath, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._mmap) < PREAMBLE.size:
+            raise SnapshotFormatError(f"{filepath} is too small to be a snapshot.")
+        magic, version, header_length = PREAMBLE.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise SnapshotFormatError(f"{filepath} is not a CineQuery snapshot.")
+        if version != FORMAT_VERSION:
+            raise SnapshotFormatError(f"Unsupported snapshot version {version} (expected {FORMAT_VERSION}).")
+
+        header = json.loads(bytes(self._mmap[PREAMBLE.size:PREAMBLE.size + header_length]))
+        data_start = -(-(PREAMBLE.size + header_length) // ALIGNMENT) * ALIGNMENT
+
+        self.row_count: int = header["row_count"]
+        self.genres: List[str] = header["genres"]
+        self.snapshot_id: str = header["snapshot_id"]
+        self.columns: Dict[str, np.ndarray] = {
+            name: np.frombuffer(self._mmap, dtype=np.dtype(spec["dtype"]), count=spec["count"],
+                                offset=data_start + spec["offset"])
+            for name, spec in header["sections"].items()
+        }
+
+    def _string(self, offsets_name: str, data_name: str, index: int) -> str:
+        offsets = self.columns[offsets_name]
+        return self.columns[data_name][int(offsets[index]):int(offsets[index + 1])].tobytes().decode("utf-8")
+
+    """
+    Decodes a whole string table ("title" or "people") into a list.
+    """
+    def strings(self, table: str) -> List[str]:
+        offsets = self.columns[f"{table}_offsets"].tolist()
+        blob = self.columns[f"{table}_data"].tobytes()
+        return [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+    def title(self, row_id: int) -> str:
+        return self._string("title_offsets", "title_data", row_id)
+
+    def person(self, person_id: int) -> Optional[str]:
+        return self._string("people_offsets", "people_data", person_id) if person_id >= 0 else None
+
+    def actor_ids(self, row_id: int) -> np.ndarray:
+        offsets = self.columns["actor_offsets"]
+        return self.columns["actor_ids"][int(offsets[row_id]):int(offsets[row_id + 1])]
+
+    def genre_names(self, row_id: int) -> List[str]:
+        offsets = self.columns["genre_offsets"]
+        ids = self.columns["genre_ids"][int(offsets[row_id]):int(offsets[row_id + 1])]
+        return [self.genres[i] for i in ids.tolist()]
+
+    """
+    Materializes one row in the same shape as a movies_db.json record.
+    """
+    def record(self, row_id: int) -> Dict[str, Any]:
+        columns = self.columns
+        return {
+            "title": self.title(row_id),
+            "year": int(columns["year"][row_id]) if columns["year_present"][row_id] else None,
+            "genres": self.genre_names(row_id),
+            "rating": float(columns["rating"][row_id]),
+            "director": self.person(int(columns["director"][row_id])),
+            "actors": [self.person(i) for i in self.actor_ids(row_id).tolist()],
+        }
+
+
+"""
+Sequence of movie records backed by a snapshot; rows are decoded on access,
+so only the rows a query returns are ever turned into dicts.
+"""
+class SnapshotRows(collections.abc.Sequence):
+    def __init__(self, snapshot: MovieSnapshot):
+        self.snapshot = snapshot
+
+    def __len__(self) -> int:
+        return self.snapshot.row_count
+
+    def __getitem__(self, row_id):
+        if isinstance(row_id, slice):
+            return [self.snapshot.record(i) for i in range(*row_id.indices(len(self)))]
+        if row_id < 0:
+            row_id += len(self)
+        if not 0 <= row_id < len(self):
+            raise IndexError("snapshot row index out of range")
+        return self.snapshot.record(row_id)
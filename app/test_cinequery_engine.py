@@ -1,6 +1,30 @@
+import asyncio
+import base64
+import gc
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+import tempfile
+import threading
 import unittest
 from unittest import mock
+import numpy as np
+import llm_interface
 from llm_interface import CineQueryEngine
+from name_index import NameIndex
+from movie_store import RangeIndex, top_k
+from snapshot import write_snapshot, MovieSnapshot, SnapshotFormatError
+from translation_cache import TranslationCache, normalize_query
+from fast_parser import QueryParser
+from rate_limit import RateLimiter, CircuitBreaker, GeminiGuard
+from prompt_payload import build_prompt_payload, project_rows
+import metrics
+from single_flight import AsyncSingleFlight
+from people import encode_records, movie_lines, write_people_db, InternedRows
+from result_cache import ResultCache, canonical_query, decode_cursor
 
 MOCK_DB_DATA = [
     {"title": "The Dark Knight", "year": 2008, "rating": 9.0, "genres": ["Action", "Crime"], "actors": ["Christian Bale", "Heath Ledger"]},
@@ -10,6 +34,40 @@ MOCK_DB_DATA = [
     {"title": "Toy Story", "year": 1995, "rating": 8.3, "genres": ["Animation", "Family"], "actors": ["Tom Hanks", "Tim Allen"]},
 ]
 
+DATA_PROCESSOR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts", "data_processor.py")
+RAW_TITLES = 2500  # Enough rows that a small memory budget reads every TSV in several chunks.
+
+"""
+Writes synthetic IMDb TSVs to raw_dir: movies and other title types, missing
+years and genres, titles below the vote threshold, tied ratings, titles
+without or with several directors, and actor/actress/director credits.
+"""
+def write_raw_tsvs(raw_dir, rating=lambda i: 1.0 + (i * 7 % 90) / 10, votes=lambda i: 5 if i % 13 == 0 else 100 + i):
+    os.makedirs(raw_dir, exist_ok=True)
+    files = {
+        "title.basics.tsv": ["tconst\ttitleType\tprimaryTitle\toriginalTitle\tisAdult\tstartYear\tendYear\truntimeMinutes\tgenres"],
+        "title.ratings.tsv": ["tconst\taverageRating\tnumVotes"],
+        "title.crew.tsv": ["tconst\tdirectors\twriters"],
+        "title.principals.tsv": ["tconst\tordering\tnconst\tcategory\tjob\tcharacters"],
+        "name.basics.tsv": ["nconst\tprimaryName\tbirthYear"],
+    }
+    for i in range(RAW_TITLES):
+        tconst = f"tt{i:07d}"
+        title_type = {8: "tvMovie", 9: "tvSeries"}.get(i % 10, "movie")
+        year = "\\N" if i % 37 == 0 else str(1950 + i % 70)
+        genres = "\\N" if i % 41 == 0 else ["Drama", "Comedy,Drama", "Horror,Thriller", "Action,Sci-Fi"][i % 4]
+        files["title.basics.tsv"].append(f"{tconst}\t{title_type}\tTitle {i}\tTitle {i}\t0\t{year}\t\\N\t90\t{genres}")
+        files["title.ratings.tsv"].append(f"{tconst}\t{rating(i):.1f}\t{votes(i)}")
+        directors = "\\N" if i % 17 == 0 else f"nm{i % 200:07d},nm{(i + 1) % 200:07d}" if i % 5 == 0 else f"nm{i % 200:07d}"
+        files["title.crew.tsv"].append(f"{tconst}\t{directors}\t\\N")
+        for ordering, (nconst, category) in enumerate([(i * 3 % 500, "actor"), ((i * 5 + 1) % 500, "actress"),
+                                                       (i % 200, "director")], 1):
+            files["title.principals.tsv"].append(f"{tconst}\t{ordering}\tnm{nconst:07d}\t{category}\t\\N\t\\N")
+    files["name.basics.tsv"] += [f"nm{j:07d}\tPerson {j}\t{1900 + j % 90}" for j in range(500)]
+    for filename, lines in files.items():
+        with open(os.path.join(raw_dir, filename), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
 MOCK_TRANSLATION_SUCCESS = {
     "text": '{"genre": "Action", "year_min": 2000, "sort_by": "rating", "sort_order": "desc", "limit": 2}'
 }
@@ -90,5 +148,892 @@ class TestCineQueryEngine(unittest.TestCase):
         self.assertIn("no movies matching your criteria", response["message"])
         self.assertEqual(mock_gemini.call_count, 1)  # Only translation was called
 
+class TestMovieStore(unittest.TestCase):
+    def setUp(self):
+        self.engine = CineQueryEngine()
+        self.engine.movie_dataset = [dict(m, director=d) for m, d in zip(
+            MOCK_DB_DATA, ["Christopher Nolan", "Quentin Tarantino", "Christopher Nolan", None, "John Lasseter"])]
+        self.scan_engine = CineQueryEngine(use_columnar_store=False)
+        self.scan_engine.movie_dataset = [dict(m) for m in self.engine.movie_dataset]
+
+    """Test that the columnar store returns the same rows as the reference scan."""
+    def test_matches_reference_scan(self):
+        queries = [
+            {"director": "nolan", "sort_by": "year", "sort_order": "asc"},
+            {"genre": "sci", "limit": 10},
+            {"actor": "tom", "year_max": 1994},
+            {"title_keywords": "the ", "rating_min": 8.9},
+            {"year_min": 1990, "sort_by": "rating", "limit": 4},
+            {"sort_by": "year", "sort_order": "desc", "limit": 5},
+        ]
+        for query in queries:
+            self.assertEqual(self.engine.execute_query_json(dict(query)),
+                             self.scan_engine.execute_query_json(dict(query)), query)
+
+    """Test that a genre substring matching no known genre returns nothing."""
+    def test_unknown_genre(self):
+        self.assertEqual(self.engine.execute_query_json({"genre": "Western"}), [])
+
+    """Test that movies without a director never match a director filter."""
+    def test_missing_director(self):
+        results = self.engine.execute_query_json({"director": "o", "limit": 10})
+        self.assertEqual([r["title"] for r in results],
+                         ["The Dark Knight", "Pulp Fiction", "Inception", "Toy Story"])
+
+    """Test that sorting never reorders the shared dataset, in either execution path."""
+    def test_sort_does_not_mutate_dataset(self):
+        for engine in (self.engine, self.scan_engine):
+            before = [m["title"] for m in engine.movie_dataset]
+            engine.execute_query_json({"sort_by": "year", "sort_order": "asc", "limit": 2})
+            self.assertEqual([m["title"] for m in engine.movie_dataset], before)
+
+    """Test that top-k selection keeps the stable tie order of a full sort."""
+    def test_top_k_ties(self):
+        values = np.array([5, 7, 7, 1, 7, 3])
+        row_ids = np.arange(len(values))
+        self.assertEqual(top_k(row_ids, values, 2, True).tolist(), [1, 2])
+        self.assertEqual(top_k(row_ids, values, 3, False).tolist(), [3, 5, 0])
+        self.assertEqual(top_k(row_ids, values, None, True).tolist(), [1, 2, 4, 0, 5, 3])
+
+    """Test that range index lookups are inclusive on both bounds and skip missing values."""
+    def test_range_index(self):
+        index = RangeIndex(np.array([1994, 0, 2008, 1995]), np.array([True, False, True, True]))
+        self.assertEqual(index.between(1994, 1995).tolist(), [0, 3])
+        self.assertEqual(index.between(None, 2000).tolist(), [0, 3])
+        self.assertEqual(index.between(2000, None).tolist(), [2])
+
+    """Test that the planner runs the most selective predicate first."""
+    def test_plan_orders_by_selectivity(self):
+        plan = self.engine.explain({"genre": "Drama", "director": "tarantino", "year_min": 1990})["plan"]
+        self.assertEqual([step["predicate"] for step in plan], ["director", "genre", "year"])
+        self.assertEqual(plan[0]["access"], "index")
+        self.assertEqual(plan[0]["estimated_rows"], 1)
+
+    """Test that explain reports estimated and actual counts that match execution."""
+    def test_explain_counts(self):
+        query = {"year_min": 1994, "year_max": 1995, "rating_min": 8.8}
+        explanation = self.engine.explain(query)
+        self.assertEqual(explanation["status"], "success")
+        self.assertEqual({s["predicate"]: s["estimated_rows"] for s in explanation["plan"]}, {"year": 3, "rating": 4})
+        self.assertEqual(explanation["actual_rows"], len(self.engine.execute_query_json(dict(query, limit=0))))
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.records = [dict(m, director=d) for m, d in zip(MOCK_DB_DATA, ["Christopher Nolan", None, None, None, None])]
+        self.snapshot_path = os.path.join(self.tmp_dir.name, "movies_db.cqdb")
+        write_snapshot(self.records, self.snapshot_path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    """Test that the engine prefers the snapshot next to the JSON path and decodes identical rows."""
+    def test_engine_opens_snapshot(self):
+        engine = CineQueryEngine(os.path.join(self.tmp_dir.name, "movies_db.json"))
+        self.assertEqual(list(engine.movie_dataset), self.records)
+        self.assertEqual([m["title"] for m in engine.execute_query_json({"actor": "tom hanks"})],
+                         ["Forrest Gump", "Toy Story"])
+
+    """Test that an unreadable snapshot falls back to the JSON database."""
+    def test_falls_back_to_json(self):
+        with open(self.snapshot_path, "wb") as f:
+            f.write(b"not a snapshot")
+        self.assertRaises(SnapshotFormatError, MovieSnapshot, self.snapshot_path)
+        engine = CineQueryEngine(os.path.join(self.tmp_dir.name, "movies_db.json"))
+        self.assertEqual(engine.movie_dataset, [])
+
+class TestReload(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "movies_db.json")
+        self.write_db(MOCK_DB_DATA[:3])
+        self.engine = CineQueryEngine(self.db_path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_db(self, records):
+        with open(self.db_path, "w", encoding="utf-8") as f:
+            json.dump(records, f)
+
+    """Test that a reload swaps in the new version while a pinned generation keeps serving the old rows."""
+    def test_reload_swaps_version(self):
+        old_database, old_version = self.engine.database, self.engine.snapshot_version
+        self.write_db(MOCK_DB_DATA)
+        result = self.engine.reload()
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(result["previous_version"], old_version)
+        self.assertNotEqual(self.engine.snapshot_version, old_version)
+        self.assertEqual(len(self.engine.execute_query_json({"actor": "tom hanks"})), 2)
+        self.assertEqual(self.engine.execute_query_json({"actor": "tom hanks"}, old_database), [])
+
+    """Test that a reload that finds no records keeps serving the current database."""
+    def test_failed_reload_keeps_database(self):
+        version = self.engine.snapshot_version
+        os.remove(self.db_path)
+        result = self.engine.reload()
+        self.assertEqual(result["status"], "error")
+        self.assertEqual(self.engine.snapshot_version, version)
+        self.assertEqual(len(self.engine.movie_dataset), 3)
+
+    """Test that responses report the snapshot version they were served from."""
+    @mock.patch.object(CineQueryEngine, '_call_gemini_api')
+    def test_response_reports_version(self, mock_gemini):
+        mock_gemini.side_effect = [MOCK_TRANSLATION_SUCCESS, MOCK_SYNTHESIS_SUCCESS]
+        result = self.engine.run_cinequery("Best action movies after 2000")
+        self.assertEqual(result["snapshot_version"], self.engine.snapshot_version)
+
+class TestTranslationCache(unittest.TestCase):
+    def setUp(self):
+        self.engine = CineQueryEngine()
+        self.engine.movie_dataset = MOCK_DB_DATA
+
+    """Test that case, punctuation and whitespace are folded but decimals and word order are kept."""
+    def test_normalize_query(self):
+        self.assertEqual(normalize_query("  Top 5 COMEDIES!!"), "top 5 comedies")
+        self.assertEqual(normalize_query("rated above 7.5, please."), "rated above 7.5 please")
+        self.assertNotEqual(normalize_query("comedies top 5"), normalize_query("top 5 comedies"))
+
+    """Test that a repeated query skips the translation call and failures are not cached."""
+    @mock.patch.object(CineQueryEngine, '_call_gemini_api')
+    def test_cache_skips_translation(self, mock_gemini):
+        mock_gemini.side_effect = [None, MOCK_TRANSLATION_SUCCESS, MOCK_SYNTHESIS_SUCCESS, MOCK_SYNTHESIS_SUCCESS]
+        self.assertEqual(self.engine.run_cinequery("Best two action movies after 2000")["status"], "error")
+        first = self.engine.run_cinequery("Best two action movies after 2000")
+        second = self.engine.run_cinequery("best two action movies, after 2000?")
+        self.assertEqual((first["translation_source"], second["translation_source"]), ("llm", "cache"))
+        self.assertEqual(second["data"], first["data"])
+        self.assertEqual(mock_gemini.call_count, 4)
+        self.assertEqual(self.engine.translation_cache.stats()["hits"], 1)
+
+    """Test that the SQLite layer is shared between cache instances and honours the TTL."""
+    def test_disk_layer(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, "translations.sqlite")
+            TranslationCache(db_path=db_path).put("top 5 comedies", {"genre": "Comedy", "limit": 5})
+            other = TranslationCache(db_path=db_path)
+            self.assertEqual(other.get("Top 5 comedies"), {"genre": "Comedy", "limit": 5})
+            self.assertEqual(other.stats()["disk_hits"], 1)
+            self.assertIsNone(TranslationCache(db_path=db_path, ttl_seconds=-1).get("top 5 comedies"))
+
+class TestFastParser(unittest.TestCase):
+    def setUp(self):
+        self.parser = QueryParser(["Action", "Horror", "Comedy", "Sci-Fi", "War"],
+                                  ["Stanley Kubrick", "Christopher Nolan"], ["Tom Hanks", "Meg Ryan"])
+
+    """Test that the simple query shapes parse fully into QUERY_SCHEMA JSON."""
+    def test_simple_queries(self):
+        cases = {
+            "top 10 horror movies from the 80s": {"genre": "Horror", "year_min": 1980, "year_max": 1989,
+                                                  "sort_by": "rating", "sort_order": "desc", "limit": 10},
+            "movies directed by Kubrick after 1970": {"director": "kubrick", "year_min": 1971},
+            "Tom Hanks movies rated above 8": {"actor": "tom hanks", "rating_min": 8},
+            "sci-fi films between 1990 and 1999": {"genre": "Sci-Fi", "year_min": 1990, "year_max": 1999},
+        }
+        for query, expected in cases.items():
+            parsed = self.parser.parse(query)
+            self.assertEqual(parsed["query_json"], expected, query)
+            self.assertEqual(parsed["confidence"], 1.0, query)
+
+    """Test that unknown words, negations and unrepresentable requests lower the confidence."""
+    def test_low_confidence(self):
+        self.assertLess(self.parser.parse("best two action movies after 2000")["confidence"], 0.95)
+        self.assertEqual(self.parser.parse("comedies not starring Tom Hanks")["confidence"], 0.0)
+        self.assertLess(self.parser.parse("Tom Hanks and Meg Ryan comedies")["confidence"], 0.95)
+        self.assertEqual(self.parser.parse("war movies")["query_json"], {"genre": "War"})
+
+    """Test that contradictory or repeated year bounds send the query to the LLM."""
+    def test_conflicting_years(self):
+        for query in ("comedies before 1990 and after 2000", "horror movies after 1990 after 2000",
+                      "action movies from the 80s after 1985"):
+            self.assertLess(self.parser.parse(query)["confidence"], 0.95, query)
+
+    """Test that a role cue only matches people known in that role."""
+    def test_cue_role_must_match(self):
+        parser = QueryParser(["Action", "Comedy"], ["Stanley Kubrick"], ["Will Smith", "Tom Hanks"])
+        self.assertLess(parser.parse("movies by Will Smith")["confidence"], 0.95)
+        self.assertLess(parser.parse("comedies directed by Tom Hanks")["confidence"], 0.95)
+        self.assertLess(parser.parse("movies starring Stanley Kubrick")["confidence"], 0.95)
+        parsed = parser.parse("movies by Kubrick")
+        self.assertEqual((parsed["query_json"], parsed["confidence"]), ({"director": "kubrick"}, 1.0))
+
+    """Test that a confident parse skips the translation call."""
+    @mock.patch.object(CineQueryEngine, '_call_gemini_api')
+    def test_engine_uses_parser(self, mock_gemini):
+        engine = CineQueryEngine()
+        engine.movie_dataset = MOCK_DB_DATA
+        mock_gemini.return_value = MOCK_SYNTHESIS_SUCCESS
+        response = engine.run_cinequery("Tom Hanks movies from 1994")
+        self.assertEqual(response["translation_source"], "parser")
+        self.assertEqual([m["title"] for m in response["data"]], ["Forrest Gump"])
+        self.assertEqual(mock_gemini.call_count, 1)
+
+class TestAsyncPipeline(unittest.TestCase):
+    def setUp(self):
+        self.engine = CineQueryEngine()
+        self.engine.movie_dataset = MOCK_DB_DATA
+
+    """Test that the async pipeline returns the same response as the blocking one."""
+    def test_async_matches_sync(self):
+        query = "What are the best two action movies after 2000?"
+        with mock.patch.object(CineQueryEngine, '_call_gemini_api',
+                               side_effect=[MOCK_TRANSLATION_SUCCESS, MOCK_SYNTHESIS_SUCCESS]):
+            expected = self.engine.run_cinequery(query)
+        self.engine.translation_cache.clear()
+        with mock.patch.object(CineQueryEngine, '_call_gemini_api_async',
+                               side_effect=[MOCK_TRANSLATION_SUCCESS, MOCK_SYNTHESIS_SUCCESS]) as mock_gemini:
+            response = asyncio.run(self.engine.run_cinequery_async(query))
+        self.assertEqual(response, expected)
+        self.assertEqual(mock_gemini.await_count, 2)
+
+    """Test that queries waiting on the LLM overlap instead of running one at a time."""
+    def test_concurrent_queries(self):
+        async def slow_gemini(prompt, system_instruction, is_translation=False):
+            await asyncio.sleep(0.2)
+            return MOCK_TRANSLATION_SUCCESS if is_translation else MOCK_SYNTHESIS_SUCCESS
+
+        async def run_all():
+            return await asyncio.gather(*(self.engine.run_cinequery_async(f"best two action movies {i}")
+                                          for i in range(100)))
+
+        with mock.patch.object(CineQueryEngine, '_call_gemini_api_async', side_effect=slow_gemini):
+            started = time.perf_counter()
+            responses = asyncio.run(run_all())
+        self.assertTrue(all(r["status"] == "success" for r in responses))
+        self.assertLess(time.perf_counter() - started, 2.0)
+
+    """Test that the async client retries a 429 on the pooled connection and parses the candidate."""
+    @unittest.skipIf(llm_interface.httpx is None, "httpx is not installed")
+    def test_async_client_retries(self):
+        httpx = llm_interface.httpx
+        responses = [httpx.Response(429), httpx.Response(200, json={"candidates": [{"content": {"parts": [
+            MOCK_SYNTHESIS_SUCCESS]}}]})]
+        self.engine.api_key = "test-key"
+
+        async def call():
+            self.engine._async_http = httpx.AsyncClient(transport=httpx.MockTransport(lambda r: responses.pop(0)))
+            self.engine._async_http_loop = asyncio.get_running_loop()
+            with mock.patch.object(llm_interface.asyncio, "sleep", new=mock.AsyncMock()):
+                result = await self.engine._call_gemini_api_async("prompt", "system")
+            await self.engine.aclose()
+            return result
+
+        self.assertEqual(asyncio.run(call()), MOCK_SYNTHESIS_SUCCESS)
+        self.assertEqual(responses, [])
+
+class TestStreaming(unittest.TestCase):
+    def setUp(self):
+        self.engine = CineQueryEngine()
+        self.engine.movie_dataset = MOCK_DB_DATA
+        self.engine.api_key = "test-key"
+
+    """Test that rows are emitted before synthesis tokens and the done event carries the full answer."""
+    @mock.patch.object(CineQueryEngine, '_call_gemini_api', return_value=MOCK_TRANSLATION_SUCCESS)
+    def test_stream_event_order(self, mock_gemini):
+        with mock.patch.object(CineQueryEngine, '_stream_gemini_api', return_value=iter(["Based on ", "the data."])):
+            events = list(self.engine.stream_cinequery("What are the best two action movies after 2000?"))
+        self.assertEqual([e for e, _ in events], ["query", "data", "token", "token", "done"])
+        self.assertEqual([m["title"] for m in events[1][1]["data"]], ["The Dark Knight", "Inception"])
+        self.assertEqual(events[-1][1]["answer"], "Based on the data.")
+        self.assertEqual(events[-1][1]["data"], events[1][1]["data"])
+
+    """Test that the streaming client forwards text from the model's SSE lines."""
+    def test_stream_client_parses_sse(self):
+        lines = ['data: {"candidates": [{"content": {"parts": [{"text": "Hello"}]}}]}', '',
+                 'data: {"candidates": [{"content": {"parts": [{"text": " world"}]}}]}']
+        response = mock.MagicMock(status_code=200)
+        response.__enter__.return_value = response
+        response.iter_lines.return_value = iter(lines)
+        with mock.patch.object(self.engine._http, "post", return_value=response) as mock_post:
+            chunks = list(self.engine._stream_gemini_api("prompt", "system"))
+        self.assertEqual(chunks, ["Hello", " world"])
+        self.assertIn(":streamGenerateContent?alt=sse", mock_post.call_args[0][0])
+
+    """Test that a failed synthesis stream ends with an error event after the rows."""
+    @mock.patch.object(CineQueryEngine, '_call_gemini_api', return_value=MOCK_TRANSLATION_SUCCESS)
+    def test_stream_error(self, mock_gemini):
+        failure = {"status": "error", "message": "Failed to synthesize a final answer."}
+        with mock.patch.object(CineQueryEngine, '_stream_gemini_api', return_value=iter([failure])):
+            events = list(self.engine.stream_cinequery("What are the best two action movies after 2000?"))
+        self.assertEqual([e for e, _ in events], ["query", "data", "error"])
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.engine = CineQueryEngine()
+        self.engine.movie_dataset = MOCK_DB_DATA
+
+    """Test that identical queries in flight at the same time share one pipeline run."""
+    def test_coalesces_concurrent_queries(self):
+        release = threading.Event()
+
+        def slow_gemini(prompt, system_instruction, is_translation=False):
+            release.wait(5)
+            return MOCK_TRANSLATION_SUCCESS if is_translation else MOCK_SYNTHESIS_SUCCESS
+
+        with mock.patch.object(CineQueryEngine, '_call_gemini_api', side_effect=slow_gemini) as mock_gemini:
+            queries = ["Best two action movies after 2000"] * 4 + ["best two ACTION movies after 2000!"]
+            threads = [threading.Thread(target=self.engine.run_cinequery, args=(q,)) for q in queries]
+            for thread in threads:
+                thread.start()
+            while self.engine.coalesced_queries < 4:
+                time.sleep(0.01)
+            release.set()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(mock_gemini.call_count, 2)
+
+    """Test that cancelling the first caller of a coalesced async query does not cancel the callers sharing it."""
+    def test_cancelled_leader_keeps_shared_call(self):
+        async def scenario():
+            flight = AsyncSingleFlight()
+            release = asyncio.Event()
+
+            async def work():
+                await release.wait()
+                return "answer"
+
+            leader = asyncio.ensure_future(flight.do("query", work))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(flight.do("query", work))
+            await asyncio.sleep(0)
+            leader.cancel()
+            await asyncio.sleep(0)
+            release.set()
+            return flight, leader, await follower
+
+        flight, leader, result = asyncio.run(scenario())
+        self.assertTrue(leader.cancelled())
+        self.assertEqual(result, "answer")
+        self.assertEqual((flight.coalesced, flight._calls), (1, {}))
+
+    """Test that batch results keep input order, echo each query and report a status per query."""
+    @mock.patch.object(CineQueryEngine, '_call_gemini_api')
+    def test_batch_order_and_status(self, mock_gemini):
+        def gemini(prompt, system_instruction, is_translation=False):
+            if not is_translation:
+                return MOCK_SYNTHESIS_SUCCESS
+            return {"text": '{"actor": "Brad Pitt"}'} if "pitt" in prompt.lower() else MOCK_TRANSLATION_SUCCESS
+
+        mock_gemini.side_effect = gemini
+        queries = ["Best two action movies after 2000", "Two films with Brad Pitt", "", "best two action movies after 2000"]
+        results = self.engine.run_batch(queries, max_concurrency=2)
+        self.assertEqual([r["status"] for r in results], ["success", "success", "error", "success"])
+        self.assertEqual(results[0]["query"], queries[0])
+        self.assertEqual(results[3]["query"], queries[3])
+        self.assertIn("no movies", results[1]["message"])
+        # The duplicate is answered by the same run: 2 calls for the first query, 1 for the second.
+        self.assertEqual(mock_gemini.call_count, 3)
+
+    """Test that no more than max_concurrency queries run at once."""
+    def test_batch_concurrency_cap(self):
+        lock, running, peak = threading.Lock(), [0], [0]
+
+        def gemini(prompt, system_instruction, is_translation=False):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+            return MOCK_TRANSLATION_SUCCESS if is_translation else MOCK_SYNTHESIS_SUCCESS
+
+        with mock.patch.object(CineQueryEngine, '_call_gemini_api', side_effect=gemini):
+            results = self.engine.run_batch([f"best two action movies {i}" for i in range(12)], max_concurrency=3)
+        self.assertTrue(all(r["status"] == "success" for r in results))
+        self.assertLessEqual(peak[0], 3)
+        self.assertGreater(peak[0], 1)
+
+class TestRateLimit(unittest.TestCase):
+    def setUp(self):
+        self.engine = CineQueryEngine()
+        self.engine.movie_dataset = MOCK_DB_DATA
+        self.engine.api_key = "test-key"
+
+    """Test that calls beyond the per-minute budget queue, and are shed once the wait passes their deadline."""
+    def test_limiter_queues_then_sheds(self):
+        limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=0)
+        self.assertTrue(all(limiter.reserve(10, max_wait=0) == 0 for _ in range(60)))
+        self.assertAlmostEqual(limiter.reserve(10, max_wait=5), 1.0, places=1)
+        self.assertIsNone(limiter.reserve(10, max_wait=1.5))
+        stats = limiter.stats()
+        self.assertEqual((stats["admitted"], stats["queued"], stats["shed"]), (61, 1, 1))
+
+    """Test that a 429's Retry-After delays the retry and pauses the shared limiter."""
+    def test_retry_after_is_honored(self):
+        success = mock.MagicMock(status_code=200)
+        success.json.return_value = {"candidates": [{"content": {"parts": [MOCK_SYNTHESIS_SUCCESS]}}]}
+        throttled = mock.MagicMock(status_code=429, headers={"Retry-After": "3"})
+        with mock.patch.object(self.engine._http, "post", side_effect=[throttled, success]), \
+                mock.patch.object(llm_interface.time, "sleep") as mock_sleep:
+            result = self.engine._call_gemini_api("prompt", "system")
+        self.assertEqual(result, MOCK_SYNTHESIS_SUCCESS)
+        self.assertGreaterEqual(mock_sleep.call_args_list[0][0][0], 3)
+        self.assertGreater(self.engine.gemini_guard.limiter.stats()["paused_for_s"], 0)
+
+    """Test that an open circuit fails fast without calling the API and reports when to retry."""
+    def test_open_circuit_fails_fast(self):
+        self.engine.gemini_guard = GeminiGuard(breaker=CircuitBreaker(failure_threshold=1, reset_timeout=5))
+        unavailable = mock.MagicMock(status_code=503, headers={"Retry-After": "60"})
+        with mock.patch.object(self.engine._http, "post", return_value=unavailable) as mock_post, \
+                mock.patch.object(llm_interface.time, "sleep"):
+            self.assertIsNone(self.engine._call_gemini_api("prompt", "system"))
+            response = self.engine.run_cinequery("What are the best two action movies after 2000?")
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(response["status"], "error")
+        self.assertGreater(response["retry_after"], 55)
+        self.assertEqual(self.engine.gemini_guard.stats()["circuit"]["state"], "open")
+
+    """Test that a probe shed by the rate limiter, or ended by an unexpected error, does not leave the circuit half-open."""
+    def test_unanswered_probe_is_released(self):
+        guard = GeminiGuard(limiter=RateLimiter(1, 0), breaker=CircuitBreaker(1, 0.01))
+        budget = guard.begin(10)
+        self.assertEqual(budget.admit(), (0.0, None))
+        budget.failed()
+        time.sleep(0.02)
+        wait, shed = guard.begin(10).admit()
+        self.assertIn("rate limit", shed["message"])
+        self.assertEqual(guard.breaker.state, "open")
+
+        guard.limiter = RateLimiter(0, 0)
+        self.engine.gemini_guard = guard
+        with mock.patch.object(self.engine._http, "post", side_effect=ValueError("boom")):
+            self.assertEqual(self.engine._call_gemini_api("prompt", "system")["status"], "error")
+        self.assertEqual(guard.breaker.state, "open")
+        budget = guard.begin(10)
+        self.assertEqual(budget.admit(), (0.0, None))
+        self.assertTrue(budget.probe)
+        budget.succeeded()
+        self.assertEqual(guard.breaker.state, "closed")
+
+class TestPromptPayload(unittest.TestCase):
+    """Test that rows become a table of the relevant fields, with matching actors first and shared values hoisted."""
+    def test_compact_table(self):
+        rows = [dict(m, actors=["Extra One"] + m["actors"] + ["Extra Two"], director="Robert Zemeckis", votes=1000)
+                for m in MOCK_DB_DATA if "Tom Hanks" in m["actors"]]
+        payload = build_prompt_payload(rows, {"actor": "hanks", "director": "zemeckis"}, token_budget=500)
+        lines = payload["text"].splitlines()
+        self.assertEqual(lines[0], "Columns: title|year|rating|actors")
+        self.assertEqual(lines[1], "Same for every row: director = Robert Zemeckis")
+        self.assertEqual(lines[2], "Forrest Gump|1994|8.8|Tom Hanks, Extra One, Robin Wright")
+        self.assertNotIn("votes", payload["text"])
+        self.assertEqual((payload["rows_included"], payload["rows_omitted"]), (2, 0))
+
+    """Test that only the display fields and the fields the query filters on are sent, whatever the filter's type."""
+    def test_projects_query_fields(self):
+        rows = [dict(m, director="Someone") for m in MOCK_DB_DATA]
+        self.assertEqual(project_rows(rows, {"year_min": 2000})[0], {"title": "The Dark Knight", "year": 2008,
+                                                                     "rating": 9.0})
+        self.assertEqual(list(project_rows(rows, {"genre": "Drama", "rating_min": 8})[0]),
+                         ["title", "year", "rating", "genres"])
+        projected = project_rows(rows, {"actor": ["Tim Allen"]}, max_actors=1)
+        self.assertEqual([r["actors"] for r in projected], [["Christian Bale"], ["John Travolta"],
+                                                             ["Leonardo DiCaprio"], ["Tom Hanks"], ["Tom Hanks"]])
+        self.assertEqual(project_rows(rows, {"actor": "allen"}, max_actors=1)[4]["actors"], ["Tim Allen"])
+
+    """Test that rows past the token budget are dropped and counted, keeping at least one row."""
+    def test_token_budget(self):
+        rows = [dict(MOCK_DB_DATA[i % 5], title=f"Movie {i}") for i in range(200)]
+        payload = build_prompt_payload(rows, {}, token_budget=300)
+        self.assertLessEqual(payload["estimated_tokens"], 310)
+        self.assertEqual(payload["rows_included"] + payload["rows_omitted"], 200)
+        self.assertTrue(payload["text"].endswith(f"({payload['rows_omitted']} more matching rows not shown)"))
+        self.assertEqual(build_prompt_payload(rows[:1], {}, token_budget=1)["rows_included"], 1)
+
+    """Test that the synthesis prompt carries the table and the response reports its estimated size."""
+    @mock.patch.object(CineQueryEngine, '_call_gemini_api',
+                       side_effect=[MOCK_TRANSLATION_SUCCESS, MOCK_SYNTHESIS_SUCCESS])
+    def test_synthesis_prompt(self, mock_gemini):
+        engine = CineQueryEngine()
+        engine.movie_dataset = MOCK_DB_DATA
+        response = engine.run_cinequery("What are the best two action movies after 2000?")
+        synthesis_prompt = mock_gemini.call_args_list[1][0][0]
+        self.assertIn("Columns: title|year|rating|genres\nThe Dark Knight|2008|9.0|Action, Crime\n", synthesis_prompt)
+        self.assertGreater(response["synthesis_prompt_tokens"], 0)
+
+class TestAggregation(unittest.TestCase):
+    def setUp(self):
+        records = [dict(m, director=d) for m, d in zip(
+            MOCK_DB_DATA, ["Christopher Nolan", "Quentin Tarantino", "Christopher Nolan", None, "John Lasseter"])]
+        self.engine = CineQueryEngine()
+        self.engine.movie_dataset = records
+        self.scan_engine = CineQueryEngine(use_columnar_store=False)
+        self.scan_engine.movie_dataset = [dict(m) for m in records]
+
+    """Test per-group counts and averages, with movies of several genres counted in each."""
+    def test_group_by(self):
+        self.assertEqual(self.engine.execute_query_json({"group_by": "decade", "aggregates": ["avg_rating"]}),
+                         [{"decade": 1990, "count": 3, "avg_rating": 8.67},
+                          {"decade": 2000, "count": 1, "avg_rating": 9.0},
+                          {"decade": 2010, "count": 1, "avg_rating": 8.8}])
+        self.assertEqual(self.engine.execute_query_json({"group_by": "genre", "limit": 2}),
+                         [{"genre": "Action", "count": 2}, {"genre": "Crime", "count": 2}])
+        self.assertEqual(self.engine.execute_query_json({"actor": "hanks", "aggregates": ["count", "min_year"]}),
+                         [{"count": 2, "min_year": 1994}])
+
+    """Test that having filters groups and sort_by orders them by an aggregate."""
+    def test_having_and_sort(self):
+        query = {"group_by": "director", "aggregates": ["avg_rating", "max_rating"],
+                 "having": {"count_min": 2}, "sort_by": "rating"}
+        self.assertEqual(self.engine.execute_query_json(query),
+                         [{"director": "Christopher Nolan", "count": 2, "avg_rating": 8.9, "max_rating": 9.0}])
+        query = {"group_by": "director", "sort_by": "avg_rating", "sort_order": "asc"}
+        self.assertEqual([g["director"] for g in self.engine.execute_query_json(query)],
+                         ["John Lasseter", "Christopher Nolan", "Quentin Tarantino"])
+
+    """Test that the columnar aggregation returns the same groups as the reference implementation."""
+    def test_matches_reference(self):
+        queries = [
+            {"group_by": "year", "sort_by": "year", "sort_order": "desc"},
+            {"group_by": "genre", "aggregates": ["avg_rating", "min_rating", "max_year"], "sort_by": "count"},
+            {"group_by": "director", "rating_min": 8.5, "having": {"avg_rating_min": 8.85}},
+            {"genre": "Western", "aggregates": ["count", "avg_rating"]},
+            {"genre": "Western", "group_by": "decade"},
+        ]
+        for query in queries:
+            self.assertEqual(self.engine.execute_query_json(dict(query)),
+                             self.scan_engine.execute_query_json(dict(query)), query)
+
+    """Test that only the aggregate table is sent to synthesis."""
+    @mock.patch.object(CineQueryEngine, '_call_gemini_api')
+    def test_aggregate_pipeline(self, mock_gemini):
+        mock_gemini.side_effect = [{"text": '{"group_by": "decade", "genre": "Drama"}'}, MOCK_SYNTHESIS_SUCCESS]
+        response = self.engine.run_cinequery("How many drama movies came out each decade?")
+        self.assertEqual(response["data"], [{"decade": 1990, "count": 2}])
+        synthesis_prompt = mock_gemini.call_args_list[1][0][0]
+        self.assertIn("Columns: decade|count\n1990|2", synthesis_prompt)
+        self.assertNotIn("Forrest Gump", synthesis_prompt)
+
+class TestPeopleFormat(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.records = [dict(m, director=d) for m, d in zip(
+            MOCK_DB_DATA, ["Christopher Nolan", "Quentin Tarantino", "Christopher Nolan", None, "John Lasseter"])]
+        self.db_path = os.path.join(self.tmp_dir.name, "movies_db.json")
+        people, movies = encode_records(self.records)
+        write_people_db(self.db_path, people, movie_lines(movies))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    """Test that each person is stored once and referenced by id from every credit."""
+    def test_encode_records(self):
+        people, movies = encode_records(self.records)
+        names = [p["name"] for p in people]
+        self.assertEqual(len(names), len(set(names)))
+        self.assertEqual(names.count("Tom Hanks"), 1)
+        self.assertEqual(movies[0]["director"], movies[2]["director"])
+        self.assertIsNone(movies[3]["director"])
+        self.assertEqual(names[movies[3]["actors"][0]], "Tom Hanks")
+
+    """Test that the engine loads the people format and returns the same rows as the plain list format."""
+    def test_engine_loads_people_format(self):
+        engine = CineQueryEngine(self.db_path)
+        self.assertIsInstance(engine.movie_dataset, InternedRows)
+        self.assertEqual(list(engine.movie_dataset), self.records)
+        self.assertEqual([list(m) for m in engine.movie_dataset], [list(m) for m in self.records])
+        self.assertEqual([m["title"] for m in engine.execute_query_json({"director": "nolan", "sort_by": "year"})],
+                         ["Inception", "The Dark Knight"])
+
+    """Test that id-based name filtering matches the columnar store and the plain records."""
+    def test_filters_match_plain_records(self):
+        store_engine = CineQueryEngine(self.db_path)
+        scan_engine = CineQueryEngine(self.db_path, use_columnar_store=False)
+        plain_engine = CineQueryEngine(use_columnar_store=False)
+        plain_engine.movie_dataset = [dict(m) for m in self.records]
+        queries = [{"actor": "tom hanks"}, {"director": "christopher nolan", "actor": "bale"},
+                   {"director": "lasseter", "actor": "allen"}, {"actor": "nobody"},
+                   {"group_by": "director", "aggregates": ["avg_rating"]}]
+        for query in queries:
+            expected = plain_engine.execute_query_json(dict(query))
+            self.assertEqual(store_engine.execute_query_json(dict(query)), expected, query)
+            self.assertEqual(scan_engine.execute_query_json(dict(query)), expected, query)
+
+    """Test that the scan fallback only runs the people pre-filter when the query filters by name."""
+    def test_scan_without_name_filter(self):
+        scan_engine = CineQueryEngine(self.db_path, use_columnar_store=False)
+        plain_engine = CineQueryEngine(use_columnar_store=False)
+        plain_engine.movie_dataset = [dict(m) for m in self.records]
+        with mock.patch.object(InternedRows, "filter_people", wraps=scan_engine.movie_dataset.filter_people) as spy:
+            for query in ({"sort_by": "rating", "sort_order": "desc", "limit": 3}, {"sort_by": "year", "limit": 2},
+                          {"genre": "drama", "sort_by": "year", "sort_order": "asc"}, {"rating_min": 8.8}):
+                self.assertEqual(scan_engine.execute_query_json(dict(query)),
+                                 plain_engine.execute_query_json(dict(query)), query)
+            self.assertFalse(spy.called)
+            self.assertEqual(len(scan_engine.execute_query_json({"actor": "hanks"})), 2)
+            self.assertTrue(spy.called)
+
+class TestPreload(unittest.TestCase):
+    def setUp(self):
+        self.engine = CineQueryEngine()
+        self.engine.movie_dataset = [dict(m, director="Christopher Nolan") for m in MOCK_DB_DATA]
+
+    def tearDown(self):
+        gc.unfreeze()
+
+    """Test that freezing builds every lazy index up front and moves objects to the permanent generation."""
+    def test_freeze_builds_indexes(self):
+        database = self.engine.database
+        self.engine.freeze()
+        self.assertEqual(set(database.store._name_indexes), {"director", "actor", "title_keywords"})
+        self.assertIsNotNone(database.store._director_column)
+        self.assertIsNotNone(database._parser)
+        self.assertGreater(gc.get_freeze_count(), 0)
+        self.assertEqual(len(self.engine.execute_query_json({"actor": "tom hanks"})), 2)
+
+    """Test that a forked worker opens its own SQLite connection instead of reusing the parent's."""
+    def test_translation_cache_reconnects_after_fork(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = TranslationCache(db_path=os.path.join(tmp_dir, "translations.sqlite3"))
+            parent_connection = cache._connection()
+            with mock.patch("translation_cache.os.getpid", return_value=os.getpid() + 1):
+                self.assertIsNot(cache._connection(), parent_connection)
+                cache.put("top 5 comedies", {"genre": "Comedy", "limit": 5})
+            self.assertEqual(TranslationCache(db_path=cache.db_path).get("top 5 comedies"),
+                             {"genre": "Comedy", "limit": 5})
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.engine = CineQueryEngine()
+        self.engine.movie_dataset = MOCK_DB_DATA
+        self.engine.api_key = "test-key"
+        self.engine.fast_parser_confidence = 2  # Always translate with the (mocked) LLM.
+
+    """Test that debug_timings reports every stage with its details, and is left out unless asked for."""
+    @mock.patch.object(CineQueryEngine, '_call_gemini_api')
+    def test_debug_timings(self, mock_gemini):
+        mock_gemini.side_effect = [MOCK_TRANSLATION_SUCCESS, MOCK_SYNTHESIS_SUCCESS] * 2
+        response = self.engine.run_cinequery("Best action movies after 2000", debug_timings=True)
+        spans = {span["stage"]: span for span in response["debug_timings"]}
+        self.assertEqual(list(spans), ["request", "translate", "gemini_translation", "execute", "synthesize",
+                                       "gemini_synthesis"])
+        self.assertEqual(spans["request"]["status"], "success")
+        self.assertEqual((spans["translate"]["source"], spans["translate"]["cache_hit"]), ("llm", False))
+        self.assertEqual(spans["gemini_translation"]["parent"], "translate")
+        self.assertEqual(spans["execute"]["rows"], 2)
+        self.assertEqual([(f["predicate"], f["rows_before"], f["rows_after"]) for f in spans["execute"]["filters"]],
+                         [("year", 5, 2), ("genre", 2, 2)])
+        self.assertEqual(spans["synthesize"]["rows_sent"], 2)
+        self.assertEqual(spans["gemini_synthesis"]["response_chars"], len(MOCK_SYNTHESIS_SUCCESS["text"]))
+        self.assertTrue(all(span["duration_ms"] >= 0 for span in spans.values()))
+
+        self.engine.translation_cache.clear()
+        self.assertNotIn("debug_timings", self.engine.run_cinequery("Best action movies after 2000"))
+
+    """Test that the scan engine records the same per-filter row counts."""
+    def test_scan_filter_counts(self):
+        scan_engine = CineQueryEngine(use_columnar_store=False)
+        scan_engine.movie_dataset = MOCK_DB_DATA
+        with metrics.trace_request() as trace:
+            scan_engine.execute_query_json({"actor": "tom hanks", "year_max": 1994})
+        execute = trace.spans[1]
+        self.assertEqual((execute["stage"], execute["engine"]), ("execute", "scan"))
+        self.assertEqual(execute["filters"], [{"predicate": "actor", "rows_before": 5, "rows_after": 2},
+                                              {"predicate": "year_max", "rows_before": 2, "rows_after": 1}])
+
+    """Test that retries are counted on the call's span and in the Prometheus output."""
+    def test_retries_and_prometheus_output(self):
+        retries = metrics.GEMINI_RETRIES.value()
+        success = mock.MagicMock(status_code=200)
+        success.json.return_value = {"candidates": [{"content": {"parts": [MOCK_SYNTHESIS_SUCCESS]}}]}
+        unavailable = mock.MagicMock(status_code=503, headers={})
+        with metrics.trace_request() as trace, \
+                mock.patch.object(self.engine._http, "post", side_effect=[unavailable, success]), \
+                mock.patch.object(llm_interface.time, "sleep"):
+            with metrics.gemini_call("synthesis", 12) as call_span:
+                metrics.finish_gemini_call(call_span, "synthesis", self.engine._call_gemini_api("prompt", "system"))
+        self.assertEqual((call_span["retries"], call_span["outcome"]), (1, "success"))
+        self.assertEqual(metrics.GEMINI_RETRIES.value(), retries + 1)
+
+        text = metrics.render_prometheus()
+        self.assertIn("# TYPE cinequery_stage_duration_seconds histogram", text)
+        self.assertIn('cinequery_stage_duration_seconds_bucket{stage="gemini_synthesis",le="+Inf"}', text)
+        self.assertIn(f"cinequery_gemini_retries_total {int(retries + 1)}", text)
+
+class TestResultCursors(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "movies_db.json")
+        with open(self.db_path, "w", encoding="utf-8") as f:
+            json.dump(MOCK_DB_DATA, f)
+        self.engine = CineQueryEngine(self.db_path)
+        self.engine.fast_parser_confidence = 2  # Always translate with the (mocked) LLM.
+        self.scan_engine = CineQueryEngine(self.db_path, use_columnar_store=False)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    """Test that a response carries a cursor whose later pages are served without another LLM call."""
+    @mock.patch.object(CineQueryEngine, '_call_gemini_api')
+    def test_pages_follow_first_page(self, mock_gemini):
+        mock_gemini.side_effect = [{"text": '{"sort_by": "rating", "sort_order": "desc", "limit": 2}'},
+                                   MOCK_SYNTHESIS_SUCCESS]
+        response = self.engine.run_cinequery("Best movies")
+        self.assertEqual((len(response["data"]), response["total_rows"], response["next_offset"]), (2, 5, 2))
+
+        all_rows = self.engine.execute_query_json({"sort_by": "rating", "sort_order": "desc", "limit": 0})
+        second = self.engine.query_page(response["cursor"], 2, 2)
+        last = self.engine.query_page(response["cursor"], 4, 2)
+        self.assertEqual(response["data"] + second["data"] + last["data"], all_rows)
+        self.assertEqual((second["next_offset"], last["next_offset"]), (4, None))
+        self.assertEqual(mock_gemini.call_count, 2)
+        self.assertEqual(self.engine.result_cache.stats()["hits"], 2)
+
+    """Test that the scan fallback pages the same rows, and that a cursor missing from the cache is rebuilt."""
+    def test_scan_engine_and_rebuilt_cursor(self):
+        query = {"genre": "Drama", "sort_by": "year", "sort_order": "asc", "limit": 1}
+        first = self.engine.execute_query_page(query)
+        self.engine.result_cache.clear()
+        self.assertEqual(self.engine.query_page(first["cursor"], 1)["data"],
+                         self.scan_engine.query_page(self.scan_engine.execute_query_page(query)["cursor"], 1)["data"])
+        self.assertEqual(decode_cursor(first["cursor"])[0], json.loads(canonical_query(query)))
+        groups = self.engine.execute_query_page({"group_by": "genre", "limit": 2})
+        self.assertEqual(self.engine.query_page(groups["cursor"], 2, 100)["data"],
+                         self.engine.execute_query_json({"group_by": "genre"})[2:])
+
+    """Test that cursors are capped at the cache's row limit, and refused after a reload or when malformed."""
+    def test_truncated_expired_and_invalid_cursors(self):
+        self.engine.result_cache = ResultCache(max_rows=3)
+        page = self.engine.execute_query_page({"sort_by": "rating", "limit": 0})
+        self.assertEqual((len(page["data"]), page["total_rows"], page["truncated"]), (3, 3, True))
+
+        with open(self.db_path, "w", encoding="utf-8") as f:
+            json.dump(MOCK_DB_DATA[:4], f)
+        self.assertEqual(self.engine.reload()["status"], "success")
+        expired = self.engine.query_page(page["cursor"], 1)
+        self.assertEqual((expired["status"], expired["expired"]), ("error", True))
+        self.assertEqual(self.engine.query_page("not-a-cursor")["status"], "error")
+
+    """Test that a crafted cursor with fields of the wrong type is refused with a JSON 400, not executed."""
+    def test_type_mismatched_cursor(self):
+        import server
+        version = self.engine.snapshot_version
+        crafted = [f"{version}." + base64.urlsafe_b64encode(json.dumps(query).encode()).decode().rstrip("=")
+                   for query in
+            ({"rating_min": "8"}, {"year_min": "abc"}, {"genre": ["Drama"]}, {"sort_by": "title"},
+             {"having": {"count_min": "5"}}, {"drop_table": 1})]
+        with mock.patch.object(server, "QUERY_ENGINE", self.engine):
+            client = server.app.test_client()
+            for cursor in crafted:
+                self.assertIsNone(decode_cursor(cursor), cursor)
+                response = client.get("/query/page", query_string={"cursor": cursor})
+                self.assertEqual(response.status_code, 400, cursor)
+                self.assertEqual(response.get_json()["status"], "error")
+            valid = self.engine.execute_query_page({"rating_min": 8.0, "limit": 1})["cursor"]
+            self.assertEqual(client.get("/query/page", query_string={"cursor": valid}).status_code, 200)
+
+class TestNameIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = NameIndex([m["actors"] for m in MOCK_DB_DATA])
+
+    """Test that trigram lookups keep substring semantics across word boundaries."""
+    def test_substring_lookup(self):
+        self.assertEqual(self.index.lookup_rows("m hank").tolist(), [3, 4])
+        self.assertEqual(self.index.lookup_rows("gordon-lev").tolist(), [2])
+        self.assertEqual(self.index.lookup_rows("brad pitt").tolist(), [])
+
+    """Test that needles shorter than a trigram fall back to scanning distinct names."""
+    def test_short_needle(self):
+        self.assertEqual(self.index.lookup_rows("ti").tolist(), [0, 4])
+
+class TestDataProcessor(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        write_raw_tsvs(os.path.join(self.tmp_dir.name, "data", "raw"))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def run_processor(self, *args):
+        result = subprocess.run([sys.executable, DATA_PROCESSOR, *args], cwd=self.tmp_dir.name,
+                                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        return result.stdout
+
+    def read_outputs(self):
+        outputs = {}
+        for name in ("movies_db.json", "movies_db.cqdb"):
+            with open(os.path.join(self.tmp_dir.name, "data", "processed", name), "rb") as f:
+                outputs[name] = f.read()
+        return outputs
+
+    """Test that streaming in several chunks writes the same JSON and snapshot bytes as the in-memory build."""
+    def test_streaming_matches_default(self):
+        self.run_processor()
+        expected = self.read_outputs()
+        stdout = self.run_processor("--streaming", "--memory-budget-mb", "0.05")
+        self.assertIn("Streamed title.basics.tsv: kept", stdout)
+        self.assertIn(f"of {RAW_TITLES * 3} records (1000 rows per chunk)", stdout)
+        self.assertEqual(self.read_outputs(), expected)
+        self.assertGreater(len(json.loads(expected["movies_db.json"])["movies"]), 1000)
+
+    """Test that the parallel pipeline writes the same bytes as the serial one."""
+    def test_parallel_workers_match_serial(self):
+        self.run_processor("--workers", "1")
+        expected = self.read_outputs()
+        stdout = self.run_processor("--workers", "3", "--memory-budget-mb", "0.05")
+        self.assertIn("Starting parallel data processing with 3 workers", stdout)
+        self.assertEqual(self.read_outputs(), expected)
+
+    """Replaces only title.ratings.tsv: ratings move, some titles drop below the vote threshold, others reach it."""
+    def rewrite_ratings(self):
+        with tempfile.TemporaryDirectory() as other_dir:
+            write_raw_tsvs(other_dir, rating=lambda i: 1.0 + (i * 11 % 90) / 10,
+                           votes=lambda i: 5 if i % 11 == 0 else 100 + i)
+            shutil.copy(os.path.join(other_dir, "title.ratings.tsv"),
+                        os.path.join(self.tmp_dir.name, "data", "raw", "title.ratings.tsv"))
+
+    def read_build(self):
+        processed = os.path.join(self.tmp_dir.name, "data", "processed")
+        with open(os.path.join(processed, "movies_db.json"), encoding="utf-8") as f:
+            records = [dict(r) for r in InternedRows.from_json(json.load(f))]
+        with open(os.path.join(processed, "movies_db.ids.json"), encoding="utf-8") as f:
+            return records, json.load(f)
+
+    """Test that after a ratings-only change --incremental recomputes only the ratings stage and matches a rebuild."""
+    def test_incremental_matches_rebuild(self):
+        self.run_processor("--incremental")
+        self.rewrite_ratings()
+        stdout = self.run_processor("--incremental")
+        self.assertIn("Stage 'ratings' inputs changed; recomputing.", stdout)
+        for stage in ("basics", "directors", "actors"):
+            self.assertIn(f"Stage '{stage}' is up to date; loaded from cache.", stdout)
+        self.assertNotIn("title.principals.tsv", stdout)
+        incremental = self.read_outputs()
+
+        self.run_processor()
+        self.assertEqual(incremental, self.read_outputs())
+
+    """
+    Test that --apply-delta yields the same records as a rebuild. As documented
+    on apply_delta, only the order of equal ratings may differ: records already
+    in the database keep their previous order and added records follow them.
+    """
+    def test_apply_delta_matches_rebuild(self):
+        processed = os.path.join(self.tmp_dir.name, "data", "processed")
+        backup = os.path.join(self.tmp_dir.name, "previous")
+        self.run_processor()
+        shutil.copytree(processed, backup)
+        previous_ids = self.read_build()[1]
+
+        self.rewrite_ratings()
+        self.run_processor("--incremental")
+        rebuilt, rebuilt_ids = self.read_build()
+        for name in os.listdir(backup):
+            shutil.copy(os.path.join(backup, name), processed)
+        stdout = self.run_processor("--apply-delta", os.path.join("data", "processed", "movies_db.delta.json"))
+        self.assertIn("Applied delta:", stdout)
+        applied, applied_ids = self.read_build()
+
+        self.assertEqual(sorted(zip(applied_ids, map(json.dumps, applied))),
+                         sorted(zip(rebuilt_ids, map(json.dumps, rebuilt))))
+        self.assertEqual([r["rating"] for r in applied], [r["rating"] for r in rebuilt])
+        self.assertNotEqual(applied_ids, rebuilt_ids)
+        position = {tconst: i for i, tconst in enumerate(previous_ids)}
+        for rating in {r["rating"] for r in applied}:
+            tied = [t for t, r in zip(applied_ids, applied) if r["rating"] == rating]
+            kept = [t for t in tied if t in position]
+            self.assertEqual(kept, sorted(kept, key=position.get))
+            self.assertEqual(tied[:len(kept)], kept)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,143 @@
+import collections
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Dict, Any, Optional
+
+# Optional on-disk layer shared by every worker process; unset keeps the cache in-process only.
+CACHE_DB_PATH = os.environ.get("CINEQUERY_TRANSLATION_CACHE_DB", "")
+CACHE_TTL_SECONDS = float(os.environ.get("CINEQUERY_TRANSLATION_CACHE_TTL", str(24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.environ.get("CINEQUERY_TRANSLATION_CACHE_SIZE", "4096"))
+
+# Anything that is not a letter, digit or decimal point inside a number is folded to a space.
+_PUNCTUATION = re.compile(r"(?:(?<!\d)\.|\.(?!\d)|[^\w.])+")
+
+"""
+Folds case, Unicode width, punctuation and whitespace, so "Top 5 comedies!"
+and "  top 5   COMEDIES" share a cache entry. Word order is kept, since it can
+change a query's meaning ("before 1990 after 2000").
+"""
+def normalize_query(text: str) -> str:
+    folded = unicodedata.normalize("NFKC", text or "").casefold()
+    return " ".join(_PUNCTUATION.sub(" ", folded).replace("_", " ").split())
+
+
+"""
+Cache of natural-language query -> query JSON translations.
+
+The first layer is an in-process LRU with a TTL; the optional second layer is
+a SQLite file (WAL mode) shared by all workers on the host. Entries are keyed
+by the normalized query and a namespace (model name), so switching models
+does not serve stale translations. Only successful translations are stored.
+"""
+class TranslationCache:
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl_seconds: float = CACHE_TTL_SECONDS,
+                 db_path: Optional[str] = CACHE_DB_PATH or None, namespace: str = ""):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self.namespace = namespace
+
+        self._entries: "collections.OrderedDict[str, tuple]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+        if self.db_path:
+            self._connection().execute(
+                "CREATE TABLE IF NOT EXISTS translations "
+                "(key TEXT PRIMARY KEY, query_json TEXT NOT NULL, created_at REAL NOT NULL)")
+
+    def _key(self, user_query: str) -> str:
+        return f"{self.namespace}\x1f{normalize_query(user_query)}"
+
+    """
+    One SQLite connection per thread; sqlite3 connections are not shareable
+    across threads, nor carried over to a forked worker process.
+    """
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _remember(self, key: str, query_json: Dict[str, Any], created_at: float):
+        with self._lock:
+            self._entries[key] = (query_json, created_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    """
+    Returns a copy of the cached query JSON for user_query, or None.
+    """
+    def get(self, user_query: str) -> Optional[Dict[str, Any]]:
+        key = self._key(user_query)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] > self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(entry[0])
+
+        if self.db_path:
+            try:
+                row = self._connection().execute(
+                    "SELECT query_json, created_at FROM translations WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error as e:
+                print(f"Warning: Translation cache read failed ({e}).")
+                row = None
+            if row is not None and now - row[1] <= self.ttl_seconds:
+                query_json = json.loads(row[0])
+                self._remember(key, query_json, row[1])
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                return dict(query_json)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, user_query: str, query_json: Dict[str, Any]):
+        key = self._key(user_query)
+        created_at = time.time()
+        self._remember(key, dict(query_json), created_at)
+
+        if self.db_path:
+            try:
+                self._connection().execute(
+                    "INSERT OR REPLACE INTO translations (key, query_json, created_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(query_json), created_at))
+            except sqlite3.Error as e:
+                print(f"Warning: Translation cache write failed ({e}).")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.db_path:
+            self._connection().execute("DELETE FROM translations")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "disk_hits": self.disk_hits,
+                    "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                    "entries": len(self._entries), "persistent": bool(self.db_path)}
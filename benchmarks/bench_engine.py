@@ -0,0 +1,140 @@
+import argparse
+import collections
+import contextlib
+import gc
+import io
+import time
+
+from common import print_table, summarize, write_results
+
+from database import MovieDatabase
+from llm_interface import CineQueryEngine
+
+
+"""
+Picks the names the query mix filters by from the dataset itself: the most
+frequent actor and director (large candidate sets) and ones credited once
+(index lookups that return a single row). Only the first `sample` rows are
+counted, which is enough for a Zipf-shaped dataset.
+"""
+def pick_names(records, sample: int = 50000):
+    actors, directors = collections.Counter(), collections.Counter()
+    for i in range(min(sample, len(records))):
+        movie = records[i]
+        actors.update(movie.get("actors") or [])
+        if movie.get("director"):
+            directors[movie["director"]] += 1
+    rare_actor = next((name for name, n in reversed(actors.most_common()) if n == 1), actors.most_common(1)[0][0])
+    rare_director = next((name for name, n in reversed(directors.most_common()) if n == 1),
+                         directors.most_common(1)[0][0])
+    return {"popular_actor": actors.most_common(1)[0][0], "rare_actor": rare_actor,
+            "popular_director": directors.most_common(1)[0][0], "rare_director": rare_director}
+
+
+"""
+The query mix: one query JSON per shape the translator produces, from
+selective index lookups to full-table aggregations.
+"""
+def query_mix(names):
+    return {
+        "actor_popular": {"actor": names["popular_actor"], "sort_by": "rating", "sort_order": "desc", "limit": 5},
+        "actor_rare": {"actor": names["rare_actor"], "limit": 5},
+        "actor_partial_name": {"actor": names["popular_actor"].split()[-1], "rating_min": 7.0, "limit": 5},
+        "director_popular": {"director": names["popular_director"], "sort_by": "year", "sort_order": "asc",
+                             "limit": 10},
+        "director_rare": {"director": names["rare_director"], "limit": 5},
+        "genre_year_range": {"genre": "Horror", "year_min": 1980, "year_max": 1989, "sort_by": "rating",
+                             "sort_order": "desc", "limit": 5},
+        "genre_rating_min": {"genre": "Drama", "rating_min": 8.0, "sort_by": "rating", "sort_order": "desc",
+                             "limit": 20},
+        "title_keyword": {"title_keywords": "shadow", "sort_by": "rating", "sort_order": "desc", "limit": 5},
+        "top_rated_unfiltered": {"sort_by": "rating", "sort_order": "desc", "limit": 10},
+        "newest_unfiltered": {"sort_by": "year", "sort_order": "desc", "limit": 10},
+        "group_by_decade": {"genre": "Comedy", "group_by": "decade", "aggregates": ["count", "avg_rating"]},
+        "group_by_director_having": {"group_by": "director", "aggregates": ["count", "avg_rating"],
+                                     "having": {"count_min": 5}, "sort_by": "avg_rating", "limit": 10},
+        "no_match": {"actor": "Nobody Q. Nonexistent", "genre": "Western", "limit": 5},
+    }
+
+
+def timed_ms(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return (time.perf_counter() - started) * 1000, result
+
+
+"""
+Times loading (_initialize_database), building the query structures and
+warming the lazy indexes, each `repeat` times on fresh objects.
+"""
+def bench_load(engine: CineQueryEngine, db_path: str, label: str, repeat: int):
+    load, build, warm = [], [], []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            ms, (records, version) = timed_ms(engine._initialize_database, db_path)
+        load.append(ms)
+        ms, database = timed_ms(MovieDatabase, records, version, engine.use_columnar_store)
+        build.append(ms)
+        warm.append(timed_ms(database.warm)[0])
+        del records, database
+        gc.collect()
+    return [summarize(f"{label}/load_database", load), summarize(f"{label}/build_store", build),
+            summarize(f"{label}/warm_indexes", warm)]
+
+
+"""
+Times execute_query_json for every query of the mix: one untimed call
+first (so lazily-built indexes are excluded), then `repeat` timed ones.
+"""
+def bench_queries(engine: CineQueryEngine, queries, label: str, repeat: int):
+    results = []
+    for name, query_json in queries.items():
+        engine.execute_query_json(query_json)
+        samples = []
+        rows = 0
+        for _ in range(repeat):
+            ms, found = timed_ms(engine.execute_query_json, query_json)
+            samples.append(ms)
+            rows = len(found)
+        results.append(summarize(f"{label}/query/{name}", samples, rows=rows))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Microbenchmarks of database loading and execute_query_json over a query mix.")
+    parser.add_argument('--db', default="data/processed/movies_db.json",
+                        help="Database to benchmark (see generate_dataset.py); a .cqdb snapshot next to it is used.")
+    parser.add_argument('--engines', default="columnar,scan",
+                        help="Comma-separated engines: columnar (the NumPy store) and/or scan (the list fallback).")
+    parser.add_argument('--repeat', type=int, default=20, help="Timed runs per query.")
+    parser.add_argument('--load-repeat', type=int, default=3, help="Timed database loads per engine.")
+    parser.add_argument('--output', help="Write the results as JSON to this file (default: print them as JSON).")
+    parser.add_argument('--table', action='store_true', help="Print a table instead of JSON when no --output is given.")
+    args = parser.parse_args()
+
+    results = []
+    names = None
+    for label in [e.strip() for e in args.engines.split(",") if e.strip()]:
+        if label not in ("columnar", "scan"):
+            parser.error(f"unknown engine: {label}")
+        with contextlib.redirect_stdout(io.StringIO()):
+            engine = CineQueryEngine(args.db, use_columnar_store=label == "columnar")
+        if not engine.movie_dataset:
+            parser.error(f"no movies loaded from {args.db}")
+        if names is None:
+            names = pick_names(engine.movie_dataset)
+        engine.database.warm()
+        results.extend(bench_load(engine, args.db, label, args.load_repeat))
+        # The scan engine walks every row per query; fewer runs keep it bounded on large datasets.
+        repeat = args.repeat if label == "columnar" else max(1, min(args.repeat, 5))
+        results.extend(bench_queries(engine, query_mix(names), label, repeat))
+        del engine
+        gc.collect()
+
+    parameters = {"db": args.db, "engines": args.engines, "repeat": args.repeat, "load_repeat": args.load_repeat,
+                  "names": names}
+    if args.output or not args.table:
+        write_results(args.output, "engine", parameters, results)
+    if args.output or args.table:
+        print_table(results)
@@ -0,0 +1,102 @@
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+from typing import List, Dict, Any, Optional, Sequence
+
+# The benchmarks drive the engine modules, which live in app/.
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+APP_DIR = os.path.join(REPO_ROOT, 'app')
+sys.path.insert(0, APP_DIR)
+
+RESULTS_FORMAT_VERSION = 1
+
+
+"""
+Parses a row count such as "10k", "200k" or "2M".
+"""
+def parse_count(value: str) -> int:
+    value = value.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(value[-1:], 1)
+    return int(float(value[:-1] if scale > 1 else value) * scale)
+
+
+def percentile(values: Sequence[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+"""
+Summarizes the samples of one measurement. `better` says which direction is
+an improvement ("lower" for times, "higher" for throughput), so compare.py
+can tell a regression from a speed-up.
+"""
+def summarize(name: str, samples: Sequence[float], unit: str = "ms", better: str = "lower",
+              **details) -> Dict[str, Any]:
+    summary = {"name": name, "unit": unit, "better": better, "count": len(samples)}
+    if samples:
+        summary.update({"min": min(samples), "median": percentile(samples, 50), "p90": percentile(samples, 90),
+                        "p95": percentile(samples, 95), "p99": percentile(samples, 99), "max": max(samples),
+                        "mean": sum(samples) / len(samples)})
+        summary = {k: round(v, 4) if isinstance(v, float) else v for k, v in summary.items()}
+    summary.update(details)
+    return summary
+
+"""
+A single-valued result (e.g. throughput), in the same shape as summarize().
+"""
+def single(name: str, value: float, unit: str, better: str = "lower", **details) -> Dict[str, Any]:
+    return summarize(name, [value], unit, better, **details)
+
+
+def _git(*args) -> Optional[str]:
+    try:
+        return subprocess.run(["git", *args], cwd=REPO_ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+"""
+Where and on what the benchmark ran: commit, interpreter, libraries, host.
+"""
+def environment() -> Dict[str, Any]:
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+    status = _git("status", "--porcelain", "--untracked-files=no")
+    return {"commit": _git("rev-parse", "HEAD"), "dirty": bool(status) if status is not None else None,
+            "python": platform.python_version(), "numpy": numpy_version, "platform": platform.platform(),
+            "cpu_count": os.cpu_count(), "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat()}
+
+"""
+Writes (or prints, when path is None) a results file:
+{"format", "suite", "environment", "parameters", "results": [summaries]}.
+"""
+def write_results(path: Optional[str], suite: str, parameters: Dict[str, Any], results: List[Dict[str, Any]]):
+    document = {"format": RESULTS_FORMAT_VERSION, "suite": suite, "environment": environment(),
+                "parameters": parameters, "results": results}
+    text = json.dumps(document, indent=2)
+    if path is None:
+        print(text)
+        return
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text + "\n")
+    print(f"Results written to {path}")
+
+def print_table(results: List[Dict[str, Any]]):
+    print(f"{'benchmark':<44}{'unit':>6}{'median':>12}{'p95':>12}{'min':>12}{'n':>6}")
+    for r in results:
+        cells = [f"{r[k]:>12.3f}" if r.get(k) is not None else f"{'-':>12}" for k in ("median", "p95", "min")]
+        print(f"{r['name']:<44}{r['unit']:>6}{''.join(cells)}{r['count']:>6}")
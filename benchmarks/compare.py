@@ -0,0 +1,60 @@
+import argparse
+import json
+import sys
+
+
+def load_results(path: str):
+    with open(path, encoding="utf-8") as f:
+        document = json.load(f)
+    return document, {r["name"]: r for r in document["results"]}
+
+
+"""
+Relative change of the median from baseline to candidate, signed so that a
+positive value is an improvement whichever direction is better.
+"""
+def improvement(baseline, candidate) -> float:
+    before, after = baseline.get("median"), candidate.get("median")
+    if not before or after is None:
+        return 0.0
+    change = (after - before) / before
+    return -change if baseline.get("better", "lower") == "lower" else change
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Compares two benchmark results files by median and exits with status 1 on a regression.")
+    parser.add_argument('baseline', help="Results file of the reference run.")
+    parser.add_argument('candidate', help="Results file of the run to check.")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="Relative slow-down of a median counted as a regression (default 0.10 = 10%%).")
+    args = parser.parse_args()
+
+    base_document, baseline = load_results(args.baseline)
+    candidate_document, candidate = load_results(args.candidate)
+    print(f"baseline  {base_document['environment'].get('commit')}  {base_document['environment'].get('timestamp')}")
+    print(f"candidate {candidate_document['environment'].get('commit')}  "
+          f"{candidate_document['environment'].get('timestamp')}")
+    print(f"{'benchmark':<44}{'unit':>6}{'baseline':>12}{'candidate':>12}{'change':>9}")
+
+    regressions = []
+    for name, before in baseline.items():
+        after = candidate.get(name)
+        if after is None:
+            print(f"{name:<44}{before['unit']:>6}{before.get('median', 0):>12.3f}{'missing':>12}")
+            continue
+        delta = improvement(before, after)
+        flag = ""
+        if delta < -args.threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif delta > args.threshold:
+            flag = "  improved"
+        print(f"{name:<44}{before['unit']:>6}{before.get('median', 0):>12.3f}{after.get('median', 0):>12.3f}"
+              f"{delta:>+9.1%}{flag}")
+    for name in candidate.keys() - baseline.keys():
+        print(f"{name:<44}{candidate[name]['unit']:>6}{'new':>12}{candidate[name].get('median', 0):>12.3f}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
@@ -0,0 +1,188 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Optional
+
+# Returned for translation prompts that match none of the known queries.
+DEFAULT_TRANSLATION = {"sort_by": "rating", "sort_order": "desc", "limit": 5}
+ANSWER_SENTENCE = ("Based on the retrieved data, these movies stand out for their ratings, and the list covers "
+                   "the titles, years and genres that match your question. ")
+
+
+"""
+Stand-in for the Gemini generateContent and streamGenerateContent endpoints,
+for load tests that should measure CineQuery rather than the model. Every
+call waits latency_ms (plus up to jitter_ms); a share of them (rate_429) is
+answered with 429 and a Retry-After header instead.
+
+Translation calls (those asking for a responseSchema) get the query JSON of
+the longest known query text found in the prompt, or DEFAULT_TRANSLATION.
+Synthesis calls get a canned answer of answer_chars characters, streamed in
+stream_chunks pieces chunk_delay_ms apart on the streaming endpoint.
+"""
+class FakeGemini:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 300.0, jitter_ms: float = 0.0,
+                 rate_429: float = 0.0, retry_after: float = 1.0, answer_chars: int = 600, stream_chunks: int = 8,
+                 chunk_delay_ms: float = 30.0, translations: Optional[Dict[str, Dict[str, Any]]] = None,
+                 seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.answer = (ANSWER_SENTENCE * (answer_chars // len(ANSWER_SENTENCE) + 1))[:answer_chars]
+        self.stream_chunks = max(1, stream_chunks)
+        self.chunk_delay_ms = chunk_delay_ms
+        # Longest first, so "Tom Hanks comedies" wins over "Tom Hanks".
+        self.translations = sorted((translations or {}).items(), key=lambda item: -len(item[0]))
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"translation": 0, "synthesis": 0, "stream": 0, "rate_limited": 0, "unmatched": 0}
+
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.rstrip("/") == "/stats":
+                    with fake._lock:
+                        self._send_json(200, dict(fake.stats))
+                else:
+                    self._send_json(404, {"error": {"code": 404, "message": "Not found."}})
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                try:
+                    payload = json.loads(body)
+                except json.JSONDecodeError:
+                    self._send_json(400, {"error": {"code": 400, "message": "Invalid JSON payload."}})
+                    return
+                fake.handle(self, payload)
+
+            def _send_json(self, status: int, document: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+                data = json.dumps(document).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1beta/models"
+
+    def start(self) -> "FakeGemini":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _delay(self):
+        jitter = self._random.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0
+        time.sleep((self.latency_ms + jitter) / 1000)
+
+    def translate(self, prompt: str) -> Dict[str, Any]:
+        for text, query_json in self.translations:
+            if text in prompt:
+                return query_json
+        self._count("unmatched")
+        return DEFAULT_TRANSLATION
+
+    def _usage(self, payload: Dict[str, Any], text: str) -> Dict[str, int]:
+        prompt_chars = len(json.dumps(payload.get("contents", [])))
+        return {"promptTokenCount": prompt_chars // 4, "candidatesTokenCount": len(text) // 4,
+                "totalTokenCount": (prompt_chars + len(text)) // 4}
+
+    def handle(self, handler, payload: Dict[str, Any]):
+        self._delay()
+        if self.rate_429 and self._random.random() < self.rate_429:
+            self._count("rate_limited")
+            handler._send_json(429, {"error": {"code": 429, "message": "Resource has been exhausted.",
+                                               "status": "RESOURCE_EXHAUSTED"}},
+                               {"Retry-After": f"{self.retry_after:g}"})
+            return
+
+        prompt = "".join(part.get("text", "") for content in payload.get("contents", [])
+                         for part in content.get("parts", []))
+        if ":streamGenerateContent" in handler.path:
+            self._count("stream")
+            self._stream(handler, payload)
+            return
+        if payload.get("generationConfig", {}).get("responseSchema"):
+            self._count("translation")
+            text = json.dumps(self.translate(prompt))
+        else:
+            self._count("synthesis")
+            text = self.answer
+        handler._send_json(200, {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"},
+                                                 "finishReason": "STOP"}],
+                                 "usageMetadata": self._usage(payload, text)})
+
+    def _stream(self, handler, payload: Dict[str, Any]):
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.end_headers()
+        size = -(-len(self.answer) // self.stream_chunks)
+        pieces = [self.answer[i:i + size] for i in range(0, len(self.answer), size)]
+        for i, piece in enumerate(pieces):
+            if i:
+                time.sleep(self.chunk_delay_ms / 1000)
+            event = {"candidates": [{"content": {"parts": [{"text": piece}], "role": "model"}}]}
+            if i == len(pieces) - 1:
+                event["usageMetadata"] = self._usage(payload, self.answer)
+            data = f"data: {json.dumps(event)}\r\n\r\n".encode("utf-8")
+            handler.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            handler.wfile.flush()
+        handler.wfile.write(b"0\r\n\r\n")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Runs a local stand-in for the Gemini API. Point the engine at it with "
+                    "GEMINI_API_BASE_URL=http://<host>:<port>/v1beta/models.")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--latency-ms', type=float, default=300.0, help="Delay before every response.")
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="Extra random delay, up to this much.")
+    parser.add_argument('--rate-429', type=float, default=0.0, help="Share of calls answered with 429 (0-1).")
+    parser.add_argument('--retry-after', type=float, default=1.0, help="Retry-After seconds sent with a 429.")
+    parser.add_argument('--answer-chars', type=int, default=600, help="Length of the synthesis answer.")
+    parser.add_argument('--stream-chunks', type=int, default=8, help="Pieces a streamed answer is sent in.")
+    parser.add_argument('--chunk-delay-ms', type=float, default=30.0, help="Delay between streamed pieces.")
+    parser.add_argument('--translations',
+                        help="JSON file mapping query texts to the query JSON returned for prompts containing them.")
+    parser.add_argument('--seed', type=int, help="Seed for the jitter and 429 draws.")
+    args = parser.parse_args()
+
+    translations = None
+    if args.translations:
+        with open(args.translations, encoding="utf-8") as f:
+            translations = json.load(f)
+    fake = FakeGemini(args.host, args.port, args.latency_ms, args.jitter_ms, args.rate_429, args.retry_after,
+                      args.answer_chars, args.stream_chunks, args.chunk_delay_ms, translations, args.seed)
+    print(f"Fake Gemini API listening on {fake.base_url} (stats at /stats).")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        fake.stop()
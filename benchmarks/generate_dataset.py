@@ -0,0 +1,155 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from common import parse_count
+
+from people import encode_records, movie_lines, write_people_db
+from snapshot import write_snapshot
+
+# Genres ordered by how common they are on IMDb; the generator draws them from a Zipf distribution in this order.
+GENRES = ["Drama", "Comedy", "Documentary", "Romance", "Action", "Thriller", "Crime", "Horror", "Adventure",
+          "Family", "Mystery", "Biography", "Fantasy", "History", "Music", "Sci-Fi", "Animation", "War",
+          "Musical", "Sport", "Western", "Adult", "Film-Noir", "News", "Reality-TV", "Talk-Show", "Game-Show"]
+FIRST_NAMES = ["James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael", "Linda", "William", "Elizabeth",
+               "David", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas", "Sarah", "Charles", "Karen",
+               "Christopher", "Nancy", "Daniel", "Lisa", "Matthew", "Betty", "Anthony", "Margaret", "Mark", "Sandra",
+               "Akira", "Yuki", "Hiroshi", "Mei", "Wei", "Priya", "Arjun", "Aisha", "Omar", "Fatima", "Carlos",
+               "Sofia", "Luis", "Valentina", "Pierre", "Amelie", "Hans", "Greta", "Ivan", "Olga", "Marco", "Giulia",
+               "Sven", "Ingrid", "Kwame", "Amara", "Diego", "Lucia", "Raj", "Ananya"]
+LAST_NAMES = ["Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez",
+              "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin",
+              "Lee", "Perez", "Thompson", "White", "Harris", "Sanchez", "Clark", "Ramirez", "Lewis", "Robinson",
+              "Tanaka", "Suzuki", "Watanabe", "Kim", "Park", "Chen", "Wang", "Singh", "Kumar", "Sharma", "Khan",
+              "Ali", "Silva", "Santos", "Rossi", "Russo", "Dubois", "Lefebvre", "Muller", "Schmidt", "Ivanov",
+              "Petrov", "Nilsson", "Larsen", "Mensah", "Okafor", "Novak", "Kowalski", "Costa", "Fischer"]
+TITLE_WORDS = ["Love", "Night", "Last", "Man", "Day", "Story", "Life", "Dead", "Girl", "House", "Black", "City",
+               "Time", "Blood", "Dark", "World", "Lost", "Home", "King", "Death", "Secret", "Red", "Summer", "Return",
+               "Wild", "Heart", "Road", "Game", "Dream", "War", "Island", "Shadow", "River", "Moon", "Fire", "Ghost",
+               "Street", "Bridge", "Star", "Family", "Little", "Big", "Silent", "Golden", "Broken", "Long", "Winter",
+               "Angel", "Devil", "Storm", "Journey", "Dawn", "Stranger", "Garden", "Empire", "Memory", "Sea",
+               "Mountain", "Train", "Hotel", "Paradise", "Hunter", "Lady", "Promise", "Kiss", "Revenge", "Escape"]
+TITLE_ARTICLES = ["The ", "", "", "A ", ""]
+
+# Zipf exponent for actor, director, genre and title-word popularity (rank r is drawn with weight 1 / r^s).
+DEFAULT_ZIPF_EXPONENT = 1.1
+MEAN_ACTORS = 4.0
+MAX_ACTORS = 15
+NO_DIRECTOR_SHARE = 0.05
+
+
+"""
+Unique, deterministic person name for a rank: first and last names cycle,
+then middle initials disambiguate.
+"""
+def person_name(index: int) -> str:
+    first = FIRST_NAMES[index % len(FIRST_NAMES)]
+    last = LAST_NAMES[(index // len(FIRST_NAMES)) % len(LAST_NAMES)]
+    k = index // (len(FIRST_NAMES) * len(LAST_NAMES))
+    initials = ""
+    while k:
+        k, letter = divmod(k - 1, 26)
+        initials = chr(ord("A") + letter) + initials
+    return f"{first} {initials}. {last}" if initials else f"{first} {last}"
+
+
+"""
+Draws `size` ranks in [0, n) with probability proportional to 1 / (rank+1)^s.
+"""
+def zipf_draws(rng: np.random.Generator, n: int, size: int, exponent: float) -> np.ndarray:
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    cumulative = np.cumsum(weights)
+    return np.searchsorted(cumulative, rng.random(size) * cumulative[-1], side="right").clip(max=n - 1)
+
+
+"""
+Generates `rows` movie records shaped like the processor's output (title,
+year, genres, rating, director, actors; highest rated first). Actors,
+directors, genres and title words follow Zipf distributions, so a few names
+appear in thousands of movies and most in one or two.
+"""
+def generate_records(rows: int, people: int, seed: int = 0, exponent: float = DEFAULT_ZIPF_EXPONENT):
+    rng = np.random.default_rng(seed)
+    names = [person_name(i) for i in range(people)]
+    # Separate popularity orders, so the most frequent directors are not also the most frequent actors.
+    actor_rank = rng.permutation(people)
+    director_rank = rng.permutation(people)
+
+    years = rng.triangular(1915, 2024, 2024, rows).astype(np.int64)
+    ratings = np.round(np.clip(rng.normal(6.4, 1.2, rows), 1.0, 10.0), 1)
+
+    genre_counts = rng.choice([1, 2, 3], size=rows, p=[0.45, 0.35, 0.2])
+    genre_draws = zipf_draws(rng, len(GENRES), int(genre_counts.sum()), exponent)
+    genre_offsets = np.concatenate([[0], np.cumsum(genre_counts)])
+
+    actor_counts = np.minimum(rng.poisson(MEAN_ACTORS, rows), MAX_ACTORS)
+    actor_draws = actor_rank[zipf_draws(rng, people, int(actor_counts.sum()), exponent)]
+    actor_offsets = np.concatenate([[0], np.cumsum(actor_counts)])
+
+    directors = director_rank[zipf_draws(rng, people, rows, exponent)]
+    has_director = rng.random(rows) >= NO_DIRECTOR_SHARE
+
+    word_counts = rng.integers(1, 4, rows)
+    word_draws = zipf_draws(rng, len(TITLE_WORDS), int(word_counts.sum()), exponent)
+    word_offsets = np.concatenate([[0], np.cumsum(word_counts)])
+    articles = rng.integers(0, len(TITLE_ARTICLES), rows)
+
+    records = []
+    for i in np.argsort(-ratings, kind="stable").tolist():
+        words = [TITLE_WORDS[w] for w in word_draws[word_offsets[i]:word_offsets[i + 1]].tolist()]
+        genres = []
+        for g in genre_draws[genre_offsets[i]:genre_offsets[i + 1]].tolist():
+            if GENRES[g] not in genres:
+                genres.append(GENRES[g])
+        actors = []
+        for a in actor_draws[actor_offsets[i]:actor_offsets[i + 1]].tolist():
+            if names[a] not in actors:
+                actors.append(names[a])
+        records.append({"title": TITLE_ARTICLES[articles[i]] + " ".join(words), "year": int(years[i]),
+                        "genres": genres, "rating": float(ratings[i]),
+                        "director": names[directors[i]] if has_director[i] else None, "actors": actors})
+    return records
+
+
+"""
+Writes the records in the people format (as the data processor does) or as
+a plain list, plus the binary snapshot when asked for.
+"""
+def write_dataset(records, output: str, plain: bool = False, snapshot: bool = False):
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if plain:
+        with open(output + ".tmp", "w", encoding="utf-8") as f:
+            f.write("[\n" + ",\n".join(movie_lines(records)) + "\n]\n")
+        os.replace(output + ".tmp", output)
+    else:
+        people, movies = encode_records(records)
+        write_people_db(output, people, movie_lines(movies))
+    if snapshot:
+        write_snapshot(records, os.path.splitext(output)[0] + ".cqdb")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generates a synthetic movies_db.json for benchmarks.")
+    parser.add_argument('--rows', default="200k", help="Number of movies, e.g. 10k, 200k or 2M.")
+    parser.add_argument('--people', help="Distinct actors and directors (default: half the rows).")
+    parser.add_argument('--output', help="Output path (default: data/benchmark/movies_db_<rows>.json).")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed; the same seed gives the same file.")
+    parser.add_argument('--zipf', type=float, default=DEFAULT_ZIPF_EXPONENT,
+                        help="Zipf exponent of actor, director, genre and title-word popularity.")
+    parser.add_argument('--plain', action='store_true', help="Write a plain list of records instead of the people format.")
+    parser.add_argument('--snapshot', action='store_true', help="Also write the binary snapshot (.cqdb) next to it.")
+    args = parser.parse_args()
+
+    rows = parse_count(args.rows)
+    people = parse_count(args.people) if args.people else max(rows // 2, 100)
+    output = args.output or os.path.join("data", "benchmark", f"movies_db_{args.rows.lower()}.json")
+
+    started = time.perf_counter()
+    records = generate_records(rows, people, args.seed, args.zipf)
+    print(f"Generated {rows} movies over {people} people in {time.perf_counter() - started:.1f}s.")
+    write_dataset(records, output, args.plain, args.snapshot)
+    print(f"Wrote {output} ({os.path.getsize(output) / 1e6:.1f} MB) in {time.perf_counter() - started:.1f}s total.")
@@ -0,0 +1,210 @@
+import argparse
+import collections
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from common import REPO_ROOT, percentile, print_table, single, summarize, write_results
+from fake_gemini import FakeGemini
+
+# Queries sent by the simulated clients, with the query JSON the fake model translates each one into.
+LOAD_QUERIES = {
+    "best horror movies from the 1980s": {"genre": "Horror", "year_min": 1980, "year_max": 1989,
+                                          "sort_by": "rating", "sort_order": "desc", "limit": 5},
+    "top rated dramas of 1994": {"genre": "Drama", "year_min": 1994, "year_max": 1994, "sort_by": "rating",
+                                 "sort_order": "desc", "limit": 5},
+    "comedies rated above 8": {"genre": "Comedy", "rating_min": 8.0, "sort_by": "rating", "sort_order": "desc",
+                               "limit": 10},
+    "newest sci-fi movies": {"genre": "Sci-Fi", "sort_by": "year", "sort_order": "desc", "limit": 5},
+    "movies with shadow in the title": {"title_keywords": "shadow", "sort_by": "rating", "sort_order": "desc",
+                                        "limit": 5},
+    "how many westerns were made per decade": {"genre": "Western", "group_by": "decade", "aggregates": ["count"]},
+    "which directors have the best average rating": {"group_by": "director", "aggregates": ["count", "avg_rating"],
+                                                     "having": {"count_min": 5}, "sort_by": "avg_rating",
+                                                     "limit": 10},
+    "the highest rated movies of all time": {"sort_by": "rating", "sort_order": "desc", "limit": 10},
+}
+SERVER_START_TIMEOUT = 600
+
+
+"""
+Starts gunicorn with gunicorn.conf.py, pointed at the fake Gemini server,
+and waits until it answers. The fast-path parser is disabled unless asked
+for, so every uncached query goes through the (fake) model translation.
+"""
+def start_server(bind: str, db_path: str, workers: int, threads: int, gemini_url: str, fast_parser: bool,
+                 preload: bool, log_path: str):
+    env = dict(os.environ, GEMINI_API_BASE_URL=gemini_url, GEMINI_API_KEY="fake-key",
+               CINEQUERY_DB_PATH=os.path.abspath(db_path), CINEQUERY_BIND=bind, CINEQUERY_WORKERS=str(workers),
+               CINEQUERY_THREADS=str(threads), CINEQUERY_PRELOAD="1" if preload else "0",
+               # The fake model has no quota: only the simulated 429s limit it.
+               GEMINI_RPM="0", GEMINI_TPM="0")
+    if not fast_parser:
+        env["CINEQUERY_FAST_PARSER_CONFIDENCE"] = "2"
+    log = open(log_path, "w")
+    process = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", os.path.join(REPO_ROOT, "gunicorn.conf.py")],
+                               cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://{bind}"
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {process.returncode}; see {log_path}")
+        try:
+            if requests.get(url + "/", timeout=2).status_code == 200:
+                return process, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"gunicorn did not start within {SERVER_START_TIMEOUT}s; see {log_path}")
+
+
+"""
+Sends one query and returns {"latency_ms", "status", "first_token_ms"}.
+Streaming queries are read to the end; first_token_ms is when the first
+answer text arrived (None for a blocking query).
+"""
+def send_query(session: requests.Session, url: str, text: str, stream: bool):
+    started = time.perf_counter()
+    first_token_ms = None
+    try:
+        if stream:
+            with session.post(url + "/query/stream", json={"query": text}, stream=True, timeout=120) as response:
+                status = str(response.status_code)
+                event = None
+                for line in response.iter_lines(decode_unicode=True):
+                    if line.startswith("event:"):
+                        event = line[len("event:"):].strip()
+                        if event == "token" and first_token_ms is None:
+                            first_token_ms = (time.perf_counter() - started) * 1000
+                        elif event == "error":
+                            status = "stream_error"
+        else:
+            response = session.post(url + "/query", json={"query": text}, timeout=120)
+            status = str(response.status_code)
+    except requests.RequestException as e:
+        status = type(e).__name__
+    return {"latency_ms": (time.perf_counter() - started) * 1000, "status": status,
+            "first_token_ms": first_token_ms}
+
+
+"""
+Runs `total` queries from `clients` concurrent clients, each waiting for its
+answer before sending the next (a closed loop). With unique=True every query
+text gets a distinct suffix, so neither the translation cache nor request
+coalescing can answer it.
+"""
+def run_load(url: str, total: int, clients: int, stream: bool, unique: bool):
+    texts = list(LOAD_QUERIES)
+    counter = iter(range(total))
+    lock = threading.Lock()
+    samples = []
+
+    def client(_):
+        session = requests.Session()
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            text = texts[i % len(texts)] + (f" (request {i})" if unique else "")
+            sample = send_query(session, url, text, stream)
+            with lock:
+                samples.append(sample)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(client, range(clients)))
+    return samples, time.perf_counter() - started
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="End-to-end load test of the Flask /query endpoint (served by gunicorn) against a local "
+                    "fake Gemini server.")
+    parser.add_argument('--db', default="data/processed/movies_db.json", help="Database the server loads.")
+    parser.add_argument('--url', help="Load an already running server instead of starting one; point it at a "
+                                      "fake_gemini.py started with --translations from --dump-translations.")
+    parser.add_argument('--dump-translations', metavar="PATH",
+                        help="Write the query texts and their translations for fake_gemini.py, then exit.")
+    parser.add_argument('--bind', default="127.0.0.1:5077", help="Address of the gunicorn server started here.")
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn workers.")
+    parser.add_argument('--threads', type=int, default=8, help="Threads per gunicorn worker.")
+    parser.add_argument('--no-preload', action='store_true', help="Load the database in every worker.")
+    parser.add_argument('--fast-parser', action='store_true',
+                        help="Keep the fast-path parser on (by default every translation goes to the fake model).")
+    parser.add_argument('--clients', type=int, default=16, help="Concurrent clients.")
+    parser.add_argument('--requests', type=int, default=500, help="Total queries sent.")
+    parser.add_argument('--warmup', type=int, default=20, help="Untimed queries sent first.")
+    parser.add_argument('--stream', action='store_true', help="Use /query/stream and measure time to first token.")
+    parser.add_argument('--unique', action='store_true',
+                        help="Make every query distinct (no translation cache hits or coalescing).")
+    parser.add_argument('--latency-ms', type=float, default=300.0, help="Fake model latency per call.")
+    parser.add_argument('--jitter-ms', type=float, default=100.0, help="Fake model random extra latency.")
+    parser.add_argument('--rate-429', type=float, default=0.0, help="Share of fake model calls answered with 429.")
+    parser.add_argument('--retry-after', type=float, default=1.0, help="Retry-After of the fake 429s.")
+    parser.add_argument('--stream-chunks', type=int, default=8, help="Pieces of a streamed fake answer.")
+    parser.add_argument('--chunk-delay-ms', type=float, default=30.0, help="Delay between streamed pieces.")
+    parser.add_argument('--gemini-port', type=int, default=0, help="Port of the fake Gemini server (0: any free).")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write the results as JSON to this file (default: print them as JSON).")
+    args = parser.parse_args()
+
+    if args.dump_translations:
+        with open(args.dump_translations, "w", encoding="utf-8") as f:
+            json.dump(LOAD_QUERIES, f, indent=2)
+        sys.exit(0)
+
+    fake = None
+    server = None
+    try:
+        if args.url:
+            url = args.url.rstrip("/")
+        else:
+            fake = FakeGemini("127.0.0.1", args.gemini_port, args.latency_ms, args.jitter_ms, args.rate_429,
+                              args.retry_after, stream_chunks=args.stream_chunks,
+                              chunk_delay_ms=args.chunk_delay_ms, translations=LOAD_QUERIES, seed=args.seed).start()
+            log_path = os.path.join(tempfile.gettempdir(), "cinequery_load_test_server.log")
+            print(f"Starting gunicorn ({args.workers} workers) on {args.bind}; log in {log_path}...", file=sys.stderr)
+            server, url = start_server(args.bind, args.db, args.workers, args.threads, fake.base_url,
+                                       args.fast_parser, not args.no_preload, log_path)
+
+        if args.warmup:
+            run_load(url, args.warmup, min(args.clients, args.warmup), args.stream, False)
+        if fake is not None:
+            with fake._lock:
+                fake.stats = dict.fromkeys(fake.stats, 0)
+
+        samples, elapsed = run_load(url, args.requests, args.clients, args.stream, args.unique)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        if fake is not None:
+            fake.stop()
+
+    statuses = collections.Counter(s["status"] for s in samples)
+    succeeded = [s for s in samples if s["status"] == "200"]
+    mode = "stream" if args.stream else "query"
+    results = [single(f"e2e/{mode}/throughput", len(samples) / elapsed, "req/s", better="higher"),
+               summarize(f"e2e/{mode}/latency", [s["latency_ms"] for s in succeeded],
+                         statuses=dict(statuses), error_rate=round(1 - len(succeeded) / max(len(samples), 1), 4))]
+    if args.stream:
+        first_tokens = [s["first_token_ms"] for s in succeeded if s["first_token_ms"] is not None]
+        results.append(summarize("e2e/stream/first_token", first_tokens))
+
+    parameters = {k: v for k, v in vars(args).items() if k != "output"}
+    if fake is not None:
+        parameters["fake_gemini_calls"] = fake.stats
+    write_results(args.output, "load", parameters, results)
+    if args.output:
+        print(f"{len(samples)} queries in {elapsed:.1f}s; statuses {dict(statuses)}; "
+              f"p50 {percentile([s['latency_ms'] for s in succeeded], 50) or 0:.0f} ms")
+        print_table(results)
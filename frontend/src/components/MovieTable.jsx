@@ -1,12 +1,80 @@
 import classNames from 'classnames';
+import {Loader} from "lucide-react";
+
+// Further rows are fetched a page at a time from the query's result cursor (see fetchCineQueryPage).
+const LoadMore = ({ shown, totalRows, hasMore, isLoadingMore, onLoadMore, pageError }) => {
+    if (!hasMore && !pageError) return null;
+
+    return (
+        <div className="flex flex-col items-center p-4 bg-white border-t border-gray-200">
+            {pageError && <p className="mb-2 text-sm text-red-700">{pageError.message}</p>}
+            {hasMore && (
+                <button
+                    onClick={onLoadMore}
+                    disabled={isLoadingMore}
+                    className={`px-4 py-2 rounded-lg text-sm font-semibold flex items-center transition duration-200
+                        ${isLoadingMore
+                        ? 'bg-gray-200 text-gray-500 cursor-not-allowed'
+                        : 'bg-indigo-600 hover:bg-indigo-700 text-white shadow-md'
+                    }`}
+                >
+                    {isLoadingMore && <Loader className="w-4 h-4 mr-2 animate-spin" />}
+                    Load more ({shown} of {totalRows})
+                </button>
+            )}
+        </div>
+    );
+};
 
 const MovieTable = results => {
     if (!results || !results?.data || results?.data?.length === 0) return null;
 
     const data = results.data;
+    const loadMore = (
+        <LoadMore
+            shown={data.length}
+            totalRows={results.totalRows}
+            hasMore={results.hasMore}
+            isLoadingMore={results.isLoadingMore}
+            onLoadMore={results.onLoadMore}
+            pageError={results.pageError}
+        />
+    );
     const formatList = (list) => Array.isArray(list) ? list.join(', ') : 'N/A';
     const thClassName = 'px-6 py-3 text-center text-xs font-medium text-gray-700 uppercase tracking-wider';
 
+    // Aggregation queries return one row per group (e.g. decade, count, avg_rating) instead of movies.
+    if (!('title' in data[0])) {
+        const columns = Object.keys(data[0]);
+        return (
+            <div className="mt-6 overflow-x-auto shadow-xl rounded-xl">
+                <table className="min-w-full divide-y divide-gray-200">
+                    <thead className="bg-indigo-50">
+                    <tr>
+                        {columns.map(column => (
+                            <th key={column} scope="col" className={thClassName}>
+                                {column.replace('_', ' ')}
+                            </th>
+                        ))}
+                    </tr>
+                    </thead>
+                    <tbody className="bg-white divide-y divide-gray-200">
+                    {data.map((group, index) => (
+                        <tr key={index} className="hover:bg-gray-50 transition duration-150">
+                            {columns.map(column => (
+                                <td key={column} className="px-6 py-4 whitespace-nowrap text-sm text-center text-gray-700">
+                                    {group[column] ?? 'N/A'}
+                                </td>
+                            ))}
+                        </tr>
+                    ))}
+                    </tbody>
+                </table>
+                {loadMore}
+            </div>
+        );
+    }
+
     return (
         <div className="mt-6 overflow-x-auto shadow-xl rounded-xl">
             <table className="min-w-full divide-y divide-gray-200">
@@ -57,6 +125,7 @@ const MovieTable = results => {
                 ))}
                 </tbody>
             </table>
+            {loadMore}
         </div>
     );
 }
@@ -1,6 +1,6 @@
 import {Film, Loader, XCircle, Zap} from "lucide-react";
 
-const ResultDisplay = (isLoading, error, results, MovieTable) => {
+const ResultDisplay = (isLoading, error, results, MovieTable, isStreaming = false) => {
     if (isLoading) {
         return (
             <div className="flex flex-col items-center justify-center p-10 bg-white rounded-xl shadow-inner border border-indigo-100">
@@ -40,8 +40,13 @@ const ResultDisplay = (isLoading, error, results, MovieTable) => {
                     <div className="flex items-start">
                         <Zap className="w-6 h-6 text-indigo-600 mr-3 flex-shrink-0 mt-0.5" />
                         <div>
-                            <h3 className="text-lg font-bold text-indigo-800 mb-1">CineQuery Analyst Response</h3>
-                            <p className="text-gray-700 whitespace-pre-wrap">{results.answer}</p>
+                            <h3 className="text-lg font-bold text-indigo-800 mb-1 flex items-center">
+                                CineQuery Analyst Response
+                                {isStreaming && <Loader className="w-4 h-4 ml-2 text-indigo-500 animate-spin" />}
+                            </h3>
+                            <p className="text-gray-700 whitespace-pre-wrap">
+                                {results.answer || (isStreaming && <span className="text-gray-500 italic">Writing a summary of these results...</span>)}
+                            </p>
                         </div>
                     </div>
                 </div>
@@ -1,6 +1,6 @@
 import React, {useState, useCallback, useMemo} from 'react';
 import { Search, Loader, Film, XCircle, Zap } from 'lucide-react';
-import {runCineQuery, runCineQueryPlaceholder} from '../helpers/runCineQuery';
+import {fetchCineQueryPage, runCineQuery, runCineQueryPlaceholder, runCineQueryStream} from '../helpers/runCineQuery';
 
 // Components
 import Header from '../components/Header.jsx';
@@ -11,38 +11,89 @@ const CineQueryContainer = () => {
     const [query, setQuery] = useState('');
     const [results, setResults] = useState(null);
     const [isLoading, setIsLoading] = useState(false);
+    const [isStreaming, setIsStreaming] = useState(false);
     const [error, setError] = useState(null);
+    const [isLoadingMore, setIsLoadingMore] = useState(false);
+    const [pageError, setPageError] = useState(null);
 
     const handleSearch = useCallback(async () => {
         if (!query.trim()) return;
 
         setIsLoading(true);
+        setIsStreaming(false);
         setError(null);
         setResults(null);
+        setPageError(null);
 
         try {
             // const response = await runCineQueryPlaceholder(query.trim());
-            const response = await runCineQuery(query.trim());
+            // const response = await runCineQuery(query.trim());
 
-            if (response.status === 'success') setResults(response);
-            else if (response.status === 'error') setError(response);
+            // Rows are shown as soon as the database query returns; the answer fills in as it streams.
+            await runCineQueryStream(query.trim(), {
+                onData: (data, paging) => {
+                    setResults({
+                        status: 'success', query: query.trim(), data: data, answer: '',
+                        cursor: paging?.cursor, total_rows: paging?.total_rows, next_offset: paging?.next_offset,
+                    });
+                    setIsStreaming(true);
+                    setIsLoading(false);
+                },
+                onToken: (text) => setResults(prev => prev ? { ...prev, answer: prev.answer + text } : prev),
+                // Keep any pages loaded while the answer was streaming.
+                onDone: (response) => setResults(prev => prev?.cursor && prev.cursor === response.cursor
+                    ? { ...response, data: prev.data, next_offset: prev.next_offset }
+                    : response),
+                onError: (response) => setError(response),
+            });
         }
         catch (err) {
             setError({ message: 'An unexpected network error occurred.', details: err.message });
         }
         finally {
             setIsLoading(false);
+            setIsStreaming(false);
         }
     }, [query]);
 
+    // Appends the next page of the result cursor to the table; no new LLM calls are made.
+    const cursor = results?.cursor;
+    const nextOffset = results?.next_offset;
+    const handleLoadMore = useCallback(async () => {
+        if (!cursor || nextOffset == null) return;
+
+        setIsLoadingMore(true);
+        setPageError(null);
+        const page = await fetchCineQueryPage(cursor, nextOffset);
+        if (page.status === 'success') {
+            setResults(prev => prev?.cursor === cursor
+                ? { ...prev, data: [...prev.data, ...page.data], next_offset: page.next_offset }
+                : prev);
+        }
+        else {
+            setPageError(page);
+        }
+        setIsLoadingMore(false);
+    }, [cursor, nextOffset]);
+
     const handleKeyPress = useCallback((e) => {
         if (e.key === 'Enter') {
             handleSearch();
         }
     }, [handleSearch]);
 
-    const MemoMovieTable = useMemo(() => MovieTable(results), [results]);
-    const MemoResultDisplay = useMemo(() => ResultDisplay(isLoading, error, results, MemoMovieTable), [isLoading, error, results, MemoMovieTable])
+    // Keyed on the rows and paging state, so streamed answer tokens do not re-render the table.
+    const rows = results?.data;
+    const totalRows = results?.total_rows;
+    const MemoMovieTable = useMemo(() => MovieTable(rows ? {
+        data: rows,
+        totalRows: totalRows,
+        hasMore: nextOffset != null,
+        isLoadingMore: isLoadingMore,
+        onLoadMore: handleLoadMore,
+        pageError: pageError,
+    } : null), [rows, totalRows, nextOffset, isLoadingMore, handleLoadMore, pageError]);
+    const MemoResultDisplay = useMemo(() => ResultDisplay(isLoading, error, results, MemoMovieTable, isStreaming), [isLoading, error, results, MemoMovieTable, isStreaming])
 
     return (
         <div className="min-h-screen bg-gray-100 font-[Inter] p-4 sm:p-8">
@@ -128,3 +128,120 @@ export const runCineQuery = async (query) => {
     }
 };
 
+
+/**
+ * Streaming API Call (server-sent events from /query/stream)
+ * The handlers are called as each part of the response arrives:
+ *   onQuery(payload)  the structured query the backend ran
+ *   onData(rows, paging)  the first page of matching movies, before the answer is written,
+ *                         with its cursor fields (cursor, total_rows, next_offset)
+ *   onToken(text)     the next chunk of the conversational answer
+ *   onDone(response)  the complete response, same shape as runCineQuery's
+ *   onError(error)    an error object, same shape as runCineQuery's
+ * @param {string} query The natural language query string.
+ * @param {Object} handlers Event callbacks (all optional).
+ * @returns {Promise<void>} Resolves once the stream has ended.
+ */
+export const runCineQueryStream = async (query, handlers = {}) => {
+    const API_URL = 'http://localhost:5001/query/stream';
+    const { onQuery, onData, onToken, onDone, onError } = handlers;
+
+    const dispatch = (event, payload) => {
+        if (event === 'query') onQuery?.(payload);
+        else if (event === 'data') onData?.(payload.data, payload);
+        else if (event === 'token') onToken?.(payload.text);
+        else if (event === 'done') onDone?.(payload);
+        else if (event === 'error') onError?.(payload);
+    };
+
+    try {
+        const response = await fetch(API_URL, {
+            method: 'POST',
+            mode: 'cors',
+            headers: {
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream',
+            },
+            body: JSON.stringify({ query: query }),
+        });
+
+        if (!response.ok || !response.body) {
+            try {
+                onError?.(await response.json());
+            } catch (e) {
+                onError?.({
+                    status: 'error',
+                    message: `HTTP Error: ${response.status} ${response.statusText}`,
+                    llm_output: `Attempted to query backend at ${API_URL} but received status ${response.status}.`
+                });
+            }
+            return;
+        }
+
+        // Events are separated by a blank line; each has an "event:" and a "data:" line.
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const block = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let event = 'message';
+                let data = '';
+                for (const line of block.split('\n')) {
+                    if (line.startsWith('event:')) event = line.slice(6).trim();
+                    else if (line.startsWith('data:')) data += line.slice(5).trim();
+                }
+                if (data) dispatch(event, JSON.parse(data));
+            }
+        }
+    } catch (error) {
+        console.error("Network Error:", error);
+        onError?.({
+            status: 'error',
+            message: 'Network connection failed. Ensure the Python backend is running on http://localhost:5001 and accessible.',
+            details: error.message
+        });
+    }
+};
+
+
+/**
+ * Further page of an earlier query's results (/query/page)
+ * Pages come from the backend's result cache, without new LLM calls.
+ * @param {string} cursor The cursor returned with the query's response.
+ * @param {number} offset Index of the first row to return.
+ * @param {number} limit Number of rows to return (at most 100).
+ * @returns {Promise<Object>} { status, data, next_offset, total_rows, ... } or an error object
+ *   (expired: true when the database was reloaded and the query has to be run again).
+ */
+export const fetchCineQueryPage = async (cursor, offset, limit = 25) => {
+    const API_URL = 'http://localhost:5001/query/page';
+    const params = new URLSearchParams({ cursor: cursor, offset: String(offset), limit: String(limit) });
+
+    try {
+        const response = await fetch(`${API_URL}?${params}`, { method: 'GET', mode: 'cors' });
+        try {
+            return await response.json();
+        } catch (e) {
+            return {
+                status: 'error',
+                message: `HTTP Error: ${response.status} ${response.statusText}`,
+            };
+        }
+    } catch (error) {
+        console.error("Network Error:", error);
+        return {
+            status: 'error',
+            message: 'Network connection failed. Ensure the Python backend is running on http://localhost:5001 and accessible.',
+            details: error.message
+        };
+    }
+};
@@ -0,0 +1,31 @@
+import gc
+import os
+
+# Multi-worker serving of app/server.py:  gunicorn -c gunicorn.conf.py
+#
+# In preload mode (the default) the master imports the app once: it loads the
+# database, builds every index and freezes the objects (CineQueryEngine.freeze)
+# before forking, so the workers share those pages copy-on-write instead of
+# each loading its own copy. CINEQUERY_PRELOAD=0 loads the app in every worker.
+# Measure with scripts/measure_memory.py.
+
+chdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app")
+wsgi_app = "server:app"
+bind = os.environ.get("CINEQUERY_BIND", "0.0.0.0:5001")
+workers = int(os.environ.get("CINEQUERY_WORKERS", "4"))
+# Threads per worker; queries mostly wait on Gemini, and the engine is thread-safe.
+threads = int(os.environ.get("CINEQUERY_THREADS", "8"))
+timeout = int(os.environ.get("CINEQUERY_WORKER_TIMEOUT", "60"))
+
+preload_app = os.environ.setdefault("CINEQUERY_PRELOAD", "1") == "1"
+if preload_app:
+    # No collections while the master builds the database: a collection would
+    # only touch objects that are about to be frozen anyway.
+    gc.disable()
+
+
+def post_fork(arbiter, worker):
+    if preload_app:
+        gc.enable()
+    import server
+    server.start_worker()
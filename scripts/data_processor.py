@@ -1,14 +1,47 @@
 import pandas as pd
+import argparse
+import functools
+import hashlib
+import io
 import json
 import os
+import sys
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import pyarrow  # noqa: F401  (enables Parquet for cached intermediate frames)
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+# The snapshot format is shared with the engine, which lives in app/.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+from snapshot import write_snapshot
+from people import InternedRows, encode_records, is_people_db, movie_lines, write_people_db
 
 # Configuration
 RAW_DATA_PATH = 'data/raw'
 OUTPUT_FILE = 'data/processed/movies_db.json'
+SNAPSHOT_FILE = 'data/processed/movies_db.cqdb'
+IDS_FILE = 'data/processed/movies_db.ids.json'
+DELTA_FILE = 'data/processed/movies_db.delta.json'
+CACHE_DIR = 'data/cache'
+CACHE_VERSION = 1
 TARGET_MOVIE_TYPES = ['movie', 'tvMovie']
 MIN_RATING_VOTES = 10
 MAX_MOVIES = 200000
+ACTOR_CATEGORIES = ['actor', 'actress']
+
+# Streaming mode: per-chunk memory budget and rough in-memory cost of one parsed TSV row
+DEFAULT_MEMORY_BUDGET_MB = 512
+BYTES_PER_ROW_ESTIMATE = {
+    'title.basics.tsv': 400,
+    'title.ratings.tsv': 120,
+    'title.crew.tsv': 200,
+    'title.principals.tsv': 250,
+    'name.basics.tsv': 250,
+}
 
 """
 Loads a TSV file into a DataFrame.
@@ -23,24 +56,9 @@ def load_tsv(path):
         return pd.DataFrame()
 
 """
-Loads, cleans, joins, and subsets the raw IMDb data files.
+Filters title.basics to movies with a year and genres.
 """
-def load_and_clean_data():
-    print("Starting data processing...")
-
-    os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
-
-    # Load Core Data
-    basics_df = load_tsv(os.path.join(RAW_DATA_PATH, 'title.basics.tsv'))
-    ratings_df = load_tsv(os.path.join(RAW_DATA_PATH, 'title.ratings.tsv'))
-    crew_df = load_tsv(os.path.join(RAW_DATA_PATH, 'title.crew.tsv'))
-    principals_df = load_tsv(os.path.join(RAW_DATA_PATH, 'title.principals.tsv'))
-    names_df = load_tsv(os.path.join(RAW_DATA_PATH, 'name.basics.tsv'))
-
-    if basics_df.empty or ratings_df.empty or crew_df.empty or names_df.empty:
-        print("Aborting data processing due to missing files.")
-        return
-
+def clean_basics(basics_df):
     # Drop missing years/genres early
     basics_df = basics_df[basics_df['titleType'].isin(TARGET_MOVIE_TYPES)]
     basics_df = basics_df.dropna(subset=['startYear', 'genres'])
@@ -53,13 +71,23 @@ def load_and_clean_data():
                                           'genres': 'genres'})
     basics_df = basics_df[['tconst', 'title', 'year', 'genres']]
     print(f"Loaded {len(basics_df)} basic movie titles.")
+    return basics_df
 
+"""
+Filters title.ratings to titles with enough votes.
+"""
+def clean_ratings(ratings_df):
     # Filter for movies with min rating votes
     ratings_df = ratings_df[ratings_df['numVotes'] >= MIN_RATING_VOTES]
     ratings_df = ratings_df.rename(columns={'averageRating': 'rating'})
     ratings_df = ratings_df[['tconst', 'rating']]
     print(f"Loaded {len(ratings_df)} rated titles with >= {MIN_RATING_VOTES} votes.")
+    return ratings_df
 
+"""
+Joins basics and ratings and keeps the MAX_MOVIES highest-rated titles.
+"""
+def select_movies(basics_df, ratings_df):
     # Join Basics and Ratings
     movies_df = pd.merge(basics_df, ratings_df, on='tconst', how='inner')
     print(f"Joined titles and ratings: {len(movies_df)} records remaining.")
@@ -70,8 +98,12 @@ def load_and_clean_data():
     movies_df['year'] = movies_df['year'].astype(int)
 
     # Sort by rating and limit the dataset size for in-memory use
-    movies_df = movies_df.sort_values(by='rating', ascending=False).head(MAX_MOVIES)
+    return movies_df.sort_values(by='rating', ascending=False).head(MAX_MOVIES)
 
+"""
+Maps each title to the name of its first-listed director.
+"""
+def build_directors(crew_df, names_df):
     # Process Directors (Crew Data)
     directors_df = crew_df.dropna(subset=['directors']).copy()
     directors_df['nconst'] = directors_df['directors'].apply(lambda x: x.split(',')[0].strip())
@@ -81,14 +113,14 @@ def load_and_clean_data():
     director_names_df = names_df[['nconst', 'primaryName']].rename(columns={'primaryName': 'director', 'nconst': 'director_nconst'})
     directors_df = directors_df.rename(columns={'nconst': 'director_nconst'})
     directors_df = pd.merge(directors_df, director_names_df, on='director_nconst', how='left')
-    directors_df = directors_df[['tconst', 'director']].drop_duplicates(subset=['tconst'], keep='first')
-
-    movies_df = pd.merge(movies_df, directors_df, on='tconst', how='left')
-    movies_df['director'] = movies_df['director'].fillna(np.nan).replace([np.nan], [None])
-    print(f"Added director data for {len(movies_df.dropna(subset=['director']))} movies.")
+    return directors_df[['tconst', 'director']].drop_duplicates(subset=['tconst'], keep='first')
 
+"""
+Groups actor/actress names per title, in principals order.
+"""
+def build_actor_lists(principals_df, names_df):
     # Keep only Actors/Actresses
-    principals_df = principals_df[principals_df['category'].isin(['actor', 'actress'])]
+    principals_df = principals_df[principals_df['category'].isin(ACTOR_CATEGORIES)]
     principals_df = principals_df[['tconst', 'nconst']]
 
     # Load Name Basics (Maps nconst to actor name)
@@ -101,6 +133,15 @@ def load_and_clean_data():
     # Group the actor names by movie ID (tconst) into a list
     actors_grouped = actors_df.groupby('tconst')['name'].apply(list).reset_index(name='actors')
     print(f"Extracted actors for {len(actors_grouped)} movies.")
+    return actors_grouped
+
+"""
+Adds directors and actor lists to the selected movies and returns the final records.
+"""
+def assemble_records(movies_df, directors_df, actors_grouped):
+    movies_df = pd.merge(movies_df, directors_df, on='tconst', how='left')
+    movies_df['director'] = movies_df['director'].fillna(np.nan).replace([np.nan], [None])
+    print(f"Added director data for {len(movies_df.dropna(subset=['director']))} movies.")
 
     # Final Join: Add Actor Lists to the Main Movie DataFrame
     movies_df = pd.merge(movies_df, actors_grouped, on='tconst', how='left')
@@ -115,13 +156,520 @@ def load_and_clean_data():
     final_movies_list = movies_df.drop(columns=['tconst']).to_dict('records')
 
     print(f"Final dataset size: {len(final_movies_list)} records.")
+    return final_movies_list
 
-    # Save the JSON
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(final_movies_list, f, indent=2)
+"""
+Writes the JSON database (people format: names stored once in a people
+table, movies referencing them by id) and the binary snapshot.
+"""
+def save_outputs(final_movies_list, title_ids):
+    people, movies = encode_records(final_movies_list)
+    write_people_db(OUTPUT_FILE, people, movie_lines(movies))
 
     print(f"\nSuccessfully created in-memory JSON file: {OUTPUT_FILE}")
-    print("This file will be loaded into memory by the LLM interface.")
+    save_snapshot(final_movies_list, title_ids)
+
+"""
+Writes the binary snapshot (memory-mapped by the engine; the JSON stays as a
+fallback) and the tconst of each row, which deltas use to address records.
+"""
+def save_snapshot(final_movies_list, title_ids):
+    with open(IDS_FILE + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(title_ids, f)
+    os.replace(IDS_FILE + '.tmp', IDS_FILE)
+
+    snapshot_id = write_snapshot(final_movies_list, SNAPSHOT_FILE)
+    print(f"Successfully created binary snapshot: {SNAPSHOT_FILE} (snapshot {snapshot_id})")
+    print("These files will be loaded by the LLM interface.")
+
+"""
+Loads, cleans, joins, and subsets the raw IMDb data files.
+"""
+def load_and_clean_data():
+    print("Starting data processing...")
+
+    os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
+
+    # Load Core Data
+    basics_df = load_tsv(os.path.join(RAW_DATA_PATH, 'title.basics.tsv'))
+    ratings_df = load_tsv(os.path.join(RAW_DATA_PATH, 'title.ratings.tsv'))
+    crew_df = load_tsv(os.path.join(RAW_DATA_PATH, 'title.crew.tsv'))
+    principals_df = load_tsv(os.path.join(RAW_DATA_PATH, 'title.principals.tsv'))
+    names_df = load_tsv(os.path.join(RAW_DATA_PATH, 'name.basics.tsv'))
+
+    if basics_df.empty or ratings_df.empty or crew_df.empty or names_df.empty:
+        print("Aborting data processing due to missing files.")
+        return
+
+    movies_df = select_movies(clean_basics(basics_df), clean_ratings(ratings_df))
+    directors_df = build_directors(crew_df, names_df)
+    actors_grouped = build_actor_lists(principals_df, names_df)
+
+    save_outputs(assemble_records(movies_df, directors_df, actors_grouped), movies_df['tconst'].tolist())
+
+"""
+Columns and explicit dtypes read from each TSV in streaming and parallel modes.
+"""
+TSV_COLUMNS = {
+    'title.basics.tsv': {'tconst': str, 'titleType': 'category', 'primaryTitle': str, 'startYear': str, 'genres': str},
+    'title.ratings.tsv': {'tconst': str, 'averageRating': 'float64', 'numVotes': 'int64'},
+    'title.crew.tsv': {'tconst': str, 'directors': str},
+    'title.principals.tsv': {'tconst': str, 'nconst': str, 'category': 'category'},
+    'name.basics.tsv': {'nconst': str, 'primaryName': str},
+}
+
+# Row filters applied to every chunk as it is read. They are module-level
+# functions (bound with functools.partial) so they can be sent to worker processes.
+def keep_movie_types(chunk):
+    return chunk[chunk['titleType'].isin(TARGET_MOVIE_TYPES)]
+
+def keep_voted(chunk):
+    return chunk[chunk['numVotes'] >= MIN_RATING_VOTES]
+
+def keep_titles(chunk, tconsts):
+    return chunk[chunk['tconst'].isin(tconsts)]
+
+def keep_actor_credits(chunk, tconsts):
+    return chunk[chunk['category'].isin(ACTOR_CATEGORIES) & chunk['tconst'].isin(tconsts)]
+
+def keep_people(chunk, nconsts):
+    return chunk[chunk['nconst'].isin(nconsts)]
+
+"""
+Number of TSV rows per chunk that keeps one parsed chunk within the memory budget.
+"""
+def chunk_rows_for_budget(filename, memory_budget_mb):
+    bytes_per_row = BYTES_PER_ROW_ESTIMATE.get(filename, 300)
+    return max(1000, int(memory_budget_mb * 1024 * 1024 // bytes_per_row))
+
+"""
+Streams a TSV in chunks, reading only its TSV_COLUMNS with explicit dtypes,
+and yields each chunk after `keep` (a DataFrame -> DataFrame filter) is applied.
+"""
+def stream_tsv(filename, memory_budget_mb, keep=None):
+    path = os.path.join(RAW_DATA_PATH, filename)
+    dtype = TSV_COLUMNS[filename]
+    chunksize = chunk_rows_for_budget(filename, memory_budget_mb)
+    total = kept = 0
+    try:
+        reader = pd.read_csv(path, sep='\t', usecols=list(dtype), dtype=dtype, na_values=['\\N'],
+                             chunksize=chunksize)
+        for chunk in reader:
+            total += len(chunk)
+            if keep is not None:
+                chunk = keep(chunk)
+            kept += len(chunk)
+            yield chunk
+    except FileNotFoundError:
+        print(f"ERROR: Required file not found at {path}. Please check your raw data directory.")
+        raise
+    print(f"Streamed {filename}: kept {kept} of {total} records ({chunksize} rows per chunk).")
+
+"""
+Concatenates filtered chunks into one frame, keeping file order.
+"""
+def collect(chunks, filename):
+    frames = list(chunks)
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=list(TSV_COLUMNS[filename]))
+
+"""
+Reads the five TSVs through `read_filtered(filename, keep)`, filtering as
+they are read: principals and crew against the surviving tconst set, names
+against the nconsts actually referenced. Returns the selected movies and the
+filtered crew, principals and names frames.
+"""
+def read_filtered_inputs(read_filtered):
+    basics_df = read_filtered('title.basics.tsv', keep_movie_types)
+    ratings_df = read_filtered('title.ratings.tsv', keep_voted)
+
+    movies_df = select_movies(clean_basics(basics_df), clean_ratings(ratings_df))
+    del basics_df, ratings_df
+    movie_ids = set(movies_df['tconst'])
+
+    crew_df = read_filtered('title.crew.tsv', functools.partial(keep_titles, tconsts=movie_ids))
+
+    # Actor credits for the surviving movies, accumulated chunk by chunk in file order
+    principals_df = read_filtered('title.principals.tsv', functools.partial(keep_actor_credits, tconsts=movie_ids))
+
+    director_ids = crew_df['directors'].dropna().str.split(',').str[0].str.strip()
+    person_ids = set(principals_df['nconst']) | set(director_ids)
+    names_df = read_filtered('name.basics.tsv', functools.partial(keep_people, nconsts=person_ids))
+
+    return movies_df, crew_df, principals_df, names_df
+
+"""
+Streaming variant of load_and_clean_data for the full IMDb dumps.
+TSVs are read in chunks sized from `memory_budget_mb` and filtered as they
+are read, so the large files are never held in memory whole. The joins then
+run on the filtered frames with the same code as the in-memory path, so the
+output is identical.
+"""
+def load_and_clean_data_streaming(memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB):
+    print(f"Starting streaming data processing (memory budget {memory_budget_mb} MB per chunk)...")
+
+    os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
+
+    try:
+        movies_df, crew_df, principals_df, names_df = read_filtered_inputs(
+            lambda filename, keep: collect(stream_tsv(filename, memory_budget_mb, keep), filename))
+    except FileNotFoundError:
+        print("Aborting data processing due to missing files.")
+        return
+
+    directors_df = build_directors(crew_df, names_df)
+    actors_grouped = build_actor_lists(principals_df, names_df)
+
+    save_outputs(assemble_records(movies_df, directors_df, actors_grouped), movies_df['tconst'].tolist())
+
+"""
+Splits a TSV (after its header line) into line-aligned byte ranges of at
+most `max_range_bytes`, and at least `min_ranges` of them. Returns the header
+columns and the (start, end) offsets. IMDb TSVs have no quoted multi-line
+fields, so a newline is always a record boundary.
+"""
+def split_tsv_ranges(path, max_range_bytes, min_ranges):
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        columns = f.readline().decode('utf-8').rstrip('\r\n').split('\t')
+        start = f.tell()
+        count = max(min_ranges, -(-(size - start) // max_range_bytes), 1)
+        bounds = [start]
+        for i in range(1, count):
+            f.seek(start + (size - start) * i // count)
+            f.readline()
+            bounds.append(max(f.tell(), bounds[-1]))
+        bounds.append(size)
+    return columns, [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+"""
+Worker task: parses one byte range of a TSV and applies its row filter.
+"""
+def parse_tsv_range(path, start, end, columns, filename, keep=None):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    dtype = TSV_COLUMNS[filename]
+    chunk = pd.read_csv(io.BytesIO(data), sep='\t', header=None, names=columns, usecols=list(dtype),
+                        dtype=dtype, na_values=['\\N'])
+    return keep(chunk) if keep is not None else chunk
+
+"""
+Parses a TSV on the process pool, one line-aligned byte range per task,
+and concatenates the filtered ranges back in file order.
+"""
+def parallel_tsv(executor, filename, workers, memory_budget_mb, keep=None):
+    path = os.path.join(RAW_DATA_PATH, filename)
+    if not os.path.exists(path):
+        print(f"ERROR: Required file not found at {path}. Please check your raw data directory.")
+        raise FileNotFoundError(path)
+
+    # Raw bytes expand roughly 3x once parsed into a DataFrame.
+    max_range_bytes = max(1, int(memory_budget_mb * 1024 * 1024 // 3))
+    columns, ranges = split_tsv_ranges(path, max_range_bytes, workers)
+    futures = [executor.submit(parse_tsv_range, path, start, end, columns, filename, keep) for start, end in ranges]
+    frames = [future.result() for future in futures]
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=list(TSV_COLUMNS[filename]))
+    print(f"Parsed {filename} in {len(ranges)} ranges: kept {len(df)} records.")
+    return df
+
+"""
+Worker task: actor lists for one tconst-hash partition of the credits.
+"""
+def group_actor_partition(principals_df, names_df):
+    names_df = names_df[names_df['nconst'].isin(set(principals_df['nconst']))]
+    actors_df = pd.merge(principals_df[['tconst', 'nconst']], names_df.rename(columns={'primaryName': 'name'}),
+                         on='nconst', how='inner')
+    return actors_df.groupby('tconst')['name'].apply(list).reset_index(name='actors')
+
+"""
+Joins credits with names and groups actor lists on the process pool,
+partitioned by a stable hash of tconst. Every credit of a title lands in the
+same partition in file order, so each list matches the serial groupby; the
+partial results are merged back sorted by tconst, like groupby's output.
+"""
+def parallel_actor_lists(executor, principals_df, names_df, workers):
+    principals_df = principals_df[principals_df['category'].isin(ACTOR_CATEGORIES)]
+    partition = pd.util.hash_pandas_object(principals_df['tconst'], index=False).to_numpy() % workers
+    futures = [executor.submit(group_actor_partition, principals_df[partition == p], names_df)
+               for p in range(workers)]
+    parts = [future.result() for future in futures]
+    actors_grouped = pd.concat(parts, ignore_index=True).sort_values('tconst', kind='stable').reset_index(drop=True)
+    print(f"Extracted actors for {len(actors_grouped)} movies.")
+    return actors_grouped
+
+"""
+Writes the JSON database with the movies serialized on the process pool in
+contiguous slices, producing the same bytes as save_outputs.
+"""
+def write_json_parallel(executor, final_movies_list, workers):
+    people, movies = encode_records(final_movies_list)
+    step = max(-(-len(movies) // (workers * 4)), 1)
+    slices = [movies[i:i + step] for i in range(0, len(movies), step)]
+    lines = [line for chunk in executor.map(movie_lines, slices) for line in chunk]
+    write_people_db(OUTPUT_FILE, people, lines)
+
+"""
+Multi-process variant of the streaming pipeline. TSV parsing runs as one
+task per line-aligned byte range, the principals x names join and actor
+grouping run per tconst-hash partition, and record serialization runs per
+slice. Partial results are merged in a fixed order, so the output is
+byte-identical to the serial run.
+"""
+def load_and_clean_data_parallel(workers, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB):
+    print(f"Starting parallel data processing with {workers} workers...")
+
+    os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        try:
+            movies_df, crew_df, principals_df, names_df = read_filtered_inputs(
+                lambda filename, keep: parallel_tsv(executor, filename, workers, memory_budget_mb, keep))
+        except FileNotFoundError:
+            print("Aborting data processing due to missing files.")
+            return
+
+        directors_df = build_directors(crew_df, names_df)
+        actors_grouped = parallel_actor_lists(executor, principals_df, names_df, workers)
+        final_movies_list = assemble_records(movies_df, directors_df, actors_grouped)
+
+        write_json_parallel(executor, final_movies_list, workers)
+        print(f"\nSuccessfully created in-memory JSON file: {OUTPUT_FILE}")
+
+    save_snapshot(final_movies_list, movies_df['tconst'].tolist())
+
+"""
+Content fingerprints of the raw inputs. A file is re-hashed only when its
+size or mtime differs from the previously recorded fingerprint.
+"""
+def fingerprint_inputs(filenames, known):
+    fingerprints = {}
+    for filename in filenames:
+        path = os.path.join(RAW_DATA_PATH, filename)
+        stat = os.stat(path)
+        previous = known.get(filename)
+        if previous and previous['size'] == stat.st_size and previous['mtime_ns'] == stat.st_mtime_ns:
+            fingerprints[filename] = previous
+            continue
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        fingerprints[filename] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+    return fingerprints
+
+"""
+On-disk cache of intermediate frames, keyed by the fingerprints of the raw
+files each stage reads. Frames are stored as Parquet when pyarrow is
+installed, otherwise as pickles.
+"""
+class ArtifactCache:
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.manifest_path = os.path.join(cache_dir, 'manifest.json')
+        os.makedirs(cache_dir, exist_ok=True)
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.manifest = {'files': {}, 'stages': {}}
+        self.fingerprints = {}
+
+    def stage_key(self, stage, inputs):
+        config = {'stage': stage, 'version': CACHE_VERSION, 'types': TARGET_MOVIE_TYPES,
+                  'min_votes': MIN_RATING_VOTES, 'inputs': [self.fingerprints[i]['sha256'] for i in inputs]}
+        return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+    def _path(self, stage, key):
+        extension = 'parquet' if PARQUET_AVAILABLE else 'pkl'
+        return os.path.join(self.cache_dir, f'{stage}-{key}.{extension}')
+
+    def is_fresh(self, stage, inputs):
+        return os.path.exists(self._path(stage, self.stage_key(stage, inputs)))
+
+    def load(self, stage, inputs):
+        path = self._path(stage, self.stage_key(stage, inputs))
+        return pd.read_parquet(path) if PARQUET_AVAILABLE else pd.read_pickle(path)
+
+    def store(self, stage, inputs, df):
+        key = self.stage_key(stage, inputs)
+        previous = self.manifest['stages'].get(stage)
+        if PARQUET_AVAILABLE:
+            df.to_parquet(self._path(stage, key), index=False)
+        else:
+            df.to_pickle(self._path(stage, key))
+        if previous and previous != key and os.path.exists(self._path(stage, previous)):
+            os.remove(self._path(stage, previous))
+        self.manifest['stages'][stage] = key
+
+    """
+    Returns the stage's frame from the cache, or computes and caches it.
+    """
+    def stage(self, stage, inputs, compute):
+        if self.is_fresh(stage, inputs):
+            print(f"Stage '{stage}' is up to date; loaded from cache.")
+            return self.load(stage, inputs)
+        print(f"Stage '{stage}' inputs changed; recomputing.")
+        df = compute()
+        self.store(stage, inputs, df)
+        return df
+
+    def save_manifest(self):
+        self.manifest['files'] = self.fingerprints
+        with open(self.manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=2)
+
+"""
+Loads the previously built database keyed by tconst, or {} if there is none.
+"""
+def load_previous_build():
+    try:
+        records = load_records(OUTPUT_FILE)
+        with open(IDS_FILE, 'r', encoding='utf-8') as f:
+            title_ids = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    return dict(zip(title_ids, records)) if len(title_ids) == len(records) else {}
+
+"""
+Reads a built JSON database back as a list of records with names, in either
+the people format or the older plain-list format.
+"""
+def load_records(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return list(InternedRows.from_json(data)) if is_people_db(data) else data
+
+"""
+Differences between two builds keyed by tconst: added, removed and changed records.
+"""
+def compute_delta(previous, title_ids, final_movies_list):
+    current = dict(zip(title_ids, final_movies_list))
+    return {
+        'added': {t: r for t, r in current.items() if t not in previous},
+        'removed': [t for t in previous if t not in current],
+        # Round-trip through JSON so NaN/None and list types compare like the stored file.
+        'changed': {t: r for t, r in current.items()
+                    if t in previous and json.loads(json.dumps(r)) != previous[t]},
+    }
+
+"""
+Applies a delta to an already-built database (records plus their tconsts).
+Changed records are replaced in place, added records appended, and rows are
+re-ordered by rating (descending, stable), so records with equal ratings may
+be ordered differently than in a full rebuild.
+"""
+def apply_delta(final_movies_list, title_ids, delta):
+    removed = set(delta['removed'])
+    rows = [(t, delta['changed'].get(t, r)) for t, r in zip(title_ids, final_movies_list) if t not in removed]
+    rows += list(delta['added'].items())
+    rows.sort(key=lambda row: row[1].get('rating', 0.0), reverse=True)
+    return [r for _, r in rows], [t for t, _ in rows]
+
+"""
+Applies a delta file to the database in data/processed and rewrites the outputs.
+"""
+def apply_delta_file(delta_path):
+    with open(delta_path, 'r', encoding='utf-8') as f:
+        delta = json.load(f)
+    final_movies_list = load_records(OUTPUT_FILE)
+    with open(IDS_FILE, 'r', encoding='utf-8') as f:
+        title_ids = json.load(f)
+
+    final_movies_list, title_ids = apply_delta(final_movies_list, title_ids, delta)
+    print(f"Applied delta: {len(delta['added'])} added, {len(delta['removed'])} removed, "
+          f"{len(delta['changed'])} changed.")
+    save_outputs(final_movies_list, title_ids)
+
+"""
+Incremental variant of the streaming pipeline. Each raw file is
+fingerprinted and the intermediate frames (filtered basics, filtered
+ratings, director map, grouped actors) are cached; only the stages whose
+inputs changed are recomputed. A delta against the previous build is
+written to DELTA_FILE.
+"""
+def load_and_clean_data_incremental(cache_dir=CACHE_DIR, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB):
+    print(f"Starting incremental data processing (cache: {cache_dir})...")
+
+    os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
+    cache = ArtifactCache(cache_dir)
+
+    def read(filename, keep):
+        return collect(stream_tsv(filename, memory_budget_mb, keep), filename)
+
+    try:
+        cache.fingerprints = fingerprint_inputs(list(TSV_COLUMNS), cache.manifest['files'])
+
+        basics_df = cache.stage('basics', ['title.basics.tsv'],
+                                lambda: clean_basics(read('title.basics.tsv', keep_movie_types)))
+        ratings_df = cache.stage('ratings', ['title.ratings.tsv'],
+                                 lambda: clean_ratings(read('title.ratings.tsv', keep_voted)))
+
+        # People stages cover every candidate movie title, not only the current top
+        # MAX_MOVIES, so a ratings-only refresh never needs to recompute them.
+        title_ids = set(basics_df['tconst'])
+        directors_inputs = ['title.basics.tsv', 'title.crew.tsv', 'name.basics.tsv']
+        actors_inputs = ['title.basics.tsv', 'title.principals.tsv', 'name.basics.tsv']
+
+        crew_df = principals_df = None
+        if not cache.is_fresh('directors', directors_inputs):
+            crew_df = read('title.crew.tsv', functools.partial(keep_titles, tconsts=title_ids))
+        if not cache.is_fresh('actors', actors_inputs):
+            principals_df = read('title.principals.tsv', functools.partial(keep_actor_credits, tconsts=title_ids))
+
+        names_df = None
+        if crew_df is not None or principals_df is not None:
+            # One pass over name.basics for whichever people stages are stale.
+            person_ids = set()
+            if crew_df is not None:
+                person_ids |= set(crew_df['directors'].dropna().str.split(',').str[0].str.strip())
+            if principals_df is not None:
+                person_ids |= set(principals_df['nconst'])
+            names_df = read('name.basics.tsv', functools.partial(keep_people, nconsts=person_ids))
+    except FileNotFoundError:
+        print("Aborting data processing due to missing files.")
+        return
+
+    directors_df = cache.stage('directors', directors_inputs, lambda: build_directors(crew_df, names_df))
+    actors_grouped = cache.stage('actors', actors_inputs, lambda: build_actor_lists(principals_df, names_df))
+    # Parquet returns list columns as arrays.
+    actors_grouped['actors'] = actors_grouped['actors'].apply(list)
+    cache.save_manifest()
+
+    movies_df = select_movies(basics_df, ratings_df)
+    final_movies_list = assemble_records(movies_df, directors_df, actors_grouped)
+    final_title_ids = movies_df['tconst'].tolist()
+
+    delta = compute_delta(load_previous_build(), final_title_ids, final_movies_list)
+    with open(DELTA_FILE, 'w', encoding='utf-8') as f:
+        json.dump(delta, f)
+    print(f"Delta written to {DELTA_FILE}: {len(delta['added'])} added, {len(delta['removed'])} removed, "
+          f"{len(delta['changed'])} changed.")
+
+    save_outputs(final_movies_list, final_title_ids)
 
 if __name__ == '__main__':
-    load_and_clean_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Builds the CineQuery movie database from the raw IMDb TSV files.")
+    parser.add_argument('--streaming', action='store_true',
+                        help="Read the TSVs in bounded-memory chunks (recommended for the full IMDb dumps).")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of worker processes; above 1 runs the parallel pipeline.")
+    parser.add_argument('--memory-budget-mb', type=float, default=DEFAULT_MEMORY_BUDGET_MB,
+                        help="Approximate memory per parsed chunk in streaming and parallel modes.")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Reuse cached intermediate frames for inputs that have not changed and write a delta.")
+    parser.add_argument('--cache-dir', default=CACHE_DIR,
+                        help="Directory for cached intermediate frames in incremental mode.")
+    parser.add_argument('--apply-delta', metavar='DELTA_FILE',
+                        help="Apply a delta file to the already-built database instead of rebuilding.")
+    args = parser.parse_args()
+
+    if args.apply_delta:
+        apply_delta_file(args.apply_delta)
+    elif args.incremental:
+        load_and_clean_data_incremental(args.cache_dir, args.memory_budget_mb)
+    elif args.workers > 1:
+        load_and_clean_data_parallel(args.workers, args.memory_budget_mb)
+    elif args.streaming:
+        load_and_clean_data_streaming(args.memory_budget_mb)
+    else:
+        load_and_clean_data()
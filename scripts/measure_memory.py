@@ -0,0 +1,108 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# Queries sent as traffic between the two measurements; the fast-path parser answers them without an LLM translation.
+TRAFFIC_QUERIES = [
+    "Tom Hanks movies rated above 8",
+    "movies directed by Kubrick after 1970",
+    "best horror movies from the 1980s",
+    "comedy movies with Jim Carrey",
+    "top rated dramas of 1994",
+    "sci-fi movies after 2010",
+]
+SMAPS_FIELDS = ["Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty"]
+
+"""
+Reads /proc/<pid>/smaps_rollup and returns its memory fields in MB.
+"""
+def read_smaps_rollup(pid: int):
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in SMAPS_FIELDS:
+                values[key] = int(rest.split()[0]) / 1024
+    return {"pid": pid, "rss_mb": values["Rss"], "pss_mb": values["Pss"],
+            "shared_mb": values["Shared_Clean"] + values["Shared_Dirty"],
+            "private_mb": values["Private_Clean"] + values["Private_Dirty"]}
+
+def child_pids(pid: int):
+    children = []
+    for tid in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{tid}/children") as f:
+            children.extend(int(child) for child in f.read().split())
+    return sorted(children)
+
+"""
+Measures the gunicorn master and each worker. PSS splits every shared page
+between the processes sharing it, so the total PSS is the real memory cost
+of the deployment; the workers' private MB is what each one added on its own.
+"""
+def measure(master_pid: int):
+    master = read_smaps_rollup(master_pid)
+    workers = [read_smaps_rollup(pid) for pid in child_pids(master_pid)]
+    processes = [master] + workers
+    return {"master": master, "workers": workers,
+            "total_rss_mb": sum(p["rss_mb"] for p in processes),
+            "total_pss_mb": sum(p["pss_mb"] for p in processes),
+            "worker_private_mb_max": max((w["private_mb"] for w in workers), default=0.0)}
+
+def send_traffic(url: str, count: int, concurrency: int):
+    def send(i):
+        try:
+            requests.post(f"{url}/query", json={"query": TRAFFIC_QUERIES[i % len(TRAFFIC_QUERIES)]}, timeout=60)
+        except requests.RequestException as e:
+            print(f"Request failed: {e}")
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, range(count)))
+
+def print_measurement(label: str, result):
+    print(f"\n{label}")
+    print(f"{'process':<10}{'pid':>8}{'rss MB':>10}{'pss MB':>10}{'shared MB':>11}{'private MB':>12}")
+    rows = [("master", result["master"])] + [(f"worker {i}", w) for i, w in enumerate(result["workers"], 1)]
+    for name, p in rows:
+        print(f"{name:<10}{p['pid']:>8}{p['rss_mb']:>10.1f}{p['pss_mb']:>10.1f}{p['shared_mb']:>11.1f}"
+              f"{p['private_mb']:>12.1f}")
+    print(f"total RSS {result['total_rss_mb']:.1f} MB, total PSS {result['total_pss_mb']:.1f} MB, "
+          f"largest worker private {result['worker_private_mb_max']:.1f} MB")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Reports per-process memory (from /proc/<pid>/smaps_rollup) of a running gunicorn server, "
+                    "before and after a burst of queries.")
+    parser.add_argument('--pid', type=int, help="PID of the gunicorn master.")
+    parser.add_argument('--pidfile', help="File holding the PID of the gunicorn master (gunicorn --pid).")
+    parser.add_argument('--url', default="http://127.0.0.1:5001", help="Base URL of the server, for --requests.")
+    parser.add_argument('--requests', type=int, default=0,
+                        help="Queries to send between the two measurements; 0 measures once.")
+    parser.add_argument('--concurrency', type=int, default=16, help="Queries in flight at a time.")
+    parser.add_argument('--json', action='store_true', help="Print the measurements as JSON.")
+    args = parser.parse_args()
+
+    if args.pid is None and args.pidfile is None:
+        parser.error("one of --pid or --pidfile is required")
+    master_pid = args.pid
+    if master_pid is None:
+        with open(args.pidfile) as f:
+            master_pid = int(f.read().strip())
+
+    results = {"before": measure(master_pid)}
+    if args.requests:
+        started = time.perf_counter()
+        send_traffic(args.url, args.requests, args.concurrency)
+        results["traffic_seconds"] = time.perf_counter() - started
+        results["after"] = measure(master_pid)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        if args.requests:
+            print(f"Sent {args.requests} queries in {results.pop('traffic_seconds'):.1f}s.")
+        for label, result in results.items():
+            print_measurement(f"Memory {label} traffic:" if args.requests else "Memory:", result)